@@ -0,0 +1,42 @@
+"""add webhook inbox
+
+Revision ID: a1f4c2d9e801
+Revises: 63d580213e52
+Create Date: 2026-10-18 09:12:30.114522
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'a1f4c2d9e801'
+down_revision: Union[str, None] = '63d580213e52'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('webhook_inbox',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('action', sa.String(length=30), nullable=False),
+    sa.Column('acuity_id', sa.String(length=30), nullable=False),
+    sa.Column('status', sa.Enum('pending', 'processing', 'done', 'failed', name='inboxstatus'), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('received_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('available_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('claimed_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('processed_at', sa.DateTime(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_webhook_inbox_status'), 'webhook_inbox', ['status'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_webhook_inbox_status'), table_name='webhook_inbox')
+    op.drop_table('webhook_inbox')
+    sa.Enum(name='inboxstatus').drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,43 @@
+"""add appointment revisions and tombstones
+
+Revision ID: a9e1c3d5f768
+Revises: f8d0b2c4e657
+Create Date: 2026-10-18 23:12:08.746213
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'a9e1c3d5f768'
+down_revision: Union[str, None] = 'f8d0b2c4e657'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('appointments', sa.Column('revision', sa.BigInteger(), server_default=sa.text('pg_current_xact_id()::text::bigint'), nullable=False))
+    op.create_index(op.f('ix_appointments_revision'), 'appointments', ['revision'], unique=False)
+    op.add_column('schedule_revisions', sa.Column('sync_floor', sa.BigInteger(), nullable=True))
+    op.create_table('appointment_tombstones',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('appointment_id', sa.Uuid(), nullable=False),
+    sa.Column('acuity_id', sa.Integer(), nullable=False),
+    sa.Column('start_time', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('revision', sa.BigInteger(), server_default=sa.text('pg_current_xact_id()::text::bigint'), nullable=False),
+    sa.Column('deleted_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_appointment_tombstones_revision'), 'appointment_tombstones', ['revision'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_appointment_tombstones_revision'), table_name='appointment_tombstones')
+    op.drop_table('appointment_tombstones')
+    op.drop_column('schedule_revisions', 'sync_floor')
+    op.drop_index(op.f('ix_appointments_revision'), table_name='appointments')
+    op.drop_column('appointments', 'revision')
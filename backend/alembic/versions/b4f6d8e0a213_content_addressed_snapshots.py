@@ -0,0 +1,110 @@
+"""content addressed snapshots
+
+Revision ID: b4f6d8e0a213
+Revises: a3e5c7d9f102
+Create Date: 2026-10-18 18:54:03.581164
+
+"""
+import hashlib
+import json
+import zlib
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'b4f6d8e0a213'
+down_revision: Union[str, None] = 'a3e5c7d9f102'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _pack(value):
+    raw = json.dumps(value, sort_keys=True, separators=(",", ":")).encode()
+    return hashlib.sha256(raw).hexdigest(), zlib.compress(raw), len(raw)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('snapshot_blobs',
+    sa.Column('hash', sa.String(length=64), nullable=False),
+    sa.Column('data', sa.LargeBinary(), nullable=False),
+    sa.Column('size', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('hash')
+    )
+    op.add_column('snapshots', sa.Column('manifest', sa.String(length=64), nullable=True))
+    op.add_column('snapshots', sa.Column('count', sa.Integer(), nullable=True))
+    op.add_column('snapshots', sa.Column('repeat_count', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('snapshots', sa.Column('last_taken_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False))
+
+    # Move every dump into blobs, folding runs of identical snapshots into
+    # their first one
+    conn = op.get_bind()
+    insert_blob = sa.text(
+        "INSERT INTO snapshot_blobs (hash, data, size) VALUES (:hash, :data, :size) "
+        "ON CONFLICT (hash) DO NOTHING"
+    )
+    previous = None
+    for row in conn.execute(sa.text('SELECT id, timestamp, dump FROM snapshots ORDER BY timestamp, id')):
+        dump = row.dump if not isinstance(row.dump, str) else json.loads(row.dump)
+        hashes = []
+        for appt in dump:
+            digest, data, size = _pack(appt)
+            conn.execute(insert_blob, {"hash": digest, "data": data, "size": size})
+            hashes.append(digest)
+        manifest, data, size = _pack(hashes)
+        conn.execute(insert_blob, {"hash": manifest, "data": data, "size": size})
+
+        if previous is not None and previous[1] == manifest:
+            conn.execute(
+                sa.text(
+                    "UPDATE snapshots SET repeat_count = repeat_count + 1, "
+                    "last_taken_at = :taken_at AT TIME ZONE 'UTC' WHERE id = :id"
+                ),
+                {"id": previous[0], "taken_at": row.timestamp},
+            )
+            conn.execute(sa.text("DELETE FROM snapshots WHERE id = :id"), {"id": row.id})
+        else:
+            conn.execute(
+                sa.text(
+                    "UPDATE snapshots SET manifest = :manifest, count = :count, "
+                    "last_taken_at = timestamp AT TIME ZONE 'UTC' WHERE id = :id"
+                ),
+                {"id": row.id, "manifest": manifest, "count": len(dump)},
+            )
+            previous = (row.id, manifest)
+
+    op.alter_column('snapshots', 'manifest', nullable=False)
+    op.alter_column('snapshots', 'count', nullable=False)
+    op.create_foreign_key('snapshots_manifest_fkey', 'snapshots', 'snapshot_blobs', ['manifest'], ['hash'])
+    op.drop_column('snapshots', 'dump')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.add_column('snapshots', sa.Column('dump', sa.JSON(), nullable=True))
+    conn = op.get_bind()
+
+    def load(digest):
+        data = conn.execute(
+            sa.text('SELECT data FROM snapshot_blobs WHERE hash = :hash'), {"hash": digest}
+        ).scalar_one()
+        return json.loads(zlib.decompress(data))
+
+    # Repeats were folded together, so only their first snapshot comes back
+    for row in conn.execute(sa.text('SELECT id, manifest FROM snapshots')).all():
+        dump = [load(digest) for digest in load(row.manifest)]
+        conn.execute(
+            sa.text('UPDATE snapshots SET dump = :dump WHERE id = :id'),
+            {"id": row.id, "dump": json.dumps(dump)},
+        )
+    op.alter_column('snapshots', 'dump', nullable=False)
+
+    op.drop_constraint('snapshots_manifest_fkey', 'snapshots', type_='foreignkey')
+    op.drop_column('snapshots', 'last_taken_at')
+    op.drop_column('snapshots', 'repeat_count')
+    op.drop_column('snapshots', 'count')
+    op.drop_column('snapshots', 'manifest')
+    op.drop_table('snapshot_blobs')
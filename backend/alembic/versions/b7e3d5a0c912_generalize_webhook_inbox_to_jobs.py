@@ -0,0 +1,57 @@
+"""generalize webhook inbox to jobs
+
+Revision ID: b7e3d5a0c912
+Revises: a1f4c2d9e801
+Create Date: 2026-10-18 11:40:02.531870
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e3d5a0c912'
+down_revision: Union[str, None] = 'a1f4c2d9e801'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.rename_table('webhook_inbox', 'jobs')
+    op.execute("ALTER INDEX ix_webhook_inbox_status RENAME TO ix_jobs_status")
+    op.execute("ALTER TYPE inboxstatus RENAME TO jobstatus")
+    op.execute("ALTER TYPE jobstatus RENAME VALUE 'failed' TO 'dead'")
+
+    op.add_column('jobs', sa.Column('kind', sa.String(length=30), server_default='webhook', nullable=False))
+    op.alter_column('jobs', 'kind', server_default=None)
+    op.add_column('jobs', sa.Column('payload', postgresql.JSON(), nullable=True))
+    op.execute("UPDATE jobs SET payload = json_build_object('action', action, 'id', acuity_id)")
+    op.alter_column('jobs', 'payload', nullable=False)
+    op.add_column('jobs', sa.Column('result', postgresql.JSON(), nullable=True))
+    op.add_column('jobs', sa.Column('locked_by', sa.String(length=100), nullable=True))
+    op.drop_column('jobs', 'action')
+    op.drop_column('jobs', 'acuity_id')
+    op.create_index(op.f('ix_jobs_kind'), 'jobs', ['kind'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_jobs_kind'), table_name='jobs')
+    op.execute("DELETE FROM jobs WHERE kind != 'webhook'")
+    op.add_column('jobs', sa.Column('action', sa.String(length=30), nullable=True))
+    op.add_column('jobs', sa.Column('acuity_id', sa.String(length=30), nullable=True))
+    op.execute("UPDATE jobs SET action = payload->>'action', acuity_id = payload->>'id'")
+    op.alter_column('jobs', 'action', nullable=False)
+    op.alter_column('jobs', 'acuity_id', nullable=False)
+    op.drop_column('jobs', 'locked_by')
+    op.drop_column('jobs', 'result')
+    op.drop_column('jobs', 'payload')
+    op.drop_column('jobs', 'kind')
+
+    op.execute("ALTER TYPE jobstatus RENAME VALUE 'dead' TO 'failed'")
+    op.execute("ALTER TYPE jobstatus RENAME TO inboxstatus")
+    op.execute("ALTER INDEX ix_jobs_status RENAME TO ix_webhook_inbox_status")
+    op.rename_table('jobs', 'webhook_inbox')
@@ -0,0 +1,30 @@
+"""add job lane key
+
+Revision ID: c2a8f61e4b37
+Revises: b7e3d5a0c912
+Create Date: 2026-10-18 13:05:47.208316
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'c2a8f61e4b37'
+down_revision: Union[str, None] = 'b7e3d5a0c912'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('jobs', sa.Column('key', sa.String(length=50), nullable=True))
+    op.execute("UPDATE jobs SET key = 'appointment:' || (payload->>'id') WHERE kind = 'webhook'")
+    op.create_index(op.f('ix_jobs_key'), 'jobs', ['key'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_jobs_key'), table_name='jobs')
+    op.drop_column('jobs', 'key')
@@ -0,0 +1,114 @@
+"""snapshot deltas
+
+Revision ID: c5a7e9f1b324
+Revises: b4f6d8e0a213
+Create Date: 2026-10-18 19:37:12.940518
+
+"""
+import hashlib
+import json
+import zlib
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5a7e9f1b324'
+down_revision: Union[str, None] = 'b4f6d8e0a213'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _load(conn, digest):
+    data = conn.execute(
+        sa.text('SELECT data FROM snapshot_blobs WHERE hash = :hash'), {"hash": digest}
+    ).scalar_one()
+    return json.loads(zlib.decompress(data))
+
+
+def _rewrite_manifests(conn, to_entries: bool) -> None:
+    """Switch every manifest between a list of record hashes and [acuity id, hash] entries"""
+    for row in conn.execute(sa.text('SELECT id, manifest FROM snapshots')).all():
+        manifest = _load(conn, row.manifest)
+        if to_entries:
+            manifest = [[int(_load(conn, digest)["id"]), digest] for digest in manifest]
+        else:
+            manifest = [digest for _, digest in manifest]
+        raw = json.dumps(manifest, sort_keys=True, separators=(",", ":")).encode()
+        digest = hashlib.sha256(raw).hexdigest()
+        conn.execute(
+            sa.text(
+                "INSERT INTO snapshot_blobs (hash, data, size) VALUES (:hash, :data, :size) "
+                "ON CONFLICT (hash) DO NOTHING"
+            ),
+            {"hash": digest, "data": zlib.compress(raw), "size": len(raw)},
+        )
+        conn.execute(
+            sa.text('UPDATE snapshots SET manifest = :manifest WHERE id = :id'),
+            {"id": row.id, "manifest": digest},
+        )
+        if to_entries:
+            conn.execute(
+                sa.text('UPDATE snapshots SET content_hash = :manifest WHERE id = :id'),
+                {"id": row.id, "manifest": digest},
+            )
+        conn.execute(
+            sa.text(
+                'DELETE FROM snapshot_blobs WHERE hash = :hash '
+                'AND NOT EXISTS (SELECT 1 FROM snapshots WHERE manifest = :hash)'
+            ),
+            {"hash": row.manifest},
+        )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('snapshots', sa.Column('base_id', sa.Uuid(), nullable=True))
+    op.add_column('snapshots', sa.Column('content_hash', sa.String(length=64), nullable=True))
+    op.create_foreign_key('snapshots_base_id_fkey', 'snapshots', 'snapshots', ['base_id'], ['id'])
+    op.create_index(op.f('ix_snapshots_base_id'), 'snapshots', ['base_id'], unique=False)
+
+    # Existing snapshots all become full bases
+    _rewrite_manifests(op.get_bind(), to_entries=True)
+    op.alter_column('snapshots', 'content_hash', nullable=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    conn = op.get_bind()
+    # Expand deltas into full manifests of entries first
+    for row in conn.execute(
+        sa.text(
+            'SELECT s.id, s.manifest, b.manifest AS base_manifest '
+            'FROM snapshots s JOIN snapshots b ON b.id = s.base_id'
+        )
+    ).all():
+        delta = _load(conn, row.manifest)
+        removed = set(delta["removed"])
+        changed = {acuity_id: digest for acuity_id, digest, _ in delta["changed"]}
+        entries = [
+            [acuity_id, changed.get(acuity_id, digest)]
+            for acuity_id, digest in _load(conn, row.base_manifest)
+            if acuity_id not in removed
+        ] + delta["added"]
+        raw = json.dumps(entries, sort_keys=True, separators=(",", ":")).encode()
+        digest = hashlib.sha256(raw).hexdigest()
+        conn.execute(
+            sa.text(
+                "INSERT INTO snapshot_blobs (hash, data, size) VALUES (:hash, :data, :size) "
+                "ON CONFLICT (hash) DO NOTHING"
+            ),
+            {"hash": digest, "data": zlib.compress(raw), "size": len(raw)},
+        )
+        conn.execute(
+            sa.text('UPDATE snapshots SET manifest = :manifest WHERE id = :id'),
+            {"id": row.id, "manifest": digest},
+        )
+    op.execute('UPDATE snapshots SET base_id = NULL')
+    _rewrite_manifests(conn, to_entries=False)
+
+    op.drop_index(op.f('ix_snapshots_base_id'), table_name='snapshots')
+    op.drop_constraint('snapshots_base_id_fkey', 'snapshots', type_='foreignkey')
+    op.drop_column('snapshots', 'content_hash')
+    op.drop_column('snapshots', 'base_id')
@@ -0,0 +1,37 @@
+"""add schedule checkpoints
+
+Revision ID: d6b8f0a2c435
+Revises: c5a7e9f1b324
+Create Date: 2026-10-18 20:26:47.318092
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'd6b8f0a2c435'
+down_revision: Union[str, None] = 'c5a7e9f1b324'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('schedule_checkpoints',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('as_of', sa.DateTime(), nullable=False),
+    sa.Column('state', sa.JSON(), nullable=False),
+    sa.Column('events', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_schedule_checkpoints_day_as_of', 'schedule_checkpoints', ['day', 'as_of'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_schedule_checkpoints_day_as_of', table_name='schedule_checkpoints')
+    op.drop_table('schedule_checkpoints')
@@ -0,0 +1,27 @@
+"""add job merged count
+
+Revision ID: d9b1e7f3a605
+Revises: c2a8f61e4b37
+Create Date: 2026-10-18 14:21:09.663145
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'd9b1e7f3a605'
+down_revision: Union[str, None] = 'c2a8f61e4b37'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('jobs', sa.Column('merged_count', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('jobs', 'merged_count')
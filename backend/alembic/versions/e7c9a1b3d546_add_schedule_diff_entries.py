@@ -0,0 +1,56 @@
+"""add schedule diff entries
+
+Revision ID: e7c9a1b3d546
+Revises: d6b8f0a2c435
+Create Date: 2026-10-18 21:04:12.530871
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7c9a1b3d546'
+down_revision: Union[str, None] = 'd6b8f0a2c435'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('schedule_diff_entries',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('hour', sa.String(length=5), nullable=False),
+    sa.Column('change', sa.Enum('added', 'deleted', name='diffchange'), nullable=False),
+    sa.Column('appointment_id', sa.Uuid(), nullable=False),
+    sa.Column('event_id', sa.Uuid(), nullable=False),
+    sa.Column('event_created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['appointment_id'], ['appointments.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['event_id'], ['events.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_schedule_diff_entries_day_event_created_at', 'schedule_diff_entries', ['day', 'event_created_at'], unique=False)
+
+    # Derive the entries of the events already recorded, as
+    # app.core.schedule_diff.diff_entries does; times are naive UTC
+    op.execute("""
+        INSERT INTO schedule_diff_entries (day, hour, change, appointment_id, event_id, event_created_at)
+        SELECT (t.at AT TIME ZONE 'UTC' AT TIME ZONE 'America/Denver')::date,
+               to_char(t.at AT TIME ZONE 'UTC' AT TIME ZONE 'America/Denver', 'HH24:MI'),
+               t.change::diffchange, e.appointment_id, e.id, e.created_at
+        FROM events e
+        CROSS JOIN LATERAL (VALUES
+            ('deleted', e.old_time, e.action IN ('cancel', 'reschedule_outgoing', 'reschedule_same_day')),
+            ('added', e.new_time, e.action IN ('schedule', 'reschedule_incoming', 'reschedule_same_day'))
+        ) AS t(change, at, applies)
+        WHERE t.applies AND t.at IS NOT NULL
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_schedule_diff_entries_day_event_created_at', table_name='schedule_diff_entries')
+    op.drop_table('schedule_diff_entries')
+    sa.Enum(name='diffchange').drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,51 @@
+"""unique appointment acuity id
+
+Revision ID: f1d3b5c7e920
+Revises: d9b1e7f3a605
+Create Date: 2026-10-18 17:02:55.418733
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'f1d3b5c7e920'
+down_revision: Union[str, None] = 'd9b1e7f3a605'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Pick the row to keep per Acuity id once, the most recently modified
+    # with the id as tiebreak, so the events are moved onto the same row
+    # the DELETE keeps. Events of a deleted row would cascade with it.
+    op.execute("""
+        CREATE TEMPORARY TABLE appointment_keep AS
+        SELECT id, first_value(id) OVER (
+                   PARTITION BY acuity_id
+                   ORDER BY last_modified_here DESC NULLS LAST,
+                            created_at_here DESC NULLS LAST,
+                            id DESC
+               ) AS keep_id
+        FROM appointments
+    """)
+    op.execute("""
+        UPDATE events SET appointment_id = k.keep_id
+        FROM appointment_keep k
+        WHERE events.appointment_id = k.id AND k.id <> k.keep_id
+    """)
+    op.execute("""
+        DELETE FROM appointments a
+        USING appointment_keep k
+        WHERE a.id = k.id AND k.id <> k.keep_id
+    """)
+    op.execute("DROP TABLE appointment_keep")
+    op.create_unique_constraint('appointments_acuity_id_key', 'appointments', ['acuity_id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('appointments_acuity_id_key', 'appointments', type_='unique')
@@ -0,0 +1,32 @@
+"""add schedule revisions
+
+Revision ID: f8d0b2c4e657
+Revises: e7c9a1b3d546
+Create Date: 2026-10-18 21:47:35.104629
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'f8d0b2c4e657'
+down_revision: Union[str, None] = 'e7c9a1b3d546'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('schedule_revisions',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('revision', sa.BigInteger(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('day')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('schedule_revisions')
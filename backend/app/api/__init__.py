@@ -1,6 +1,6 @@
 from fastapi import APIRouter
 
-from app.api.routes import general, webhook, acuity
+from app.api.routes import general, webhook, acuity, jobs, snapshots
 
 api_router = APIRouter()
 
@@ -8,3 +8,5 @@ api_router = APIRouter()
 api_router.include_router(general.router)
 api_router.include_router(webhook.router)
 api_router.include_router(acuity.router)
+api_router.include_router(jobs.router)
+api_router.include_router(snapshots.router)
@@ -1,16 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException
-from app.types import AcuityAppointment
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
-from datetime import datetime
+from pydantic import BaseModel, Field, model_validator
+from typing import List, Literal, Optional
+from datetime import date, datetime
 from zoneinfo import ZoneInfo
 
+from app.config import settings
 from app.core.auth import get_api_key
-from app.core.acuityClient import acuity_client
-from app.core.type_conversion import acuity_to_appointment
+from app.core.resilience import acuity_rate_limiter, acuity_retry_policy
+from app.core.cache import appointment_cache, openings_cache, schedule_cache, invalidate_openings
+from app.core.acuityClient import acuity_client, async_acuity_client, gather_limited
+from app.core.invalidation import invalidation_listener
+from app.core.jobs import enqueue_job
+from app.core.snapshots import save_snapshot, snapshot_listing
 from app.database import get_db
-from app.models import Appointment, Snapshot
-from app.core.time_utils import get_today_boundaries
+from app.models import BackfillCheckpoint
 
 from logging import getLogger
 
@@ -19,69 +25,66 @@ logger = getLogger(__name__)
 router = APIRouter(prefix="/acuity", tags=["acuity"])
 
 
+class DummySlot(BaseModel):
+    date_time: str  # UTC ISO string from a JS Date, e.g. 2025-06-28T00:00:00.000Z
+    count: int = Field(gt=0, le=settings.dummy_appointments_max)
+
+class DummyBatchRequest(BaseModel):
+    slots: List[DummySlot] = Field(min_length=1)
+    concurrency: Optional[int] = Field(default=None, gt=0)
+
+    @model_validator(mode="after")
+    def check_total(self) -> "DummyBatchRequest":
+        total = sum(slot.count for slot in self.slots)
+        if total > settings.dummy_appointments_max:
+            raise ValueError(
+                f"{total} appointments requested, at most {settings.dummy_appointments_max} allowed"
+            )
+        return self
+
+class DummyResult(BaseModel):
+    datetime: str
+    status: Literal["created", "failed"]
+    appointment: Optional[dict] = None
+    reason: Optional[str] = None
+
+class DummyBatchResponse(BaseModel):
+    created: int
+    failed: int
+    results: List[DummyResult]
+
+
 @router.get("/appointment")
 def get_acuity_appointment(id: str, api_key: str = Depends(get_api_key)):
     return acuity_client.get_appointment(id)
 
 
 @router.post("/snapshot")
-def take_snapshot(db: Session = Depends(get_db), api_key: str = Depends(get_api_key)):
-    try:
-        appointments = acuity_client.get_appointments()
-
-        # Create snapshot record
-        snapshot = Snapshot(dump=appointments)
-        db.add(snapshot)
-
-        # Get all Acuity IDs from the current API response
-        current_acuity_ids = {appt["id"] for appt in appointments}
-
-        # Find and delete appointments that no longer exist in Acuity
-        today_start, today_end, _ = get_today_boundaries()
-        deleted_count = (
-            db.query(Appointment)
-            .filter(
-                and_(
-                    Appointment.acuity_id.notin_(current_acuity_ids),
-                    Appointment.start_time >= today_start,
-                    Appointment.start_time < today_end,
-                )
-            )
-            .delete(synchronize_session=False)
+async def take_snapshot(
+    background: bool = False,
+    horizon_days: Optional[int] = Query(default=None, ge=0),
+    db: Session = Depends(get_db),
+    api_key: str = Depends(get_api_key),
+):
+    if horizon_days is None:
+        horizon_days = settings.snapshot_horizon_days
+    if background:
+        # Any app machine's job workers will pick it up
+        job = await run_in_threadpool(
+            enqueue_job, "snapshot", {"horizon_days": horizon_days}, db
         )
+        return {"message": "Snapshot queued", "job_id": job.id}
 
-        # Create individual appointment records
-        for appt_data in appointments:
-            # Convert to AcuityAppointment type for validation
-            acuity_appt = AcuityAppointment(**appt_data)
-
-            # Check if appointment already exists
-            existing_appt = (
-                db.query(Appointment)
-                .filter(Appointment.acuity_id == acuity_appt.id)
-                .first()
-            )
-
-            if existing_appt:
-                # Update existing appointment if needed
-                existing_appt.start_time = datetime.fromisoformat(acuity_appt.datetime)
-                existing_appt.is_canceled = acuity_appt.canceled
-                existing_appt.last_modified_here = datetime.now()
-            else:
-                # Create new appointment
-                new_appt = acuity_to_appointment(acuity_appt)
-                db.add(new_appt)
-
-        db.commit()
-        db.refresh(snapshot)
-        return {
-            "message": "Snapshot and appointments saved successfully",
-            "count": len(appointments),
-            "deleted_count": deleted_count,
-        }
+    try:
+        # The horizon's days are fetched concurrently
+        appointments = await async_acuity_client.get_appointments(
+            **snapshot_listing(horizon_days)
+        )
+        # The writes are sync, so they run off the event loop
+        return await run_in_threadpool(save_snapshot, appointments, db, horizon_days)
 
     except Exception as e:
-        db.rollback()  # Rollback any changes if there's an error
+        await run_in_threadpool(db.rollback)  # Rollback any changes if there's an error
         import traceback
 
         logger.error(f"Error in take_snapshot: {str(e)}", exc_info=True)
@@ -91,46 +94,150 @@ def take_snapshot(db: Session = Depends(get_db), api_key: str = Depends(get_api_
         )
 
 
+@router.post("/backfill")
+def start_backfill(
+    start: date,
+    end: date,
+    db: Session = Depends(get_db),
+    api_key: str = Depends(get_api_key),
+):
+    if end < start:
+        raise HTTPException(status_code=422, detail="end is before start")
+    # Same lane for the same range, so a repeated request queues behind the first
+    job = enqueue_job(
+        "backfill",
+        {"start": start.isoformat(), "end": end.isoformat()},
+        db,
+        key=f"backfill:{start.isoformat()}:{end.isoformat()}",
+    )
+    return {"message": "Backfill queued", "job_id": job.id}
+
+
+@router.get("/backfill")
+def list_backfills(db: Session = Depends(get_db), api_key: str = Depends(get_api_key)):
+    checkpoints = db.scalars(
+        select(BackfillCheckpoint).order_by(BackfillCheckpoint.started_at.desc())
+    ).all()
+    return [
+        {
+            "start": c.start_date.isoformat(),
+            "end": c.end_date.isoformat(),
+            "next_day": c.next_day.isoformat(),
+            "rows": c.rows,
+            "started_at": c.started_at.isoformat(),
+            "updated_at": c.updated_at.isoformat() if c.updated_at else None,
+            "finished_at": c.finished_at.isoformat() if c.finished_at else None,
+        }
+        for c in checkpoints
+    ]
+
+
+async def _cached_openings(appt_type: int, date: Optional[str], today: bool) -> List[dict]:
+    if today and not date:
+        date = str(datetime.today().date())
+    key = (appt_type, settings.calendar_id, date)
+    return await openings_cache.get_or_load(
+        key, lambda: async_acuity_client.get_openings(appt_type, date, today)
+    )
+
+
 @router.get("/openings")
-def get_openings(
+async def get_openings(
     appt_type: int,
     date: str = None,
     today: bool = True,
     api_key: str = Depends(get_api_key),
 ):
-    return acuity_client.get_openings(appt_type, date, today)
+    return await _cached_openings(appt_type, date, today)
 
 
 @router.get("/openings/dummy")
-def get_openings_dummy(
+async def get_openings_dummy(
     date: str = None, today: bool = True, api_key: str = Depends(get_api_key)
 ):
-    return acuity_client.get_openings(
-        appt_type=acuity_client.appt_types["dummy"], date=date, today=today
-    )
+    return await _cached_openings(async_acuity_client.appt_types["dummy"], date, today)
 
 
-@router.post("/openings/dummy")
-def create_dummy_appointments(
-    num_appointments: int, date_time: str, api_key: str = Depends(get_api_key)
-):  
+@router.get("/stats")
+def get_cache_stats(api_key: str = Depends(get_api_key)):
+    return {
+        "openings_cache": openings_cache.stats(),
+        "appointment_cache": appointment_cache.stats(),
+        "schedule_cache": schedule_cache.stats(),
+        "rate_limiter": acuity_rate_limiter.stats(),
+        "retry_policy": acuity_retry_policy.stats(),
+        "invalidation": invalidation_listener.stats(),
+    }
+
+
+def _to_denver_iso(date_time: str) -> str:
     # datetime is coming in the format 2025-06-28T00:00:00.000Z, from a JS Date object 
-    print(date_time)
     # Convert UTC ISO string to Denver timezone
     utc_dt = datetime.fromisoformat(date_time.replace('Z', '+0000'))
     denver_dt = utc_dt.astimezone(ZoneInfo("America/Denver"))
     # Format in ATOM format with Denver timezone offset
-    denver_dt_str = denver_dt.isoformat()
-    print(denver_dt_str)
-    res = []
-    for i in range(num_appointments):
-        res.append(
-            acuity_client.create_appointment(
-                denver_dt_str,
-                appt_type=acuity_client.appt_types["dummy"],
+    return denver_dt.isoformat()
+
+
+async def _create_dummies(
+    slots: List[DummySlot], concurrency: Optional[int] = None
+) -> List[DummyResult]:
+    """Create every requested dummy concurrently, at most `concurrency` at a time"""
+    targets = [
+        _to_denver_iso(slot.date_time) for slot in slots for _ in range(slot.count)
+    ]
+    outcomes = await gather_limited(
+        (
+            async_acuity_client.create_appointment(
+                target,
+                appt_type=async_acuity_client.appt_types["dummy"],
                 first_name="Dummy",
                 last_name="Apt",
-                # email="test@test.com",
             )
+            for target in targets
+        ),
+        limit=concurrency,
+    )
+
+    # the booked slots no longer have the same openings
+    invalidate_openings(targets)
+
+    results = []
+    for target, outcome in zip(targets, outcomes):
+        if isinstance(outcome, Exception):
+            logger.warning("Failed to create dummy at %s: %s", target, outcome)
+            results.append(DummyResult(datetime=target, status="failed", reason=str(outcome)))
+        else:
+            results.append(DummyResult(datetime=target, status="created", appointment=outcome))
+    return results
+
+
+@router.post("/openings/dummy")
+async def create_dummy_appointments(
+    date_time: str,
+    num_appointments: int = Query(ge=0, le=settings.dummy_appointments_max),
+    api_key: str = Depends(get_api_key),
+):
+    if num_appointments == 0:
+        return []
+    results = await _create_dummies([DummySlot(date_time=date_time, count=num_appointments)])
+    failed = [r for r in results if r.status == "failed"]
+    if failed:
+        raise HTTPException(
+            status_code=502,
+            detail=[r.model_dump() for r in results],
         )
-    return res
+    return [r.appointment for r in results]
+
+
+@router.post("/openings/dummy/batch", response_model=DummyBatchResponse)
+async def create_dummy_appointments_batch(
+    batch: DummyBatchRequest, api_key: str = Depends(get_api_key)
+) -> DummyBatchResponse:
+    results = await _create_dummies(batch.slots, batch.concurrency)
+    created = sum(1 for r in results if r.status == "created")
+    return DummyBatchResponse(
+        created=created,
+        failed=len(results) - created,
+        results=results,
+    )
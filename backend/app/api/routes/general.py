@@ -1,17 +1,25 @@
-from datetime import datetime, timedelta
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import date, datetime
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
-from typing import Dict, List, Tuple, Optional
-from sqlalchemy import and_, or_
+from typing import List, Tuple, Optional
+from sqlalchemy import and_
 from uuid import UUID
 from zoneinfo import ZoneInfo
 
 from app.config import settings
 from app.core.auth import get_api_key
 from app.database import get_db
-from app.models import Appointment, Event, EventAction
-from app.core.time_utils import get_today_boundaries, get_center_opening_hours
+from app.models import Appointment
+from app.core.time_utils import get_today_boundaries, to_local_date
+from app.core.live_updates import schedule_broker
+from app.core.resilience import acuity_circuit_breaker
+from app.core.schedule_diff import hourly_diff, rebuild_diff_entries
+from app.core.schedule_history import schedule_as_of
+from app.core.schedule_revisions import bump_revisions, revisioned_response
+from app.core.schedule_sync import schedule_since
+from app.core.webhook_processing import deferred_notifications
 
 from logging import getLogger
 logger = getLogger(__name__)
@@ -49,7 +57,12 @@ async def root():
 
 @router.get("/healthcheck")
 def read_root():
-     return {"status": "ok"}
+     return {
+         "status": "ok",
+         "acuity_circuit": acuity_circuit_breaker.stats(),
+         "webhooks": deferred_notifications.stats(),
+         "live": schedule_broker.stats(),
+     }
 
 @router.get("/protected-endpoint")
 async def protected_endpoint(api_key: str = Depends(get_api_key)):
@@ -69,6 +82,7 @@ def create_appointment(appt: AppointmentCreate, db: Session = Depends(get_db), a
             acuity_created_at=appt.acuity_created_at,
         )
         db.add(db_appointment)
+        bump_revisions([appt.start_time], db)
         db.commit()
         db.refresh(db_appointment)
         return db_appointment
@@ -76,127 +90,112 @@ def create_appointment(appt: AppointmentCreate, db: Session = Depends(get_db), a
         raise HTTPException(status_code=400, detail=str(e))
 
 
+def _today() -> date:
+    return date.fromisoformat(to_local_date(datetime.now(tz=ZoneInfo('UTC'))))
+
+
 @router.get("/schedule")
-def get_schedule(db: Session = Depends(get_db), api_key: str = Depends(get_api_key)):
+def get_schedule(
+    request: Request,
+    as_of: Optional[datetime] = None,
+    since: Optional[int] = Query(default=None, ge=0),
+    db: Session = Depends(get_db),
+    api_key: str = Depends(get_api_key),
+):
+    if as_of is not None:
+        return _get_schedule_as_of(as_of, db)
+    if since is not None:
+        result = schedule_since(since, db)
+        result["appointments"] = _to_local_times(result["appointments"])
+        return result
     try:
-        today_start, today_end, _ = get_today_boundaries()
-        # Get appointments from database (they're in UTC)
-        appointments = (
-            db.query(Appointment)
-            .filter(
-                and_(
-                    Appointment.start_time >= today_start,
-                    Appointment.start_time < today_end,
-                )
-            )
-            .order_by(Appointment.start_time)
-            .all()
-        )
-        # Convert timestamps to Mountain Time
-        local_tz = ZoneInfo('America/Denver')
-        for appt in appointments:
-            # Add UTC timezone info to the naive datetime
-            utc_start = appt.start_time.replace(tzinfo=ZoneInfo('UTC'))
-            utc_created = appt.acuity_created_at.replace(tzinfo=ZoneInfo('UTC'))
-            
-            # Convert to local time
-            appt.start_time = utc_start.astimezone(local_tz)
-            appt.acuity_created_at = utc_created.astimezone(local_tz)
-            
-            if appt.acuity_deleted_at:
-                utc_deleted = appt.acuity_deleted_at.replace(tzinfo=ZoneInfo('UTC'))
-                appt.acuity_deleted_at = utc_deleted.astimezone(local_tz)
-        
-        return appointments
-
+        return revisioned_response(request, "schedule", _today(), db, lambda: _today_schedule(db))
     except Exception as e:
         logger.error(f"Error in get_schedule: {str(e)}", exc_info=True)
         raise HTTPException(status_code=400, detail=str(e))
 
 
-def _initialize_hourly_diffs(day_of_week: int) -> Dict[str, HourlyDiff]:
-    hourly_diffs: Dict[str, HourlyDiff] = {}
-    center_open, center_close = get_center_opening_hours(day_of_week, in_utc=False)
-    hours_open = int((center_close - center_open).total_seconds() // 3600)
-    
-    for i in range(hours_open):
-        hour = datetime.strftime(center_open + timedelta(hours=i), "%H:%M")
-        hourly_diffs[hour] = HourlyDiff(hour=hour)
-    return hourly_diffs
-
-
-def _process_event(
-    event: Event,
-    first_name: str,
-    last_name: str,
-    hourly_diffs: Dict[str, HourlyDiff]
-) -> None:
-    local_tz = ZoneInfo('America/Denver')
-    old_hour = event.old_time.replace(tzinfo=ZoneInfo('UTC')).astimezone(local_tz).strftime("%H:%M") if event.old_time else None
-    new_hour = event.new_time.replace(tzinfo=ZoneInfo('UTC')).astimezone(local_tz).strftime("%H:%M") if event.new_time else None
-    print(f'old, new {old_hour}, {new_hour}')
-    simple_event = SimpleEvent(
-        id=event.appointment_id,
-        first_name=first_name,
-        last_name=last_name,
+def _today_schedule(db: Session) -> List[Appointment]:
+    today_start, today_end, _ = get_today_boundaries()
+    # Get appointments from database (they're in UTC)
+    appointments = (
+        db.query(Appointment)
+        .filter(
+            and_(
+                Appointment.start_time >= today_start,
+                Appointment.start_time < today_end,
+            )
+        )
+        .order_by(Appointment.start_time)
+        .all()
     )
-    
-    try:
-        match event.action:
-            case EventAction.schedule:
-                hourly_diffs[new_hour].added.append(simple_event)
-            case EventAction.cancel:
-                hourly_diffs[old_hour].deleted.append(simple_event)
-            case EventAction.reschedule_same_day:
-                hourly_diffs[old_hour].deleted.append(simple_event)
-                hourly_diffs[new_hour].added.append(simple_event)
-            case EventAction.reschedule_incoming:
-                hourly_diffs[new_hour].added.append(simple_event)
-            case EventAction.reschedule_outgoing:
-                hourly_diffs[old_hour].deleted.append(simple_event)
-            case _:
-                logger.warning(f"Unknown action: {event.action} for id {event.id}")
-    except Exception as e:
-        logger.error(f"Error processing event {event.id}: {str(e)}")
-        logger.debug(f"Event data: {event.to_dict()}")
+    return _to_local_times(appointments)
 
 
-@router.get("/schedule/diff", response_model=List[HourlyDiff])
-def get_schedule_diff(db: Session = Depends(get_db), api_key: str = Depends(get_api_key)) -> List[HourlyDiff]:
-    try:
-        # NOTE: the Events are in Local (Denver) time, but appointments are in utc (wtf)
-        center_open, center_close = get_center_opening_hours()
-        today_start, today_end, today_day_of_week = get_today_boundaries()
+def _to_local_times(appointments: List[Appointment]) -> List[Appointment]:
+    # Convert timestamps to Mountain Time
+    local_tz = ZoneInfo('America/Denver')
+    for appt in appointments:
+        # Add UTC timezone info to the naive datetime
+        utc_start = appt.start_time.replace(tzinfo=ZoneInfo('UTC'))
+        utc_created = appt.acuity_created_at.replace(tzinfo=ZoneInfo('UTC'))
         
-        today_events = (
-            db.query(
-                Event,
-                Appointment.first_name,
-                Appointment.last_name,
-                Appointment.start_time,
-            )
-            .join(Event.appointment)
-            .filter(
-                and_(
-                    # the event was created during center open hours, after the snapshot
-                    Event.created_at >= center_open - timedelta(minutes=30), 
-                    Event.created_at < center_close, 
-                    # and the event applies to today 
-                    or_(Event.old_time <= today_end, Event.new_time <= today_end)
-                ))
-            .order_by(Event.created_at)
-            .all()
-        )
-        print(today_events)
-        hourly_diffs = _initialize_hourly_diffs(today_day_of_week)
+        # Convert to local time
+        appt.start_time = utc_start.astimezone(local_tz)
+        appt.acuity_created_at = utc_created.astimezone(local_tz)
         
-        for event, first_name, last_name, _ in today_events:
-            print(event)
-            _process_event(event, first_name, last_name, hourly_diffs)
-            print(hourly_diffs)
-                
-        return list(hourly_diffs.values())
+        if appt.acuity_deleted_at:
+            utc_deleted = appt.acuity_deleted_at.replace(tzinfo=ZoneInfo('UTC'))
+            appt.acuity_deleted_at = utc_deleted.astimezone(local_tz)
+    
+    return appointments
+
+
+def _get_schedule_as_of(as_of: datetime, db: Session) -> List[dict]:
+    """The schedule of `as_of`'s day as it stood then, in Mountain Time"""
+    if as_of.tzinfo is None:
+        as_of = as_of.replace(tzinfo=ZoneInfo('UTC'))
+    if as_of > datetime.now(tz=ZoneInfo('UTC')):
+        raise HTTPException(status_code=422, detail="as_of is in the future")
+    local_tz = ZoneInfo('America/Denver')
+    appointments = schedule_as_of(as_of, db)
+    for appt in appointments:
+        utc_start = datetime.fromisoformat(appt["start_time"]).replace(tzinfo=ZoneInfo('UTC'))
+        appt["start_time"] = utc_start.astimezone(local_tz).isoformat()
+    return appointments
+
 
+@router.get("/schedule/diff", response_model=List[HourlyDiff])
+def get_schedule_diff(
+    request: Request, db: Session = Depends(get_db), api_key: str = Depends(get_api_key)
+):
+    try:
+        return revisioned_response(request, "schedule_diff", _today(), db, lambda: hourly_diff(db))
     except Exception as e:
         logger.error(f"Error in get_schedule_diff: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@router.get("/schedule/stream")
+async def stream_schedule(
+    last_event_id: Optional[str] = Header(default=None),
+    api_key: str = Depends(get_api_key),
+):
+    """Server-Sent Events of each applied change, resumable with Last-Event-ID"""
+    subscription = schedule_broker.subscribe(last_event_id)
+    return StreamingResponse(
+        schedule_broker.stream(subscription),
+        media_type="text/event-stream",
+        # no proxy buffering, or the messages arrive in bursts
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/schedule/diff/rebuild")
+def rebuild_schedule_diff(
+    day: Optional[date] = None,
+    db: Session = Depends(get_db),
+    api_key: str = Depends(get_api_key),
+):
+    """Rebuild the hourly diff entries, of one day or all, from the event log"""
+    return {"entries": rebuild_diff_entries(db, day)}
@@ -0,0 +1,35 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from typing import Optional
+
+from app.core.auth import get_api_key
+from app.core.jobs import job_stats, job_workers, retry_job
+from app.database import get_db
+from app.models import Job
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+
+@router.get("")
+def get_job_stats(
+    kind: Optional[str] = None,
+    db: Session = Depends(get_db),
+    api_key: str = Depends(get_api_key),
+):
+    return {**job_stats(db, kind=kind), "workers": job_workers.stats()}
+
+
+@router.get("/{job_id}")
+def get_job(job_id: int, db: Session = Depends(get_db), api_key: str = Depends(get_api_key)):
+    job = db.get(Job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job.to_dict()
+
+
+@router.post("/{job_id}/retry")
+def retry_dead_job(job_id: int, db: Session = Depends(get_db), api_key: str = Depends(get_api_key)):
+    """Send a dead-lettered job back to the queue"""
+    if not retry_job(job_id, db):
+        raise HTTPException(status_code=409, detail=f"Job {job_id} is not dead")
+    return {"status": "queued", "job_id": job_id}
@@ -0,0 +1,29 @@
+import uuid
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+
+from app.core.auth import get_api_key
+from app.core.snapshot_store import diff_snapshots
+from app.database import get_db
+from app.models import Snapshot
+
+router = APIRouter(prefix="/snapshots", tags=["snapshots"])
+
+
+def _get_snapshot(snapshot_id: uuid.UUID, db: Session) -> Snapshot:
+    snapshot = db.get(Snapshot, snapshot_id)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail=f"Snapshot {snapshot_id} not found")
+    return snapshot
+
+
+@router.get("/diff")
+def get_snapshot_diff(
+    from_id: uuid.UUID = Query(alias="from"),
+    to_id: uuid.UUID = Query(alias="to"),
+    db: Session = Depends(get_db),
+    api_key: str = Depends(get_api_key),
+):
+    """Appointments added, removed and changed between two snapshots"""
+    return diff_snapshots(_get_snapshot(from_id, db), _get_snapshot(to_id, db), db)
@@ -1,28 +1,23 @@
-from fastapi import APIRouter, Form, Depends, HTTPException
+from fastapi import APIRouter, Form, Depends
+from fastapi.concurrency import run_in_threadpool
 from typing import Optional
-from app.types import AcuityAppointment
 from sqlalchemy.orm import Session
-from sqlalchemy import select
-import requests
-from datetime import datetime
 from app.config import settings
-import json
 import logging
 
 logger = logging.getLogger(__name__)
 
-from app.core.acuityClient import acuity_client
+from app.core.acuityClient import async_acuity_client
 
 from app.database import get_db
-from app.models import Appointment 
-from app.core.apptActions import (
-    handle_reschedule_same_day,
-    handle_schedule,
-    handle_cancel,
-    handle_reschedule_incoming,
-    handle_reschedule_outgoing,
+from app.core.resilience import CircuitOpenError, acuity_circuit_breaker
+from app.core.auth import get_api_key
+from app.core.jobs import enqueue_notification, job_stats, job_workers
+from app.core.webhook_processing import (
+    VALID_ACTIONS,
+    deferred_notifications,
+    process_notification,
 )
-from app.core.time_utils import isToday
 
 router = APIRouter(prefix="/webhook", tags=["webhook"])
 
@@ -48,63 +43,32 @@ async def handle_appt_changed(
         return {"status": "passed", "message": f"Invalid calendar ID: {calendarID}"}
 
     # Validate the action type
-    valid_actions = {
-        "scheduled",
-        "rescheduled",
-        "canceled",
-        "changed",
-        "order.completed",
-    }
-    if action not in valid_actions:
+    if action not in VALID_ACTIONS:
         logger.error("Invalid action received: %s", action)
         return {"status": "error", "message": f"Invalid action: {action}"}
 
-    try:
-
-        # Check if appointment exists
-        try:
-            q = select(Appointment).where(Appointment.acuity_id == id)
-            existing_appt = db.scalars(q).all()[0]
-        except:
-            existing_appt = None
+    if settings.webhook_mode == "inbox":
+        # Acknowledge right away; the job workers do the slow part. Queueing
+        # may wait on a worker's row lock, so it runs off the event loop
+        def enqueue() -> int:
+            # the id too, as reading it after the commit is a SELECT
+            return enqueue_notification(action, id, db).id
 
-        # Fetch appointment details from Acuity API
-        try:
-            appt_details: AcuityAppointment = acuity_client.get_appointment(id)
-        except requests.exceptions.RequestException as e:
-            logger.error("Failed to fetch appointment details: %s", str(e))
-            raise HTTPException(
-                status_code=500, detail=f"Failed to fetch appointment details: {str(e)}"
-            )
+        job_id = await run_in_threadpool(enqueue)
+        return {"status": "queued", "message": f"Appt {id} queued as job {job_id}"}
 
-        event = None
-        if not existing_appt and not isToday(appt_details["datetime"]):
-                logger.info("Appt %s doesn't deal with today", id)
-                return {
-                    "status": "passed",
-                    "message": f"Appt {id} doesn't deal with today",
-                }
-        elif not existing_appt and isToday(appt_details["datetime"]):
-            event = handle_schedule(appt_details, db)
-        elif appt_details["canceled"]:
-            event = handle_cancel(existing_appt, db)
-        elif isToday(appt_details["datetime"]) and isToday(existing_appt.start_time):
-            event = handle_reschedule_same_day(existing_appt, appt_details, db)
-        elif isToday(appt_details["datetime"]) and not isToday(existing_appt.start_time):
-            # why this would happen, I'm not sure. But I'm handling it 
-            event = handle_reschedule_incoming(existing_appt, appt_details, db)
-        elif not isToday(appt_details["datetime"]):
-            event = handle_reschedule_outgoing(existing_appt, appt_details, db)
-        else:
-            logger.error("Unexpected appointment state")
-            raise Exception("existing appt - Shouldn't end up here")
-        db.add(event)
-        db.commit()
+    try:
+        if acuity_circuit_breaker.state == "open":
+            raise CircuitOpenError("Acuity circuit is open")
+        return await process_notification(action, id, db, async_acuity_client)
+    except CircuitOpenError:
+        # Acuity is degraded: keep the notification and replay it later
+        logger.warning("Acuity unavailable, deferring webhook %s for %s", action, id)
+        deferred_notifications.defer(action, id)
+        return {"status": "deferred", "message": f"Appt {id} queued until Acuity recovers"}
 
-        logger.info("Webhook processed successfully")
-        return {"status": "success", "data": json.dumps(event.to_dict())}
 
-    except Exception as e:
-        db.rollback()
-        logger.error("Error processing webhook: %s", str(e), exc_info=True)
-        return {"status": "error", "message": str(e)}
+@router.get("/inbox")
+def get_inbox_status(db: Session = Depends(get_db), api_key: str = Depends(get_api_key)):
+    """How many notifications are waiting and how far behind the workers are"""
+    return {**job_stats(db, kind="webhook"), "workers": job_workers.stats()}
@@ -19,6 +19,104 @@ class Settings(BaseSettings):
     acuity_api_key: str
     calendar_id: str
 
+    # Acuity HTTP transport
+    acuity_pool_size: int = 10
+    acuity_connect_timeout: float = 3.05  # seconds
+    acuity_read_timeout: float = 10.0  # seconds
+    acuity_max_concurrency: int = 5  # in-flight requests per fan-out
+    # Appointment listings are fetched a day at a time; a day that fills its
+    # page is asked for again with twice the page, up to the max
+    acuity_appointments_page_size: int = 100
+    acuity_appointments_max_page: int = 6400
+    # Dummy appointments created by one request, for load tests of the dashboard
+    dummy_appointments_max: int = 100
+
+    # Acuity allows 10 requests per second per account
+    acuity_rate_limit: float = 10.0  # requests per second
+    acuity_rate_burst: int = 10
+    acuity_priority_reserve: int = 2  # tokens only webhook fetches may use
+    acuity_max_retries: int = 3
+    acuity_backoff_base: float = 0.5  # seconds
+    acuity_backoff_max: float = 8.0  # seconds
+
+    # Read timeout per client operation, in seconds
+    acuity_timeouts: dict = {
+        "get_appointment": 5.0,
+        "get_appointments": 20.0,
+        "get_openings": 5.0,
+        "create_appointment": 10.0,
+    }
+    # Circuit breaker: open after this many failed calls in a row
+    acuity_breaker_threshold: int = 5
+    acuity_breaker_reset: float = 30.0  # seconds before a trial call
+    # Hedged get_appointment: resend once the first try is slower than this percentile
+    acuity_hedge_enabled: bool = False
+    acuity_hedge_percentile: float = 95.0
+    acuity_hedge_min_samples: int = 20
+
+    # Webhooks received while the Acuity circuit is open
+    webhook_deferred_max: int = 1000
+    webhook_replay_interval: float = 5.0  # seconds
+
+    # "inline" processes webhooks before responding; "inbox" stores them as
+    # jobs for the background workers
+    webhook_mode: str = "inline"
+    # In inbox mode, notifications for one appointment arriving within this
+    # window are merged into a single job, delayed at most debounce_max
+    webhook_debounce_window: float = 2.0  # seconds, 0 to disable
+    webhook_debounce_max: float = 10.0  # seconds after the first notification
+    # When this many queued notifications are about appointments on the same
+    # day, fetch that day's listing once instead of each appointment
+    webhook_bulk_threshold: int = 5  # 0 to disable
+    webhook_bulk_max: int = 100  # notifications handled per listing
+    webhook_bulk_listing_max: int = 500  # appointments asked for per listing
+
+    # Background job workers (webhook and snapshot jobs), per app machine
+    job_workers: int = 4
+    job_poll_interval: float = 1.0  # seconds between queue checks when idle
+    job_visibility_timeout: float = 300.0  # seconds before a stuck claim is retried
+    job_max_attempts: int = 5  # then the job is dead-lettered
+    job_drain_timeout: float = 10.0  # seconds to finish in-flight work on shutdown
+
+    # Snapshots cover today and this many days after it
+    snapshot_horizon_days: int = 0
+    # Snapshots are stored as deltas against a full base; start a new base
+    # after this many deltas, or when a delta would list more than this
+    # share of the appointments
+    snapshot_base_interval: int = 24
+    snapshot_delta_max_ratio: float = 0.5
+
+    # Seconds between checkpoints of today's schedule, to keep as-of replays short
+    schedule_checkpoint_interval: float = 900.0
+
+    # Historical backfill
+    backfill_batch_days: int = 7  # days fetched concurrently and loaded per transaction
+    backfill_day_max: int = 1000  # first page size per day
+
+    # Live schedule changes over SSE
+    live_buffer_size: int = 500  # recent messages kept for Last-Event-ID resumes
+    live_queue_size: int = 100  # messages queued per client before it is dropped
+    live_heartbeat: float = 15.0  # seconds between keepalives on an idle stream
+    live_retry_ms: int = 1000  # how long clients wait before reconnecting
+
+    # Cache invalidations from other app processes, over LISTEN/NOTIFY
+    invalidation_listen: bool = True
+    invalidation_keepalive: float = 30.0  # seconds of quiet before checking the connection
+    invalidation_reconnect_min: float = 0.5  # seconds, doubled per failed attempt
+    invalidation_reconnect_max: float = 30.0  # seconds
+
+    # Delta syncs of /schedule: deleted appointments are remembered this long,
+    # and a sync that would list more changes than this sends the whole day
+    tombstone_retention_days: int = 2
+    schedule_delta_max: int = 500
+
+    # In-process caches of Acuity data
+    openings_cache_ttl: float = 30.0  # seconds
+    appointment_cache_ttl: float = 15.0  # seconds
+    appointment_cache_size: int = 256  # appointments
+    schedule_cache_ttl: float = 3600.0  # seconds
+    schedule_cache_size: int = 64  # responses
+
     # Center Hours (start, end)
     hours_open: dict = {
         0: ('16:00', '20:00'),
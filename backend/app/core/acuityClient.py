@@ -1,13 +1,42 @@
+import asyncio
+import logging
+import time
 from base64 import b64encode
+import httpx
 import requests
+from requests.adapters import HTTPAdapter
 from app.types import AcuityAppointment
-from typing import List
-from datetime import datetime
+from typing import Any, Awaitable, Iterable, List, Optional, Tuple
+from datetime import date, datetime, timedelta
 
 from app.config import settings
+from app.core.resilience import (
+    LatencyTracker,
+    Priority,
+    acuity_circuit_breaker,
+    acuity_rate_limiter,
+    acuity_retry_policy,
+    hedged,
+)
 
+logger = logging.getLogger(__name__)
+
+
+def _record_outcome(status: int) -> None:
+    """Feed the circuit breaker: 5xx and exhausted 429s mean Acuity is degraded"""
+    if status >= 500 or status == 429:
+        acuity_circuit_breaker.record_failure()
+    else:
+        acuity_circuit_breaker.record_success()
+
+
+class _AcuityClientBase:
+    """Request building and call policy shared by the sync and async Acuity clients.
+
+    Both send through the same retry, circuit breaker, timeout and paging
+    rules; only the I/O differs.
+    """
 
-class AcuityClient:
     def __init__(self):
         self.base_url = "https://acuityscheduling.com/api/v1"
         auth = b64encode(
@@ -20,26 +49,16 @@ class AcuityClient:
         }
         self.appt_types = {"dummy": 42677283}
 
-    def get_appointment(self, appointment_id: str) -> AcuityAppointment:
-        """Fetch appointment details from Acuity API
-
-        Args:
-            appointment_id: The ID of the appointment to fetch
-
-        Returns:
-            Dict containing the appointment details
-        """
-        response = requests.get(
-            f"{self.base_url}/appointments/{appointment_id}", headers=self.headers
-        )
-        response.raise_for_status()  # Raise exception for non-200 status codes
-        return response.json()
-
-    def get_appointments(
-        self, today: bool = True, limit: int = 100
-    ) -> List[AcuityAppointment]:
-        minDate, maxDate = None, None
-        if today:
+    def _appointments_params(
+        self,
+        today: bool,
+        limit: int,
+        min_date: Optional[str] = None,
+        max_date: Optional[str] = None,
+        show_all: bool = False,
+    ) -> dict:
+        minDate, maxDate = min_date, max_date
+        if today and not (min_date or max_date):
             todayDate = datetime.today().date()
             minDate, maxDate = todayDate, todayDate
 
@@ -50,42 +69,92 @@ class AcuityClient:
         }
         if limit:
             params["max"] = limit
+        if show_all:
+            # include canceled appointments, which Acuity leaves out by default
+            params["showall"] = "true"
+        return params
 
-        response = requests.get(
-            f"{self.base_url}/appointments", headers=self.headers, params=params
-        )
-        response.raise_for_status()  # Raise exception for non-200 status codes
-        return response.json()
+    @staticmethod
+    def _appointment_days(
+        today: bool, min_date: Optional[str], max_date: Optional[str]
+    ) -> Optional[List[str]]:
+        """The days a listing covers, fetched one request per day.
 
-    def get_openings(
-        self, appt_type: int, date: str = None, today: bool = True
-    ) -> List[dict]:
+        None for an open-ended range, which can only be asked for whole.
+        """
+        if today and not (min_date or max_date):
+            min_date = max_date = datetime.today().date().isoformat()
+        if not (min_date and max_date):
+            return None
+        first = date.fromisoformat(str(min_date)[:10])
+        last = date.fromisoformat(str(max_date)[:10])
+        return [(first + timedelta(days=i)).isoformat() for i in range((last - first).days + 1)]
+
+    @staticmethod
+    def _next_page_size(day: str, page_size: int, received: int) -> Optional[int]:
+        """A bigger `max` to ask for a day again with, or None once it is complete.
 
+        Acuity has no offset for listings, so a day that fills the page is
+        fetched again with twice the room until it doesn't.
+        """
+        if received < page_size:
+            return None
+        if page_size >= settings.acuity_appointments_max_page:
+            logger.error(
+                "Appointments on %s still fill a page of %d, some are missing",
+                day,
+                page_size,
+            )
+            return None
+        return min(page_size * 2, settings.acuity_appointments_max_page)
+
+    @staticmethod
+    def _retry_delay(
+        attempt: int,
+        idempotent: bool,
+        status: Optional[int] = None,
+        retry_after: Optional[str] = None,
+    ) -> Optional[float]:
+        """Seconds to wait before retrying a failed attempt, or None to give up.
+
+        `status` is None for a dropped connection; a response that needs no
+        retry gives up too.
+        """
+        if not acuity_retry_policy.should_retry(attempt, status, idempotent=idempotent):
+            return None
+        acuity_retry_policy.record(status)
+        return acuity_retry_policy.delay(attempt, retry_after)
+
+    @staticmethod
+    def _read_timeout(operation: str) -> float:
+        return settings.acuity_timeouts.get(operation, settings.acuity_read_timeout)
+
+    @staticmethod
+    def _checked(response):
+        """Feed `response` to the circuit breaker, raising for error statuses"""
+        _record_outcome(response.status_code)
+        response.raise_for_status()  # Raise exception for non-200 status codes
+        return response
+
+    def _openings_params(self, appt_type: int, date: str, today: bool) -> dict:
         if today and not date:
             date = datetime.today().date()
 
-        params = {
+        return {
             "calendarID": settings.calendar_id,
             "date": date,
             "appointmentTypeID": appt_type,
         }
 
-        response = requests.get(
-            f"{self.base_url}/availability/times", headers=self.headers, params=params
-        )
-
-        response.raise_for_status()
-        return response.json()
-
-    def create_appointment(
+    def _appointment_body(
         self,
         datetime: str,
         appt_type: int,
         first_name: str,
         last_name: str,
-        email: str = "",
+        email: str,
     ) -> dict:
-        body = {
+        return {
             "datetime": datetime,
             "appointmentTypeID": appt_type,
             "calendarID": settings.calendar_id,
@@ -93,16 +162,421 @@ class AcuityClient:
             "lastName": last_name,
             "email": email,
         }
-        response = requests.post(
-            f"{self.base_url}/appointments",
-            headers=self.headers,
-            json=body,
+
+
+class AcuityClient(_AcuityClientBase):
+    def __init__(self):
+        super().__init__()
+        self._session: Optional[requests.Session] = None
+
+    def startup(self) -> None:
+        """Open the pooled keep-alive session used for every Acuity call"""
+        if self._session is not None:
+            return
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,  # we only ever talk to one host
+            pool_maxsize=settings.acuity_pool_size,
+        )
+        session.mount("https://", adapter)
+        session.headers.update(self.headers)
+        self._session = session
+
+    def shutdown(self) -> None:
+        """Close the session and every pooled connection it holds"""
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    @property
+    def session(self) -> requests.Session:
+        # lazily open the session so scripts and tests that never run the
+        # FastAPI lifespan still share one connection pool
+        if self._session is None:
+            self.startup()
+        return self._session
+
+    def _send(self, method: str, path: str, priority: Priority, **kwargs) -> requests.Response:
+        """Send a rate-limited request, retrying 429s, 5xx and dropped connections"""
+        attempt = 0
+        idempotent = method == "GET"
+        while True:
+            acuity_rate_limiter.acquire(priority)
+            try:
+                response = self.session.request(method, f"{self.base_url}{path}", **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                delay = self._retry_delay(attempt, idempotent)
+                if delay is None:
+                    raise
+            else:
+                delay = self._retry_delay(
+                    attempt, idempotent, response.status_code, response.headers.get("Retry-After")
+                )
+                if delay is None:
+                    return response
+            time.sleep(delay)
+            attempt += 1
+
+    def _request(
+        self, method: str, path: str, priority: Priority, operation: str, **kwargs
+    ) -> requests.Response:
+        acuity_circuit_breaker.before_call()
+        try:
+            response = self._send(
+                method, path, priority, timeout=self._timeout(operation), **kwargs
+            )
+        except Exception:
+            acuity_circuit_breaker.record_failure()
+            raise
+        return self._checked(response)
+
+    def _timeout(self, operation: str) -> Tuple[float, float]:
+        return (settings.acuity_connect_timeout, self._read_timeout(operation))
+
+    def get_appointment(
+        self, appointment_id: str, priority: Priority = Priority.high
+    ) -> AcuityAppointment:
+        """Fetch appointment details from Acuity API
+
+        Args:
+            appointment_id: The ID of the appointment to fetch
+
+        Returns:
+            Dict containing the appointment details
+        """
+        return self._request(
+            "GET", f"/appointments/{appointment_id}", priority, "get_appointment"
+        ).json()
+
+    def get_appointments(
+        self,
+        today: bool = True,
+        limit: Optional[int] = None,
+        priority: Priority = Priority.low,
+        min_date: Optional[str] = None,
+        max_date: Optional[str] = None,
+        show_all: bool = False,
+    ) -> List[AcuityAppointment]:
+        """Every appointment from `min_date` to `max_date`, or today's.
+
+        Fetched one day at a time, each paged until complete; `limit` is
+        the first page size.
+        """
+        days = self._appointment_days(today, min_date, max_date)
+        if days is None:
+            return self._list_appointments(
+                limit or settings.acuity_appointments_page_size,
+                priority,
+                min_date,
+                max_date,
+                show_all,
+            )
+        return [
+            appointment
+            for day in days
+            for appointment in self._get_day(day, limit, priority, show_all)
+        ]
+
+    def _get_day(
+        self, day: str, limit: Optional[int], priority: Priority, show_all: bool
+    ) -> List[AcuityAppointment]:
+        page_size = limit or settings.acuity_appointments_page_size
+        while True:
+            appointments = self._list_appointments(page_size, priority, day, day, show_all)
+            page_size = self._next_page_size(day, page_size, len(appointments))
+            if page_size is None:
+                return appointments
+
+    def _list_appointments(
+        self,
+        limit: int,
+        priority: Priority,
+        min_date: Optional[str],
+        max_date: Optional[str],
+        show_all: bool,
+    ) -> List[AcuityAppointment]:
+        return self._request(
+            "GET",
+            "/appointments",
+            priority,
+            "get_appointments",
+            params=self._appointments_params(False, limit, min_date, max_date, show_all),
+        ).json()
+
+    def get_openings(
+        self,
+        appt_type: int,
+        date: str = None,
+        today: bool = True,
+        priority: Priority = Priority.high,
+    ) -> List[dict]:
+        return self._request(
+            "GET",
+            "/availability/times",
+            priority,
+            "get_openings",
+            params=self._openings_params(appt_type, date, today),
+        ).json()
+
+    def create_appointment(
+        self,
+        datetime: str,
+        appt_type: int,
+        first_name: str,
+        last_name: str,
+        email: str = "",
+        priority: Priority = Priority.low,
+    ) -> dict:
+        return self._request(
+            "POST",
+            "/appointments",
+            priority,
+            "create_appointment",
+            json=self._appointment_body(datetime, appt_type, first_name, last_name, email),
             params={"admin": "true"},
+        ).json()
+
+
+class AsyncAcuityClient(_AcuityClientBase):
+    """Non-blocking twin of AcuityClient for use inside `async def` routes.
+
+    Same method surface, but every method is a coroutine and raises
+    httpx.HTTPError instead of requests.RequestException. Both clients
+    raise CircuitOpenError while the Acuity circuit breaker is open.
+    """
+
+    def __init__(self, transport: Optional[httpx.AsyncBaseTransport] = None):
+        super().__init__()
+        self.timeout = httpx.Timeout(
+            settings.acuity_read_timeout, connect=settings.acuity_connect_timeout
+        )
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self.latency = LatencyTracker()
+
+    def startup(self) -> None:
+        """Open the pooled keep-alive client used for every Acuity call"""
+        if self._client is not None:
+            return
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers=self.headers,
+            timeout=self.timeout,
+            transport=self._transport,
+            limits=httpx.Limits(
+                max_connections=settings.acuity_pool_size,
+                max_keepalive_connections=settings.acuity_pool_size,
+            ),
+        )
+
+    async def shutdown(self) -> None:
+        """Close the client and every pooled connection it holds"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self.startup()
+        return self._client
+
+    @staticmethod
+    def _params(params: dict) -> dict:
+        # requests silently drops None params, httpx sends them as empty strings
+        return {k: str(v) for k, v in params.items() if v is not None}
+
+    async def _send(self, method: str, path: str, priority: Priority, **kwargs) -> httpx.Response:
+        """Send a rate-limited request, retrying 429s, 5xx and dropped connections"""
+        attempt = 0
+        idempotent = method == "GET"
+        while True:
+            await acuity_rate_limiter.acquire_async(priority)
+            try:
+                response = await self.client.request(method, path, **kwargs)
+            except httpx.TransportError:
+                delay = self._retry_delay(attempt, idempotent)
+                if delay is None:
+                    raise
+            else:
+                delay = self._retry_delay(
+                    attempt, idempotent, response.status_code, response.headers.get("Retry-After")
+                )
+                if delay is None:
+                    return response
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _request(
+        self, method: str, path: str, priority: Priority, operation: str, **kwargs
+    ) -> httpx.Response:
+        acuity_circuit_breaker.before_call()
+        try:
+            response = await self._send(
+                method, path, priority, timeout=self._timeout(operation), **kwargs
+            )
+        except asyncio.CancelledError:
+            # e.g. the losing half of a hedged read; says nothing about Acuity
+            acuity_circuit_breaker.abandon()
+            raise
+        except Exception:
+            acuity_circuit_breaker.record_failure()
+            raise
+        return self._checked(response)
+
+    def _timeout(self, operation: str) -> httpx.Timeout:
+        return httpx.Timeout(
+            self._read_timeout(operation), connect=settings.acuity_connect_timeout
+        )
+
+    async def get_appointment(
+        self, appointment_id: str, priority: Priority = Priority.high
+    ) -> AcuityAppointment:
+        """Fetch appointment details from Acuity API
+
+        Args:
+            appointment_id: The ID of the appointment to fetch
+
+        Returns:
+            Dict containing the appointment details
+        """
+
+        async def fetch() -> httpx.Response:
+            start = time.monotonic()
+            response = await self._request(
+                "GET", f"/appointments/{appointment_id}", priority, "get_appointment"
+            )
+            self.latency.record(time.monotonic() - start)
+            return response
+
+        hedge_after = self._hedge_delay()
+        if hedge_after is None:
+            response = await fetch()
+        else:
+            response = await hedged(fetch, hedge_after)
+        return response.json()
+
+    def _hedge_delay(self) -> Optional[float]:
+        if not settings.acuity_hedge_enabled:
+            return None
+        if len(self.latency) < settings.acuity_hedge_min_samples:
+            return None
+        return self.latency.percentile(settings.acuity_hedge_percentile)
+
+    async def get_appointments(
+        self,
+        today: bool = True,
+        limit: Optional[int] = None,
+        priority: Priority = Priority.low,
+        min_date: Optional[str] = None,
+        max_date: Optional[str] = None,
+        show_all: bool = False,
+    ) -> List[AcuityAppointment]:
+        """Every appointment from `min_date` to `max_date`, or today's.
+
+        Days are fetched concurrently, each paged until complete; `limit`
+        is the first page size.
+        """
+        days = self._appointment_days(today, min_date, max_date)
+        if days is None:
+            return await self._list_appointments(
+                limit or settings.acuity_appointments_page_size,
+                priority,
+                min_date,
+                max_date,
+                show_all,
+            )
+        listings = await gather_limited(
+            self._get_day(day, limit, priority, show_all) for day in days
         )
+        for listing in listings:
+            if isinstance(listing, BaseException):
+                raise listing
+        return [appointment for listing in listings for appointment in listing]
 
-        response.raise_for_status()
+    async def _get_day(
+        self, day: str, limit: Optional[int], priority: Priority, show_all: bool
+    ) -> List[AcuityAppointment]:
+        page_size = limit or settings.acuity_appointments_page_size
+        while True:
+            appointments = await self._list_appointments(page_size, priority, day, day, show_all)
+            page_size = self._next_page_size(day, page_size, len(appointments))
+            if page_size is None:
+                return appointments
+
+    async def _list_appointments(
+        self,
+        limit: int,
+        priority: Priority,
+        min_date: Optional[str],
+        max_date: Optional[str],
+        show_all: bool,
+    ) -> List[AcuityAppointment]:
+        response = await self._request(
+            "GET",
+            "/appointments",
+            priority,
+            "get_appointments",
+            params=self._params(
+                self._appointments_params(False, limit, min_date, max_date, show_all)
+            ),
+        )
         return response.json()
 
+    async def get_openings(
+        self,
+        appt_type: int,
+        date: str = None,
+        today: bool = True,
+        priority: Priority = Priority.high,
+    ) -> List[dict]:
+        response = await self._request(
+            "GET",
+            "/availability/times",
+            priority,
+            "get_openings",
+            params=self._params(self._openings_params(appt_type, date, today)),
+        )
+        return response.json()
+
+    async def create_appointment(
+        self,
+        datetime: str,
+        appt_type: int,
+        first_name: str,
+        last_name: str,
+        email: str = "",
+        priority: Priority = Priority.low,
+    ) -> dict:
+        response = await self._request(
+            "POST",
+            "/appointments",
+            priority,
+            "create_appointment",
+            json=self._appointment_body(datetime, appt_type, first_name, last_name, email),
+            params={"admin": "true"},
+        )
+        return response.json()
+
+
+async def gather_limited(
+    calls: Iterable[Awaitable[Any]], limit: Optional[int] = None
+) -> List[Any]:
+    """Await `calls` concurrently with at most `limit` in flight at once.
+
+    Results come back in input order. A failed call does not cancel the
+    others: its exception is returned in its slot, like
+    `asyncio.gather(..., return_exceptions=True)`.
+    """
+    semaphore = asyncio.Semaphore(limit or settings.acuity_max_concurrency)
+
+    async def run(call: Awaitable[Any]) -> Any:
+        async with semaphore:
+            return await call
+
+    return await asyncio.gather(*(run(call) for call in calls), return_exceptions=True)
+
 
-# Create a singleton instance
+# Create singleton instances
 acuity_client = AcuityClient()
+async_acuity_client = AsyncAcuityClient()
@@ -1,48 +1,50 @@
+import uuid
 from app.types import AcuityAppointment
-from sqlalchemy import update
+from sqlalchemy import insert, update
 from datetime import datetime , timezone
 from app.models import Appointment, Event, EventAction
-from app.core.type_conversion import acuity_to_appointment
+from app.core.type_conversion import acuity_to_appointment_values
 import logging
 
 logger = logging.getLogger(__name__)
 
-def createNewAppointment(appt: AcuityAppointment, db):
+# None of these commit: the caller applies the whole webhook, appointment
+# change and Event together, in one transaction
+
+def createNewAppointment(appt: AcuityAppointment, db) -> uuid.UUID:
     newAppt = AcuityAppointment(**appt)
-    db_appointment = acuity_to_appointment(newAppt)
-    db.add(db_appointment)
-    db.commit()
-    db.refresh(db_appointment)
-    return db_appointment
+    q = insert(Appointment)\
+            .values(**acuity_to_appointment_values(newAppt))\
+            .returning(Appointment.id)
+    return db.execute(q).scalar_one()
 
 def updateStartTime(appt: Appointment, newStart: datetime, db):
+    # the ORM keeps `appt` in sync with the new value, no refresh needed;
+    # scalar_one() raises if the row is gone, so no Event is written for it
     q = update(Appointment)\
             .where(Appointment.id == appt.id)\
-            .values(start_time=newStart)
-    db.execute(q)
-    db.commit()
-    db.refresh(appt)
+            .values(start_time=newStart)\
+            .returning(Appointment.id)
+    db.execute(q).scalar_one()
     return appt
 
 def markAsCanceled(appt: Appointment, db):
     q = update(Appointment)\
             .where(Appointment.id == appt.id)\
-            .values(is_canceled=True)
-    db.execute(q)
-    db.commit()
-    # Refresh the appointment object
-    db.refresh(appt)
+            .values(is_canceled=True)\
+            .returning(Appointment.id)
+    db.execute(q).scalar_one()
     return appt
 
 def handle_schedule(appt: AcuityAppointment, db) -> Event:
     old_time = None
     new_time = datetime.fromisoformat(appt['datetime']).astimezone(tz=timezone.utc)
-    res = createNewAppointment(appt, db)
+    appointment_id = createNewAppointment(appt, db)
     event = Event(
         action=EventAction.schedule,
         old_time=old_time,
         new_time=new_time,
-        appointment_id=res.id,
+        appointment_id=appointment_id,
     )
     return event
 
@@ -76,7 +78,7 @@ def handle_reschedule_incoming(existing_appt: Appointment, appt_details: AcuityA
     event = Event(
         action=EventAction.reschedule_incoming,
         old_time=old_time,
-        new_time=new_time,
+        new_time=new_time.astimezone(timezone.utc),
         appointment_id=existing_appt.id,
     )
     return event
@@ -0,0 +1,273 @@
+"""Load historical appointments from Acuity into the appointments table.
+
+    python -m app.core.backfill 2025-01-01 2025-03-31
+"""
+import argparse
+import asyncio
+import csv
+import io
+import logging
+import time
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Tuple
+
+from sqlalchemy import func, select, text
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models import BackfillCheckpoint
+from app.types import AcuityAppointment
+from app.core.acuityClient import gather_limited
+from app.core.resilience import Priority
+from app.core.schedule_revisions import bump_revisions
+from app.core.type_conversion import acuity_to_appointment_values
+
+logger = logging.getLogger(__name__)
+
+# Appointment columns written by the backfill, in COPY order
+COLUMNS = (
+    "id",
+    "acuity_id",
+    "first_name",
+    "last_name",
+    "start_time",
+    "time_zone",
+    "duration",
+    "acuity_created_at",
+    "is_canceled",
+    "created_at_here",
+    "last_modified_here",
+)
+
+CREATE_STAGING = """
+    CREATE TEMP TABLE IF NOT EXISTS appointments_staging
+    (LIKE appointments INCLUDING DEFAULTS) ON COMMIT DELETE ROWS
+"""
+
+# One row per Acuity id, merged the same way the snapshot upsert does:
+# unchanged rows are left alone, and a moved one leaves a tombstone
+MERGE_STAGING = f"""
+    WITH merged AS (
+        INSERT INTO appointments ({", ".join(COLUMNS)})
+        SELECT DISTINCT ON (acuity_id) {", ".join(COLUMNS)}
+        FROM appointments_staging
+        ORDER BY acuity_id
+        ON CONFLICT (acuity_id) DO UPDATE SET
+            start_time = excluded.start_time,
+            is_canceled = excluded.is_canceled,
+            last_modified_here = now(),
+            revision = pg_current_xact_id()::text::bigint
+        WHERE (appointments.start_time, appointments.is_canceled)
+            IS DISTINCT FROM (excluded.start_time, excluded.is_canceled)
+        RETURNING id, start_time, (xmax = 0) AS inserted
+    ), moved AS (
+        INSERT INTO appointment_tombstones (appointment_id, acuity_id, start_time)
+        SELECT a.id, a.acuity_id, a.start_time
+        FROM appointments a JOIN merged m ON m.id = a.id
+        WHERE NOT m.inserted AND a.start_time <> m.start_time
+    )
+    SELECT inserted FROM merged
+"""
+
+
+def _days(start: date, end: date) -> List[date]:
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+
+def _to_rows(appointments: List[dict]) -> List[tuple]:
+    """Validate Acuity appointments into rows in COLUMNS order"""
+    now = datetime.now(tz=timezone.utc)
+    rows = []
+    for appt_data in appointments:
+        values = acuity_to_appointment_values(AcuityAppointment(**appt_data))
+        values.update(
+            id=uuid.uuid4(),
+            time_zone="UTC",
+            created_at_here=now,
+            last_modified_here=now,
+        )
+        rows.append(tuple(values[column] for column in COLUMNS))
+    return rows
+
+
+def copy_into_appointments(rows: List[tuple], db: Session) -> Tuple[int, int]:
+    """Stream rows into a staging table with COPY and merge them in.
+
+    Runs in the caller's transaction; returns (inserted, updated).
+    """
+    if not rows:
+        return 0, 0
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(
+            value.isoformat() if isinstance(value, datetime) else value for value in row
+        )
+    buffer.seek(0)
+
+    db.execute(text(CREATE_STAGING))
+    # Empty already on a real commit; a savepoint release keeps its rows
+    db.execute(text("TRUNCATE appointments_staging"))
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY appointments_staging ({', '.join(COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+            buffer,
+        )
+    finally:
+        cursor.close()
+
+    merged = db.execute(text(MERGE_STAGING)).scalars().all()
+    inserted = sum(1 for was_inserted in merged if was_inserted)
+    return inserted, len(merged) - inserted
+
+
+async def fetch_day(day: date, client) -> List[dict]:
+    return await client.get_appointments(
+        today=False,
+        limit=settings.backfill_day_max,
+        priority=Priority.low,
+        min_date=day.isoformat(),
+        max_date=day.isoformat(),
+        show_all=True,
+    )
+
+
+def _checkpoint(start: date, end: date, db: Session) -> BackfillCheckpoint:
+    """Load and lock this range's checkpoint, creating it on the first run.
+
+    The row lock makes a second backfill of the same range wait for the
+    batch in progress and then carry on after it, instead of redoing it.
+    """
+    name = f"{start.isoformat()}:{end.isoformat()}"
+    checkpoint = db.scalars(
+        select(BackfillCheckpoint)
+        .where(BackfillCheckpoint.name == name)
+        .with_for_update()
+        .execution_options(populate_existing=True)
+    ).first()
+    if checkpoint is None:
+        checkpoint = BackfillCheckpoint(
+            name=name, start_date=start, end_date=end, next_day=start, rows=0
+        )
+        db.add(checkpoint)
+        db.flush()
+    return checkpoint
+
+
+def _next_batch(start: date, end: date, db: Session) -> Tuple[date, List[date]]:
+    """Lock the checkpoint and return (next day, days of the next batch).
+
+    Marks the range finished, and returns no days, once it's all loaded.
+    """
+    checkpoint = _checkpoint(start, end, db)
+    next_day = checkpoint.next_day
+    if next_day > end:
+        checkpoint.finished_at = checkpoint.finished_at or func.now()
+        db.commit()
+        return next_day, []
+    return next_day, _days(next_day, end)[: settings.backfill_batch_days]
+
+
+def _load_batch(
+    start: date, end: date, days: List[date], listings: List[List[dict]], db: Session
+) -> Tuple[int, int, int]:
+    """Merge the listings of `days` and move the checkpoint past them.
+
+    Returns (rows, inserted, updated).
+    """
+    rows = _to_rows([appt for listing in listings for appt in listing])
+    inserted, updated = copy_into_appointments(rows, db)
+    bump_revisions(days, db)
+    checkpoint = _checkpoint(start, end, db)
+    checkpoint.next_day += timedelta(days=len(days))
+    checkpoint.rows += len(rows)
+    db.commit()
+    return len(rows), inserted, updated
+
+
+async def run_backfill(start: date, end: date, db: Session, client) -> dict:
+    """Load every appointment between `start` and `end` (inclusive) into the db.
+
+    Each batch of `backfill_batch_days` days is fetched concurrently, within
+    the shared Acuity rate limit, then loaded and checkpointed in one
+    transaction. Rerunning the same range resumes after the last loaded
+    batch. A failed day stops the run after the batches before it.
+
+    The database work runs in a thread, off the event loop.
+    """
+    if end < start:
+        raise ValueError(f"Backfill end {end} is before start {start}")
+
+    began = time.monotonic()
+    resumed_from = None
+    days_loaded = rows_loaded = inserted = updated = 0
+
+    while True:
+        next_day, batch = await asyncio.to_thread(_next_batch, start, end, db)
+        if resumed_from is None:
+            resumed_from = next_day
+        if not batch:
+            break
+
+        listings = await gather_limited(fetch_day(day, client) for day in batch)
+        # Only load the days before the first failed one, so the checkpoint
+        # never skips past a gap
+        loaded = []
+        for day, listing in zip(batch, listings):
+            if isinstance(listing, BaseException):
+                logger.error("Backfill of %s failed: %s", day, listing)
+                break
+            loaded.append(listing)
+
+        batch_rows, batch_inserted, batch_updated = await asyncio.to_thread(
+            _load_batch, start, end, batch[: len(loaded)], loaded, db
+        )
+
+        days_loaded += len(loaded)
+        rows_loaded += batch_rows
+        inserted += batch_inserted
+        updated += batch_updated
+        elapsed = time.monotonic() - began
+        logger.info(
+            "Backfilled through %s: %d rows, %.1f rows/sec",
+            batch[len(loaded) - 1] if loaded else next_day,
+            rows_loaded,
+            rows_loaded / elapsed if elapsed else 0.0,
+        )
+        if len(loaded) < len(batch):
+            raise listings[len(loaded)]
+
+    elapsed = time.monotonic() - began
+    return {
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "resumed_from": resumed_from.isoformat(),
+        "days": days_loaded,
+        "rows": rows_loaded,
+        "inserted": inserted,
+        "updated": updated,
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(rows_loaded / elapsed, 1) if elapsed else None,
+    }
+
+
+async def _main(start: date, end: date) -> dict:
+    from app.core.acuityClient import async_acuity_client
+    from app.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        return await run_backfill(start, end, db, async_acuity_client)
+    finally:
+        db.close()
+        await async_acuity_client.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill appointments from Acuity")
+    parser.add_argument("start", type=date.fromisoformat, help="first day, YYYY-MM-DD")
+    parser.add_argument("end", type=date.fromisoformat, help="last day, YYYY-MM-DD")
+    args = parser.parse_args()
+    print(asyncio.run(_main(args.start, args.end)))
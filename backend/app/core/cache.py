@@ -0,0 +1,189 @@
+import asyncio
+import threading
+import time
+from copy import deepcopy
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+from app.config import settings
+from app.core.time_utils import to_local_date
+
+
+class TTLCache:
+    """In-process cache with a per-entry TTL and single-flight loading.
+
+    Concurrent `get_or_load` calls for the same missing key share one
+    upstream call instead of each making their own. An entry invalidated
+    while its load is still in flight is not stored when the load finishes.
+
+    Entries and counters are guarded by a lock: sync routes call
+    `get_or_compute` from threadpool threads while the event loop evicts.
+    """
+
+    def __init__(
+        self,
+        ttl: float,
+        max_size: Optional[int] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._clock = clock
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        """Return (found, value) for a fresh entry, dropping it if expired"""
+        with self._lock:
+            return self._get(key)
+
+    def _get(self, key: Hashable) -> Tuple[bool, Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        expires_at, value = entry
+        if expires_at <= self._clock():
+            del self._entries[key]
+            return False, None
+        self._entries.move_to_end(key)
+        return True, value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._set(key, value)
+
+    def _set(self, key: Hashable, value: Any) -> None:
+        self._entries[key] = (self._clock() + self.ttl, value)
+        self._entries.move_to_end(key)
+        if self.max_size is not None:
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        with self._lock:
+            found, value = self._get(key)
+            if found:
+                self.hits += 1
+                return value
+            inflight = self._inflight.get(key)
+            if inflight is None:
+                self.misses += 1
+                future = asyncio.get_running_loop().create_future()
+                self._inflight[key] = future
+            else:
+                self.coalesced += 1
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        try:
+            value = await loader()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # mark the exception as retrieved when nobody else was waiting
+            future.exception()
+            raise
+        else:
+            future.set_result(value)
+            with self._lock:
+                # only keep the value if nobody invalidated the key meanwhile
+                if self._inflight.get(key) is future:
+                    self._set(key, value)
+            return value
+        finally:
+            with self._lock:
+                if self._inflight.get(key) is future:
+                    del self._inflight[key]
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """Synchronous `get_or_load`, for values computed in the calling thread"""
+        with self._lock:
+            found, value = self._get(key)
+            if found:
+                self.hits += 1
+                return value
+            self.misses += 1
+        value = compute()
+        self.set(key, value)
+        return value
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+            self._inflight.pop(key, None)
+
+    def invalidate_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        with self._lock:
+            keys = {k for k in list(self._entries) + list(self._inflight) if predicate(k)}
+            for key in keys:
+                self._entries.pop(key, None)
+                self._inflight.pop(key, None)
+        return len(keys)
+
+    def clear(self) -> None:
+        """Drop every entry and reset the counters"""
+        with self._lock:
+            self._entries.clear()
+            self._inflight.clear()
+            self.hits = self.misses = self.coalesced = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits, misses, coalesced = self.hits, self.misses, self.coalesced
+            size = len(self._entries)
+        lookups = hits + misses + coalesced
+        return {
+            "size": size,
+            "ttl": self.ttl,
+            "hits": hits,
+            "misses": misses,
+            "coalesced": coalesced,
+            "hit_ratio": (hits + coalesced) / lookups if lookups else None,
+        }
+
+
+# Availability lookups, keyed by (appointmentTypeID, calendarID, date)
+openings_cache = TTLCache(ttl=settings.openings_cache_ttl)
+
+
+def invalidate_openings(times: Iterable[Any]) -> int:
+    """Evict cached availability for every date touched by `times`"""
+    dates = {to_local_date(t) for t in times if t is not None}
+    if not dates:
+        return 0
+    return openings_cache.invalidate_where(lambda key: str(key[2]) in dates)
+
+
+# Appointment details by Acuity id, so duplicate notifications skip the fetch
+appointment_cache = TTLCache(
+    ttl=settings.appointment_cache_ttl, max_size=settings.appointment_cache_size
+)
+
+# Serialized /schedule and /schedule/diff responses, keyed by
+# (endpoint, day, schedule revision); a write moves on to a new key
+schedule_cache = TTLCache(
+    ttl=settings.schedule_cache_ttl, max_size=settings.schedule_cache_size
+)
+
+# Webhook actions that mean the appointment itself changed in Acuity, so a
+# cached copy is stale. Anything else ("scheduled", "order.completed") may
+# reuse a recent fetch.
+REFETCH_ACTIONS = {"rescheduled", "canceled", "changed"}
+
+
+async def get_appointment_cached(client, appointment_id: str, action: str) -> dict:
+    """Read-through `client.get_appointment`, forcing a refetch for real changes"""
+    key = str(appointment_id)
+    if action in REFETCH_ACTIONS:
+        appointment_cache.invalidate(key)
+    appointment = await appointment_cache.get_or_load(
+        key, lambda: client.get_appointment(appointment_id)
+    )
+    # callers get their own copy so they can't corrupt the cached one
+    return deepcopy(appointment)
@@ -0,0 +1,214 @@
+"""Cache invalidation across app processes, over Postgres LISTEN/NOTIFY.
+
+Writers call `publish_invalidation` inside their transaction; Postgres
+delivers the notification to every listening process when, and only if,
+the transaction commits. Each process evicts the dates and appointments
+named from its in-process caches. The process that wrote has already
+evicted its own, so it skips its notifications.
+
+Webhook notifications also carry the applied Event, which the listener
+passes on to this process' live clients.
+
+A listener that loses its connection reconnects with exponential backoff
+and then clears every cache, since it can't know what it missed.
+"""
+import json
+import logging
+import os
+import select
+import socket
+import threading
+import time
+from asyncio import AbstractEventLoop
+from typing import Callable, Iterable, Optional
+
+import psycopg2
+from sqlalchemy import func, select as sa_select
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.core.cache import appointment_cache, openings_cache, schedule_cache
+from app.core.live_updates import publish_remote_change
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "cache_invalidation"
+# How the listening connections show up in pg_stat_activity
+APPLICATION_NAME = "cache-invalidation-listener"
+
+# Postgres rejects notification payloads of 8000 bytes or more
+MAX_PAYLOAD = 7999
+
+# Identifies this process, so it can skip its own notifications
+ORIGIN = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def publish_invalidation(
+    db: Session,
+    dates: Iterable[str] = (),
+    appointments: Iterable[str] = (),
+    schedule: Optional[dict] = None,
+) -> dict:
+    """Tell the other processes, on commit, which local dates and Acuity ids changed.
+
+    The message is stamped now, when it's queued, so the listeners' lag
+    covers the rest of the writer's transaction as well as the delivery.
+    `schedule`, the applied Event and the diff hours it changed, goes to
+    their live clients. Returns the message, for evicting the same things
+    from this process' caches.
+    """
+    message = {
+        "origin": ORIGIN,
+        "sent_at": time.time(),
+        "dates": sorted(set(dates)),
+        "appointments": sorted({str(acuity_id) for acuity_id in appointments}),
+    }
+    if schedule is not None:
+        message["schedule"] = schedule
+    payload = json.dumps(message)
+    if len(payload.encode()) > MAX_PAYLOAD:
+        payload = json.dumps({"origin": ORIGIN, "sent_at": message["sent_at"], "all": True})
+    db.execute(sa_select(func.pg_notify(CHANNEL, payload)))
+    return message
+
+
+def _evict_all() -> int:
+    return sum(
+        cache.invalidate_where(lambda key: True)
+        for cache in (openings_cache, appointment_cache, schedule_cache)
+    )
+
+
+def evict(message: dict) -> int:
+    """Drop what a notification names from this process' caches"""
+    if message.get("all"):
+        return _evict_all()
+    dates = set(message.get("dates", []))
+    evicted = openings_cache.invalidate_where(lambda key: str(key[2]) in dates)
+    # responses of those days at an older revision will never be served again
+    evicted += schedule_cache.invalidate_where(lambda key: key[1].isoformat() in dates)
+    for acuity_id in message.get("appointments", []):
+        if appointment_cache.get(acuity_id)[0]:
+            evicted += 1
+        appointment_cache.invalidate(acuity_id)
+    return evicted
+
+
+class InvalidationListener:
+    """Listens for invalidations on a dedicated connection, in a thread.
+
+    Evictions are handed to the event loop, next to the loads they cut
+    short. Changes
+    for live clients are published from the loop's executor, with a session
+    from `session_factory`, as building them reads the database.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._loop: Optional[AbstractEventLoop] = None
+        self._session_factory: Optional[Callable[[], Session]] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self.connected = False
+        self.connects = 0
+        self.reconnects = 0
+        self.received = 0
+        self.evicted = 0
+        self.lag_last = None
+        self.lag_max = 0.0
+
+    def start(
+        self, loop: AbstractEventLoop, session_factory: Optional[Callable[[], Session]] = None
+    ) -> None:
+        if not self.enabled or (self._thread and self._thread.is_alive()):
+            return
+        self._loop = loop
+        self._session_factory = session_factory
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="invalidation-listener", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """The thread closes its connection the next time it wakes up"""
+        self._stopping.set()
+
+    def _dsn(self) -> str:
+        # libpq takes the URL without SQLAlchemy's driver suffix
+        url = make_url(settings.database_url).set(drivername="postgresql")
+        return url.render_as_string(hide_password=False)
+
+    def _run(self) -> None:
+        delay = settings.invalidation_reconnect_min
+        while not self._stopping.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(self._dsn(), application_name=APPLICATION_NAME)
+                conn.autocommit = True
+                conn.cursor().execute(f"LISTEN {CHANNEL}")
+                self.connected = True
+                if self.connects:
+                    self.reconnects += 1
+                    logger.warning("Invalidation listener reconnected, clearing caches")
+                    self._hand_over({"all": True})
+                self.connects += 1
+                delay = settings.invalidation_reconnect_min
+                self._listen(conn)
+            except Exception:
+                logger.exception("Invalidation listener lost its connection")
+            finally:
+                self.connected = False
+                if conn is not None:
+                    conn.close()
+            self._stopping.wait(delay)
+            delay = min(delay * 2, settings.invalidation_reconnect_max)
+
+    def _listen(self, conn) -> None:
+        while not self._stopping.is_set():
+            if select.select([conn], [], [], settings.invalidation_keepalive) == ([], [], []):
+                # quiet for a while: make sure the connection is still there
+                conn.cursor().execute("SELECT 1")
+                continue
+            conn.poll()
+            while conn.notifies:
+                notify = conn.notifies.pop(0)
+                try:
+                    message = json.loads(notify.payload)
+                except ValueError:
+                    logger.error("Bad invalidation payload: %r", notify.payload)
+                    continue
+                if message.get("origin") == ORIGIN:
+                    continue
+                self.received += 1
+                self._hand_over(message)
+
+    def _hand_over(self, message: dict) -> None:
+        self._loop.call_soon_threadsafe(self._evict, message)
+
+    def _evict(self, message: dict) -> None:
+        self.evicted += evict(message)
+        if self._session_factory is not None:
+            self._loop.run_in_executor(
+                None, publish_remote_change, message, self._session_factory
+            )
+        if "sent_at" in message:
+            # from the writer queueing the notification to our eviction, so
+            # the rest of its transaction counts too; across machines this
+            # includes their clock skew
+            self.lag_last = max(time.time() - message["sent_at"], 0.0)
+            self.lag_max = max(self.lag_max, self.lag_last)
+
+    def stats(self) -> dict:
+        return {
+            "connected": self.connected,
+            "reconnects": self.reconnects,
+            "received": self.received,
+            "evicted": self.evicted,
+            "lag_last_seconds": self.lag_last,
+            "lag_max_seconds": self.lag_max,
+        }
+
+
+invalidation_listener = InvalidationListener(enabled=settings.invalidation_listen)
@@ -0,0 +1,510 @@
+import asyncio
+import logging
+import os
+import socket
+from contextlib import suppress
+from datetime import date, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import Row, and_, func, or_, select, update
+from sqlalchemy.orm import Session, aliased
+
+from app.config import settings
+from app.models import Appointment, Job, JobStatus
+from app.core.backfill import run_backfill
+from app.core.cache import REFETCH_ACTIONS, appointment_cache
+from app.core.resilience import CircuitOpenError, Priority
+from app.core.snapshots import save_snapshot, snapshot_listing
+from app.core.time_utils import get_day_boundaries, to_local_date
+from app.core.webhook_processing import (
+    appointment_key,
+    hold_appointments,
+    process_notification,
+    release_appointments,
+)
+
+logger = logging.getLogger(__name__)
+
+# Identifies this process in `jobs.locked_by`, to see which machine holds a claim
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class JobFailed(Exception):
+    """A job handler failed; the job is retried until it runs out of attempts"""
+
+
+async def run_webhook_job(
+    payload: dict,
+    db: Session,
+    client,
+    appt_details: Optional[dict] = None,
+    held: bool = False,
+) -> dict:
+    result = await process_notification(
+        payload["action"], payload["id"], db, client, appt_details=appt_details, held=held
+    )
+    if result["status"] == "error":
+        raise JobFailed(result["message"])
+    return result
+
+
+async def run_snapshot_job(payload: dict, db: Session, client) -> dict:
+    horizon_days = payload.get("horizon_days")
+    appointments = await client.get_appointments(**snapshot_listing(horizon_days))
+    try:
+        return await asyncio.to_thread(save_snapshot, appointments, db, horizon_days)
+    except Exception:
+        await asyncio.to_thread(db.rollback)
+        raise
+
+
+async def run_backfill_job(payload: dict, db: Session, client) -> dict:
+    # A retry resumes from the range's checkpoint
+    try:
+        return await run_backfill(
+            date.fromisoformat(payload["start"]), date.fromisoformat(payload["end"]), db, client
+        )
+    except Exception:
+        await asyncio.to_thread(db.rollback)
+        raise
+
+
+# Handler for each job kind: (payload, db, async Acuity client) -> result
+JOB_HANDLERS: Dict[str, Callable[[dict, Session, object], Awaitable[dict]]] = {
+    "webhook": run_webhook_job,
+    "snapshot": run_snapshot_job,
+    "backfill": run_backfill_job,
+}
+
+
+def enqueue_job(kind: str, payload: dict, db: Session, key: Optional[str] = None) -> Job:
+    """Durably store a job for the workers; they are woken if running here.
+
+    Jobs with the same `key` are run strictly one after another, oldest
+    first; jobs with different keys (or none) run in parallel.
+    """
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    job = Job(kind=kind, payload=payload, key=key)
+    db.add(job)
+    db.commit()
+    job_workers.notify()
+    return job
+
+
+def merge_actions(queued: str, incoming: str) -> str:
+    """The action a merged notification is processed as.
+
+    The job fetches the appointment's latest state either way; the action
+    only decides whether a cached copy may be used, so any real change
+    among the merged notifications forces a refetch.
+    """
+    if incoming in REFETCH_ACTIONS or queued not in REFETCH_ACTIONS:
+        return incoming
+    return queued
+
+
+def enqueue_notification(action: str, acuity_id: str, db: Session) -> Job:
+    """Queue a webhook notification, folding it into one still waiting to run.
+
+    Within `webhook_debounce_window` of the previous notification for the
+    same appointment, the queued job is pushed back and reused, so a burst
+    of edits costs one Acuity fetch and one apply. A job is never pushed
+    back more than `webhook_debounce_max` past its first notification.
+    """
+    key = appointment_key(acuity_id)
+    window = settings.webhook_debounce_window
+    if window <= 0:
+        return enqueue_job("webhook", {"action": action, "id": acuity_id}, db, key=key)
+
+    delay = timedelta(seconds=window)
+    # Lock the waiting job so a worker can't claim it while we merge
+    queued = db.scalars(
+        select(Job)
+        .where(Job.key == key, Job.kind == "webhook", Job.status == JobStatus.pending)
+        .order_by(Job.id.desc())
+        .limit(1)
+        .with_for_update()
+    ).first()
+    if queued is None:
+        job = Job(
+            kind="webhook",
+            payload={"action": action, "id": acuity_id},
+            key=key,
+            available_at=func.now() + delay,
+        )
+        db.add(job)
+        db.commit()
+        return job
+
+    queued.payload = {"action": merge_actions(queued.payload["action"], action), "id": acuity_id}
+    queued.merged_count = Job.merged_count + 1
+    queued.available_at = func.least(
+        func.now() + delay,
+        Job.received_at + timedelta(seconds=settings.webhook_debounce_max),
+    )
+    db.commit()
+    return queued
+
+
+def _claimable():
+    """Jobs a worker may claim now: ready, and first in their lane"""
+    stale = func.now() - timedelta(seconds=settings.job_visibility_timeout)
+    earlier = aliased(Job)
+    earlier_in_lane = (
+        select(earlier.id)
+        .where(
+            earlier.key == Job.key,
+            earlier.id < Job.id,
+            earlier.status.in_([JobStatus.pending, JobStatus.processing]),
+        )
+        .exists()
+    )
+    return and_(
+        or_(
+            and_(Job.status == JobStatus.pending, Job.available_at <= func.now()),
+            and_(Job.status == JobStatus.processing, Job.claimed_at < stale),
+        ),
+        or_(Job.key.is_(None), ~earlier_in_lane),
+    )
+
+
+def _claim(ids, db: Session) -> List[Row]:
+    """Claim the jobs `ids` selects.
+
+    Returns their rows rather than Job instances, which the commit would
+    expire: the workers read them back on the event loop.
+    """
+    q = (
+        update(Job)
+        .where(Job.id.in_(ids))
+        .values(
+            status=JobStatus.processing,
+            claimed_at=func.now(),
+            locked_by=WORKER_ID,
+            attempts=Job.attempts + 1,
+        )
+        .returning(*Job.__table__.columns)
+    )
+    jobs = sorted(db.execute(q).all(), key=lambda job: job.id)
+    db.commit()
+    return jobs
+
+
+def claim_next(db: Session, kinds: Optional[List[str]] = None) -> Optional[Row]:
+    """Claim the oldest ready job, skipping ones other workers hold.
+
+    `FOR UPDATE SKIP LOCKED` lets any number of workers, on any number of
+    machines, poll the same table without handing a job out twice. A claim
+    that was never finished (the worker or machine died) becomes claimable
+    again after `job_visibility_timeout`.
+
+    A keyed job is only claimable once every earlier job with its key has
+    finished, which keeps each key's lane in order across machines.
+    """
+    next_id = (
+        select(Job.id)
+        .where(_claimable())
+        .order_by(Job.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    )
+    if kinds:
+        next_id = next_id.where(Job.kind.in_(kinds))
+    jobs = _claim(next_id, db)
+    return jobs[0] if jobs else None
+
+
+def claim_same_day_webhooks(job: Row, db: Session) -> Tuple[Optional[str], List[Row]]:
+    """Claim other ready webhook jobs about appointments on `job`'s day.
+
+    Only kicks in once at least `webhook_bulk_threshold` notifications
+    (counting `job`) are waiting for that day; otherwise claims nothing.
+    The day comes from the appointment we already store, so notifications
+    about appointments we've never seen are always handled one by one.
+    """
+    if job.kind != "webhook" or settings.webhook_bulk_threshold <= 0:
+        return None, []
+    if not str(job.payload["id"]).isdigit():
+        return None, []
+    same_appointment = Job.key == func.concat("appointment:", Appointment.acuity_id)
+    start_time = db.scalar(
+        select(Appointment.start_time).where(Appointment.acuity_id == int(job.payload["id"]))
+    )
+    day = to_local_date(start_time)
+    if day is None:
+        return None, []
+
+    day_start, day_end = get_day_boundaries(day)
+    same_day = (
+        select(Job.id)
+        .join(Appointment, same_appointment)
+        .where(
+            _claimable(),
+            Job.kind == "webhook",
+            Job.id != job.id,
+            Appointment.start_time >= day_start,
+            Appointment.start_time < day_end,
+        )
+    )
+    waiting = db.scalar(select(func.count()).select_from(same_day.subquery()))
+    if waiting + 1 < settings.webhook_bulk_threshold:
+        return None, []
+
+    ids = (
+        same_day.order_by(Job.id)
+        .limit(settings.webhook_bulk_max - 1)
+        .with_for_update(of=Job, skip_locked=True)
+    )
+    return day, _claim(ids, db)
+
+
+def _finish(job_id: int, db: Session, **values) -> None:
+    db.execute(update(Job).where(Job.id == job_id).values(locked_by=None, **values))
+    db.commit()
+
+
+def retry_job(job_id: int, db: Session) -> bool:
+    """Give a dead job a fresh set of attempts"""
+    q = (
+        update(Job)
+        .where(Job.id == job_id, Job.status == JobStatus.dead)
+        .values(status=JobStatus.pending, attempts=0, available_at=func.now())
+    )
+    retried = db.execute(q).rowcount == 1
+    db.commit()
+    if retried:
+        job_workers.notify()
+    return retried
+
+
+def job_stats(db: Session, kind: Optional[str] = None) -> dict:
+    """Depth of the queue and how far behind the workers are"""
+    where = [Job.kind == kind] if kind else []
+    counts = dict(
+        db.execute(
+            select(Job.status, func.count()).where(*where).group_by(Job.status)
+        ).all()
+    )
+    oldest = db.scalar(
+        select(func.min(Job.received_at)).where(
+            Job.status.in_([JobStatus.pending, JobStatus.processing]), *where
+        )
+    )
+    lag = db.scalar(select(func.now())) - oldest if oldest else None
+    stats = {status.name: counts.get(status, 0) for status in JobStatus}
+    stats["merged"] = db.scalar(select(func.coalesce(func.sum(Job.merged_count), 0)).where(*where))
+    stats["lag_seconds"] = lag.total_seconds() if lag else 0.0
+    return stats
+
+
+class JobWorkerPool:
+    """Background workers that drain the jobs table.
+
+    Each worker claims one job at a time, so `concurrency` bounds how many
+    run at once in this process. Workers sleep between polls while the
+    queue is empty and are woken early by `notify` when a job is enqueued
+    here; jobs enqueued by other machines are picked up on the next poll.
+
+    Workers are tasks on the event loop, but every database call they make
+    runs in a thread, so a job never stalls the requests served alongside.
+    """
+
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        self._tasks: List[asyncio.Task] = []
+        self._wake: Optional[asyncio.Event] = None
+        self._stopping = False
+        self.processed = 0
+        self.failed = 0
+        self.dead = 0
+        self.bulk_listings = 0
+        self.bulk_jobs = 0
+
+    @property
+    def running(self) -> bool:
+        return any(not task.done() for task in self._tasks)
+
+    def start(self, session_factory: Callable[[], Session], client) -> None:
+        if self.running or self.concurrency < 1:
+            return
+        self._stopping = False
+        self._wake = asyncio.Event()
+        self._tasks = [
+            asyncio.create_task(self._work(session_factory, client))
+            for _ in range(self.concurrency)
+        ]
+
+    async def stop(self, timeout: Optional[float] = None) -> None:
+        """Let workers finish the job in hand, then stop them.
+
+        Whatever is still running after `timeout` is cancelled; its claim
+        expires and another worker retries it.
+        """
+        self._stopping = True
+        self.notify()
+        if self._tasks:
+            _, pending = await asyncio.wait(
+                self._tasks,
+                timeout=settings.job_drain_timeout if timeout is None else timeout,
+            )
+            for task in pending:
+                task.cancel()
+            for task in pending:
+                with suppress(asyncio.CancelledError):
+                    await task
+        self._tasks = []
+
+    def notify(self) -> None:
+        """Wake idle workers, e.g. right after a job was enqueued"""
+        if self._wake is not None:
+            self._wake.set()
+
+    async def process_next(self, db: Session, client) -> bool:
+        """Run one job; returns False when there was nothing to do"""
+        job = await asyncio.to_thread(claim_next, db)
+        if job is None:
+            return False
+
+        day, batch = await asyncio.to_thread(claim_same_day_webhooks, job, db)
+        if batch:
+            await self._run_day(day, [job, *batch], db, client)
+        else:
+            await self._run(job, db, lambda payload: JOB_HANDLERS[job.kind](payload, db, client))
+        return True
+
+    async def _run_day(self, day: str, jobs: List[Row], db: Session, client) -> None:
+        """Apply a storm of webhooks from one listing of their day.
+
+        Appointments missing from the listing (moved to another day) fall
+        back to their own fetch. Every appointment is locked before the
+        listing is fetched and until its change is applied, as a single
+        notification is, so an older listing never overwrites a newer fetch.
+        """
+        held = await asyncio.to_thread(
+            hold_appointments, [job.payload["id"] for job in jobs], db
+        )
+        try:
+            await self._apply_listing(day, jobs, db, client)
+        finally:
+            await asyncio.to_thread(release_appointments, held)
+
+    async def _apply_listing(self, day: str, jobs: List[Row], db: Session, client) -> None:
+        try:
+            listing = await client.get_appointments(
+                today=False,
+                limit=settings.webhook_bulk_listing_max,
+                priority=Priority.high,
+                min_date=day,
+                max_date=day,
+                show_all=True,
+            )
+        except CircuitOpenError:
+            for job in jobs:
+                await asyncio.to_thread(self._release, job.id, job.attempts, db)
+            return
+        except Exception as e:
+            logger.warning("Listing %s failed, fetching appointments one by one: %s", day, e)
+            listing = []
+        else:
+            self.bulk_listings += 1
+            self.bulk_jobs += len(jobs)
+            logger.info("Handling %d webhooks for %s from one listing", len(jobs), day)
+
+        by_id = {str(appt["id"]): appt for appt in listing}
+        for appt_id, appt in by_id.items():
+            appointment_cache.set(appt_id, appt)
+
+        for job in jobs:
+            details = by_id.get(str(job.payload["id"]))
+            await self._run(
+                job,
+                db,
+                lambda payload: run_webhook_job(
+                    payload, db, client, appt_details=details, held=True
+                ),
+            )
+
+    async def _run(
+        self, job: Row, db: Session, run: Callable[[dict], Awaitable[dict]]
+    ) -> None:
+        job_id, kind, payload, attempts = job.id, job.kind, job.payload, job.attempts
+
+        try:
+            result = await run(payload)
+        except CircuitOpenError:
+            await asyncio.to_thread(self._release, job_id, attempts, db)
+            return
+        except Exception as e:
+            await asyncio.to_thread(db.rollback)
+            await asyncio.to_thread(self._failed, job_id, kind, attempts, str(e), db)
+            return
+
+        self.processed += 1
+        await asyncio.to_thread(
+            _finish,
+            job_id,
+            db,
+            status=JobStatus.done,
+            processed_at=func.now(),
+            result=result,
+            last_error=None,
+        )
+
+    def _release(self, job_id: int, attempts: int, db: Session) -> None:
+        """Acuity is down: give the attempt back and try again after the reset"""
+        _finish(
+            job_id,
+            db,
+            status=JobStatus.pending,
+            attempts=attempts - 1,
+            available_at=func.now() + timedelta(seconds=settings.acuity_breaker_reset),
+        )
+
+    def _failed(self, job_id: int, kind: str, attempts: int, error: str, db: Session) -> None:
+        self.failed += 1
+        if attempts >= settings.job_max_attempts:
+            self.dead += 1
+            logger.error("Dead-lettering %s job %s: %s", kind, job_id, error)
+            _finish(job_id, db, status=JobStatus.dead, last_error=error)
+            return
+        backoff = timedelta(seconds=settings.job_poll_interval * 2 ** attempts)
+        logger.warning("Retrying %s job %s in %s: %s", kind, job_id, backoff, error)
+        _finish(
+            job_id,
+            db,
+            status=JobStatus.pending,
+            available_at=func.now() + backoff,
+            last_error=error,
+        )
+
+    async def _work(self, session_factory: Callable[[], Session], client) -> None:
+        while not self._stopping:
+            db = session_factory()
+            try:
+                had_work = await self.process_next(db, client)
+            except Exception:
+                logger.exception("Job worker failed")
+                had_work = False
+            finally:
+                await asyncio.to_thread(db.close)
+
+            if not had_work and not self._stopping:
+                self._wake.clear()
+                with suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._wake.wait(), settings.job_poll_interval)
+
+    def stats(self) -> dict:
+        return {
+            "worker_id": WORKER_ID,
+            "workers": self.concurrency,
+            "running": self.running,
+            "processed": self.processed,
+            "failed": self.failed,
+            "dead": self.dead,
+            "bulk_listings": self.bulk_listings,
+            "bulk_jobs": self.bulk_jobs,
+        }
+
+
+job_workers = JobWorkerPool(concurrency=settings.job_workers)
@@ -0,0 +1,216 @@
+"""Live schedule changes, pushed to dashboards as Server-Sent Events.
+
+Each applied webhook publishes one `schedule` message: the new Event and
+the hourly diff rows it changed. The process that applied it publishes to
+its own clients; the others hear of it with its cache invalidation, over
+LISTEN/NOTIFY, and publish to theirs. Messages are kept in a ring buffer, so a
+client reconnecting with `Last-Event-ID` gets the ones it missed. When
+they're no longer buffered, or were published by an earlier run of the
+process, it gets a `reset` message instead and should refetch /schedule
+and /schedule/diff.
+
+Every subscriber has a bounded queue. A client that falls so far behind
+that its queue fills up is disconnected once it has read what is queued,
+and resumes from the buffer when it reconnects, so one slow screen never
+holds messages in memory for everyone.
+"""
+import asyncio
+import json
+import logging
+import threading
+import uuid
+from collections import deque
+from datetime import date, datetime, timezone
+from typing import AsyncIterator, Callable, Iterable, List, Optional, Set
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.core.schedule_diff import hourly_diff
+from app.core.time_utils import to_local_date
+
+logger = logging.getLogger(__name__)
+
+
+class Message:
+    """One SSE message, encoded once for every subscriber"""
+
+    def __init__(self, seq: int, id: Optional[str], name: str, data: dict):
+        self.seq = seq
+        self.id = id
+        self.name = name
+        lines = [f"event: {name}", f"data: {json.dumps(jsonable_encoder(data))}"]
+        if id is not None:
+            lines.insert(0, f"id: {id}")
+        self.encoded = ("\n".join(lines) + "\n\n").encode()
+
+
+class Subscription:
+    def __init__(self, max_size: int):
+        self.loop = asyncio.get_running_loop()
+        self.queue: "asyncio.Queue[Message]" = asyncio.Queue(maxsize=max_size)
+        self.overflowed = False
+
+    def offer(self, message: Message) -> None:
+        """Queue a message, or mark the subscriber as too slow to keep up"""
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    @property
+    def done(self) -> bool:
+        return self.overflowed and self.queue.empty()
+
+
+class ScheduleBroker:
+    """Fans published messages out to the SSE subscribers of this process"""
+
+    def __init__(self, buffer_size: int, queue_size: int):
+        self.queue_size = queue_size
+        # Ids of an earlier run of the process mean nothing to this one
+        self.epoch = uuid.uuid4().hex[:12]
+        self._seq = 0
+        self._buffer: "deque[Message]" = deque(maxlen=buffer_size)
+        self._subscribers: Set[Subscription] = set()
+        self._lock = threading.Lock()
+        self.published = 0
+        self.disconnected = 0
+
+    def publish(self, name: str, data: dict) -> Message:
+        """Buffer a message and hand it to every subscriber.
+
+        Safe to call from any thread; subscribers get it on their own loop.
+        """
+        with self._lock:
+            self._seq += 1
+            message = Message(self._seq, f"{self.epoch}-{self._seq}", name, data)
+            self._buffer.append(message)
+            self.published += 1
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.offer, message)
+            except RuntimeError:
+                # its loop is gone, and the stream with it
+                self.unsubscribe(subscription)
+        return message
+
+    def _missed(self, last_event_id: str) -> Optional[List[Message]]:
+        """Buffered messages after `last_event_id`, or None if some are gone"""
+        epoch, _, seq = last_event_id.partition("-")
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        seq = int(seq)
+        oldest = self._buffer[0].seq if self._buffer else self._seq + 1
+        if seq < oldest - 1:
+            return None
+        return [message for message in self._buffer if message.seq > seq]
+
+    def subscribe(self, last_event_id: Optional[str] = None) -> Subscription:
+        """A new subscriber, first given what it missed since `last_event_id`"""
+        subscription = Subscription(self.queue_size)
+        with self._lock:
+            if last_event_id:
+                missed = self._missed(last_event_id)
+                if missed is None:
+                    subscription.offer(Message(self._seq, None, "reset", {}))
+                else:
+                    for message in missed:
+                        subscription.offer(message)
+            self._subscribers.add(subscription)
+        return subscription
+
+    @property
+    def has_subscribers(self) -> bool:
+        return bool(self._subscribers)
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            self._subscribers.discard(subscription)
+        if subscription.overflowed:
+            self.disconnected += 1
+
+    async def stream(self, subscription: Subscription) -> AsyncIterator[bytes]:
+        """The subscriber's messages as SSE, with a comment line while idle"""
+        try:
+            yield f"retry: {settings.live_retry_ms}\n\n".encode()
+            while not subscription.done:
+                try:
+                    message = await asyncio.wait_for(
+                        subscription.queue.get(), timeout=settings.live_heartbeat
+                    )
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+                    continue
+                yield message.encoded
+            logger.warning("Disconnecting an SSE client that fell behind")
+        finally:
+            self.unsubscribe(subscription)
+
+    def clear(self) -> None:
+        """Forget every message; resuming clients are told to reset"""
+        with self._lock:
+            self.epoch = uuid.uuid4().hex[:12]
+            self._seq = 0
+            self._buffer.clear()
+            self._subscribers.clear()
+        self.published = self.disconnected = 0
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": len(self._subscribers),
+            "buffered": len(self._buffer),
+            "published": self.published,
+            "disconnected": self.disconnected,
+        }
+
+
+schedule_broker = ScheduleBroker(
+    buffer_size=settings.live_buffer_size, queue_size=settings.live_queue_size
+)
+
+
+def changed_hours(entries: List[dict]) -> List[str]:
+    """The hours of today's diff that `entries` changed"""
+    today = date.fromisoformat(to_local_date(datetime.now(tz=timezone.utc)))
+    return sorted({entry["hour"] for entry in entries if entry["day"] == today})
+
+
+def publish_schedule_change(event_data: dict, hours: Iterable[str], db: Session) -> None:
+    """Push an applied Event, and today's diff rows at `hours`, to this process' live clients"""
+    if not schedule_broker.has_subscribers:
+        return
+    hours = set(hours)
+    schedule_broker.publish("schedule", {
+        "event": event_data,
+        "diff": hourly_diff(db, hours) if hours else [],
+    })
+
+
+def publish_remote_change(message: dict, session_factory: Callable[[], Session]) -> None:
+    """Pass a change another process applied on to this process' live clients.
+
+    A notification that names everything, e.g. after the listener
+    reconnected, may stand for changes we never heard of, so clients are
+    told to reset instead.
+    """
+    if not schedule_broker.has_subscribers:
+        return
+    if message.get("all"):
+        schedule_broker.publish("reset", {})
+        return
+    change = message.get("schedule")
+    if change is None:
+        return
+    db = session_factory()
+    try:
+        publish_schedule_change(change["event"], change["hours"], db)
+    except Exception:
+        # Live clients catch up on their next reconnect or refetch
+        logger.exception("Failed publishing a change from another process")
+    finally:
+        db.close()
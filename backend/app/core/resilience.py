@@ -0,0 +1,285 @@
+import asyncio
+import enum
+import random
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Optional
+
+from app.config import settings
+
+
+class Priority(enum.IntEnum):
+    high = 0  # webhook detail fetches and interactive lookups
+    low = 1  # bulk work: snapshots, dummy creation
+
+
+class RateLimiter:
+    """Token bucket shared by every Acuity call in this process.
+
+    Low priority calls may only take a token while more than `reserve`
+    tokens are left, so a burst of bulk work can never starve webhook
+    fetches. Thread-safe, so the sync client (run in FastAPI's threadpool)
+    and the async client draw from the same bucket.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: int,
+        reserve: int = 0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.reserve = min(reserve, burst - 1)
+        self._clock = clock
+        self._tokens = float(burst)
+        self._updated_at = clock()
+        self._lock = threading.Lock()
+        self.waits = Counter()
+        self.wait_seconds = Counter()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def try_acquire(self, priority: Priority = Priority.high) -> float:
+        """Take a token and return 0, or return how long to wait before retrying"""
+        floor = 0 if priority == Priority.high else self.reserve
+        with self._lock:
+            self._refill()
+            if self._tokens - 1 >= floor:
+                self._tokens -= 1
+                return 0.0
+            return (floor + 1 - self._tokens) / self.rate
+
+    def _record(self, priority: Priority, waited: float) -> None:
+        if waited > 0:
+            with self._lock:
+                self.waits[priority.name] += 1
+                self.wait_seconds[priority.name] += waited
+
+    def acquire(self, priority: Priority = Priority.high) -> float:
+        """Block until a token is available; returns the time spent waiting"""
+        start = self._clock()
+        while (delay := self.try_acquire(priority)) > 0:
+            time.sleep(delay)
+        waited = self._clock() - start
+        self._record(priority, waited)
+        return waited
+
+    async def acquire_async(self, priority: Priority = Priority.high) -> float:
+        """Wait, without blocking the event loop, until a token is available"""
+        start = self._clock()
+        while (delay := self.try_acquire(priority)) > 0:
+            await asyncio.sleep(delay)
+        waited = self._clock() - start
+        self._record(priority, waited)
+        return waited
+
+    def stats(self) -> dict:
+        return {
+            "rate": self.rate,
+            "burst": self.burst,
+            "reserve": self.reserve,
+            "waits": dict(self.waits),
+            "wait_seconds": {k: round(v, 3) for k, v in self.wait_seconds.items()},
+        }
+
+
+class RetryPolicy:
+    """Which Acuity failures to retry, and how long to back off in between"""
+
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+    def __init__(self, max_retries: int, backoff_base: float, backoff_max: float):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retries = Counter()
+
+    def should_retry(
+        self, attempt: int, status: Optional[int] = None, idempotent: bool = True
+    ) -> bool:
+        """`status` is None for transport errors (timeouts, resets)"""
+        if attempt >= self.max_retries:
+            return False
+        if not idempotent:
+            # a POST that failed mid-flight may already have booked the slot;
+            # only a 429 guarantees Acuity rejected it untouched
+            return status == 429
+        return status is None or status in self.RETRY_STATUSES
+
+    def delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """Seconds to sleep before retry number `attempt + 1`"""
+        server_delay = parse_retry_after(retry_after)
+        if server_delay is not None:
+            return min(server_delay, self.backoff_max)
+        # "full jitter" exponential backoff
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def record(self, status: Optional[int]) -> None:
+        self.retries[str(status) if status else "transport_error"] += 1
+
+    def stats(self) -> dict:
+        return {"max_retries": self.max_retries, "retries": dict(self.retries)}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling Acuity while the circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """Fail fast while Acuity is degraded.
+
+    After `failure_threshold` failed calls in a row the circuit opens and
+    every call raises CircuitOpenError. Once `reset_timeout` has passed a
+    single trial call is let through (half open): success closes the
+    circuit, failure opens it for another `reset_timeout`.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int,
+        reset_timeout: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if self._clock() - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def before_call(self) -> None:
+        """Raise CircuitOpenError unless this call may go to Acuity"""
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return
+            if state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+            self.rejected += 1
+        raise CircuitOpenError(f"Acuity circuit is {state}")
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or self._failures >= self.failure_threshold:
+                self._opened_at = self._clock()
+            self._trial_in_flight = False
+
+    def abandon(self) -> None:
+        """The call was cancelled before it told us anything about Acuity"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def reset(self) -> None:
+        self.record_success()
+        self.rejected = 0
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self._failures,
+            "rejected": self.rejected,
+        }
+
+
+class LatencyTracker:
+    """Rolling window of call latencies, to pick a hedging delay"""
+
+    def __init__(self, window: int = 200):
+        self._samples: "deque[float]" = deque(maxlen=window)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+
+async def hedged(call: Callable[[], Awaitable[Any]], delay: float) -> Any:
+    """Run `call`; if it hasn't finished after `delay`, race a second copy.
+
+    Returns whichever finishes first successfully and cancels the other.
+    Only use for idempotent reads.
+    """
+    first = asyncio.ensure_future(call())
+    done, _ = await asyncio.wait({first}, timeout=delay)
+    if done:
+        return first.result()
+
+    second = asyncio.ensure_future(call())
+    pending = {first, second}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+            if not pending:
+                # both failed: surface the first request's error
+                return first.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header, given either in seconds or as an HTTP date"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+acuity_rate_limiter = RateLimiter(
+    rate=settings.acuity_rate_limit,
+    burst=settings.acuity_rate_burst,
+    reserve=settings.acuity_priority_reserve,
+)
+acuity_retry_policy = RetryPolicy(
+    max_retries=settings.acuity_max_retries,
+    backoff_base=settings.acuity_backoff_base,
+    backoff_max=settings.acuity_backoff_max,
+)
+acuity_circuit_breaker = CircuitBreaker(
+    failure_threshold=settings.acuity_breaker_threshold,
+    reset_timeout=settings.acuity_breaker_reset,
+)
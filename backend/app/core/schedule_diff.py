@@ -0,0 +1,175 @@
+"""Hourly schedule diff entries, kept up to date as events are written.
+
+Every Event flushed through the ORM adds its diff entries in the same
+flush, so they commit or roll back with it. Reading a day's diff is then
+one range scan instead of a pass over the event log.
+
+    python -m app.core.schedule_diff [--day YYYY-MM-DD]
+
+rebuilds the entries from the event log.
+"""
+import argparse
+import logging
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import and_, delete, event as sa_event, insert, or_, select
+from sqlalchemy.orm import Session
+from zoneinfo import ZoneInfo
+
+from app.models import Appointment, DiffChange, Event, EventAction, ScheduleDiffEntry
+from app.core.schedule_revisions import bump_revisions
+from app.core.time_utils import get_center_opening_hours, get_day_boundaries, get_today_boundaries
+
+logger = logging.getLogger(__name__)
+
+# Rows per INSERT when rebuilding
+REBUILD_CHUNK_SIZE = 1000
+
+
+def _local(value: datetime) -> datetime:
+    # times without a zone are UTC, as stored in the db
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=ZoneInfo('UTC'))
+    return value.astimezone(ZoneInfo('America/Denver'))
+
+
+def diff_entries(event: Event) -> List[dict]:
+    """Column values of the diff entries an event contributes"""
+    changes = []
+    match event.action:
+        case EventAction.schedule | EventAction.reschedule_incoming:
+            changes.append((DiffChange.added, event.new_time))
+        case EventAction.cancel | EventAction.reschedule_outgoing:
+            changes.append((DiffChange.deleted, event.old_time))
+        case EventAction.reschedule_same_day:
+            changes.append((DiffChange.deleted, event.old_time))
+            changes.append((DiffChange.added, event.new_time))
+        case _:
+            logger.warning(f"Unknown action: {event.action} for id {event.id}")
+
+    entries = []
+    for change, time in changes:
+        if time is None:
+            logger.error(f"Event {event.id} has no time for its {change.name} entry")
+            continue
+        local = _local(time)
+        entries.append(dict(
+            day=local.date(),
+            hour=local.strftime("%H:%M"),
+            change=change,
+            appointment_id=event.appointment_id,
+            event_id=event.id,
+            event_created_at=event.created_at,
+        ))
+    return entries
+
+
+@sa_event.listens_for(Session, "before_flush")
+def _add_diff_entries(session: Session, flush_context, instances) -> None:
+    for obj in list(session.new):
+        if not isinstance(obj, Event):
+            continue
+        # the entries need these before the column defaults would apply
+        if obj.id is None:
+            obj.id = uuid.uuid4()
+        if obj.created_at is None:
+            obj.created_at = datetime.now(tz=timezone.utc)
+        session.add_all(ScheduleDiffEntry(**values) for values in diff_entries(obj))
+
+
+def day_entries(day: date, created_from: datetime, created_to: datetime, db: Session):
+    """(entry, first name, last name) for a day's entries from events in the window"""
+    return db.execute(
+        select(ScheduleDiffEntry, Appointment.first_name, Appointment.last_name)
+        .join(Appointment, Appointment.id == ScheduleDiffEntry.appointment_id)
+        .where(
+            ScheduleDiffEntry.day == day,
+            ScheduleDiffEntry.event_created_at >= created_from,
+            ScheduleDiffEntry.event_created_at < created_to,
+        )
+        .order_by(ScheduleDiffEntry.event_created_at, ScheduleDiffEntry.id)
+    ).all()
+
+
+def _initialize_hourly_diffs(day_of_week: int) -> Dict[str, dict]:
+    hourly_diffs: Dict[str, dict] = {}
+    center_open, center_close = get_center_opening_hours(day_of_week, in_utc=False)
+    hours_open = int((center_close - center_open).total_seconds() // 3600)
+
+    for i in range(hours_open):
+        hour = datetime.strftime(center_open + timedelta(hours=i), "%H:%M")
+        hourly_diffs[hour] = {"hour": hour, "added": [], "deleted": []}
+    return hourly_diffs
+
+
+def hourly_diff(db: Session, hours: Optional[Iterable[str]] = None) -> List[dict]:
+    """Today's appointments added and deleted per opening hour, or only of `hours`"""
+    center_open, center_close = get_center_opening_hours()
+    _, _, today_day_of_week = get_today_boundaries()
+    today = center_open.astimezone(ZoneInfo('America/Denver')).date()
+
+    # the events created during center open hours, after the snapshot,
+    # about today's slots
+    entries = day_entries(today, center_open - timedelta(minutes=30), center_close, db)
+    hourly_diffs = _initialize_hourly_diffs(today_day_of_week)
+
+    for entry, first_name, last_name in entries:
+        if entry.hour not in hourly_diffs:
+            logger.warning(f"Event {entry.event_id} is outside opening hours: {entry.hour}")
+            continue
+        simple_event = {"id": entry.appointment_id, "first_name": first_name, "last_name": last_name}
+        if entry.change == DiffChange.added:
+            hourly_diffs[entry.hour]["added"].append(simple_event)
+        else:
+            hourly_diffs[entry.hour]["deleted"].append(simple_event)
+
+    if hours is not None:
+        hours = set(hours)
+        return [diff for hour, diff in hourly_diffs.items() if hour in hours]
+    return list(hourly_diffs.values())
+
+
+def rebuild_diff_entries(db: Session, day: Optional[date] = None) -> int:
+    """Replace the diff entries, of one day or all, with ones derived from the events"""
+    q = delete(ScheduleDiffEntry).returning(ScheduleDiffEntry.day)
+    if day is not None:
+        q = q.where(ScheduleDiffEntry.day == day)
+    days = set(db.scalars(q))
+
+    events = select(Event).order_by(Event.created_at)
+    if day is not None:
+        day_start, day_end = get_day_boundaries(day.isoformat())
+        events = events.where(or_(
+            and_(Event.old_time >= day_start, Event.old_time < day_end),
+            and_(Event.new_time >= day_start, Event.new_time < day_end),
+        ))
+    rows = []
+    for event in db.scalars(events):
+        rows.extend(
+            values for values in diff_entries(event)
+            if day is None or values["day"] == day
+        )
+    for start in range(0, len(rows), REBUILD_CHUNK_SIZE):
+        db.execute(insert(ScheduleDiffEntry), rows[start:start + REBUILD_CHUNK_SIZE])
+    days.update(values["day"] for values in rows)
+    if day is not None:
+        days.add(day)
+    bump_revisions(days, db)
+    db.commit()
+    logger.info("Rebuilt %d schedule diff entries", len(rows))
+    return len(rows)
+
+
+if __name__ == "__main__":
+    from app.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Rebuild the hourly schedule diff")
+    parser.add_argument("--day", type=date.fromisoformat, help="only this day, YYYY-MM-DD")
+    args = parser.parse_args()
+    db = SessionLocal()
+    try:
+        print(rebuild_diff_entries(db, args.day))
+    finally:
+        db.close()
@@ -0,0 +1,166 @@
+import asyncio
+import logging
+from datetime import date, datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, or_, select
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models import Appointment, Event, EventAction, ScheduleCheckpoint, Snapshot
+from app.types import AcuityAppointment
+from app.core.snapshot_store import load_dump
+from app.core.time_utils import get_day_boundaries, to_local_date
+
+logger = logging.getLogger(__name__)
+
+# acuity id -> the appointment as it stood; start_time as naive UTC ISO,
+# like the events' times
+ScheduleState = Dict[int, dict]
+
+
+def _naive_utc(value: datetime) -> datetime:
+    """Events and snapshots are timestamped in naive UTC"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _state_from_dump(dump: List[dict], day: str) -> ScheduleState:
+    state = {}
+    for appt_data in dump:
+        appt = AcuityAppointment(**appt_data)
+        start = datetime.fromisoformat(appt.datetime)
+        if to_local_date(start) != day:
+            continue
+        state[appt.id] = {
+            "acuity_id": appt.id,
+            "first_name": appt.firstName,
+            "last_name": appt.lastName,
+            "start_time": _naive_utc(start).isoformat(),
+            "duration": int(appt.duration),
+            "is_canceled": appt.canceled,
+        }
+    return state
+
+
+def _base(day: str, as_of: datetime, db: Session) -> Tuple[datetime, ScheduleState]:
+    """The latest known state of `day` at or before `as_of`: a checkpoint or a snapshot"""
+    checkpoint = db.scalars(
+        select(ScheduleCheckpoint)
+        .where(ScheduleCheckpoint.day == date.fromisoformat(day), ScheduleCheckpoint.as_of <= as_of)
+        .order_by(ScheduleCheckpoint.as_of.desc())
+        .limit(1)
+    ).first()
+    snapshot = db.scalars(
+        select(Snapshot)
+        .where(Snapshot.timestamp <= as_of)
+        .order_by(Snapshot.timestamp.desc())
+        .limit(1)
+    ).first()
+
+    if checkpoint is not None and (snapshot is None or checkpoint.as_of >= snapshot.timestamp):
+        return checkpoint.as_of, {int(k): v for k, v in checkpoint.state.items()}
+    if snapshot is not None:
+        return snapshot.timestamp, _state_from_dump(load_dump(snapshot, db), day)
+    return datetime.min, {}
+
+
+def _replay(
+    state: ScheduleState, day: str, since: datetime, until: datetime, db: Session
+) -> Tuple[int, Optional[datetime]]:
+    """Apply the events about `day` in (since, until] to `state`.
+
+    Returns how many were applied and when the last one happened.
+    """
+    day_start, day_end = (_naive_utc(t) for t in get_day_boundaries(day))
+    events = db.execute(
+        select(
+            Event.action,
+            Event.new_time,
+            Event.created_at,
+            Appointment.acuity_id,
+            Appointment.first_name,
+            Appointment.last_name,
+            Appointment.duration,
+        )
+        .join(Event.appointment)
+        .where(
+            Event.created_at > since,
+            Event.created_at <= until,
+            or_(
+                and_(Event.old_time >= day_start, Event.old_time < day_end),
+                and_(Event.new_time >= day_start, Event.new_time < day_end),
+            ),
+        )
+        .order_by(Event.created_at)
+    ).all()
+
+    for action, new_time, _, acuity_id, first_name, last_name, duration in events:
+        match action:
+            case EventAction.schedule | EventAction.reschedule_incoming | EventAction.reschedule_same_day:
+                state[acuity_id] = {
+                    **state.get(acuity_id, {}),
+                    "acuity_id": acuity_id,
+                    "first_name": first_name,
+                    "last_name": last_name,
+                    "start_time": _naive_utc(new_time).isoformat(),
+                    "duration": duration,
+                    "is_canceled": False,
+                }
+            case EventAction.cancel:
+                if acuity_id in state:
+                    state[acuity_id]["is_canceled"] = True
+            case EventAction.reschedule_outgoing:
+                # moved to another day
+                state.pop(acuity_id, None)
+    return len(events), events[-1].created_at if events else None
+
+
+def schedule_as_of(as_of: datetime, db: Session) -> List[dict]:
+    """The schedule of `as_of`'s day as it stood at that moment.
+
+    Starts from the latest checkpoint or snapshot before `as_of` and
+    replays the events since.
+    """
+    as_of = _naive_utc(as_of)
+    day = to_local_date(as_of)
+    base_at, state = _base(day, as_of, db)
+    _replay(state, day, base_at, as_of, db)
+    return sorted(state.values(), key=lambda appt: appt["start_time"])
+
+
+def materialize_checkpoint(at: datetime, db: Session) -> Optional[ScheduleCheckpoint]:
+    """Store the schedule of `at`'s day as of `at`, if events changed it since the last base"""
+    at = _naive_utc(at)
+    day = to_local_date(at)
+    base_at, state = _base(day, at, db)
+    replayed, last_event_at = _replay(state, day, base_at, at, db)
+    if not replayed:
+        return None
+    checkpoint = ScheduleCheckpoint(
+        day=date.fromisoformat(day),
+        as_of=at,
+        state={str(acuity_id): appt for acuity_id, appt in state.items()},
+        events=replayed,
+    )
+    db.add(checkpoint)
+    db.commit()
+    logger.info(
+        "Checkpointed %s after %d events, the last at %s", day, replayed, last_event_at
+    )
+    return checkpoint
+
+
+async def run_checkpoints(session_factory: Callable[[], Session]) -> None:
+    """Checkpoint today's schedule every `schedule_checkpoint_interval` seconds"""
+    while True:
+        await asyncio.sleep(settings.schedule_checkpoint_interval)
+        db = session_factory()
+        try:
+            materialize_checkpoint(datetime.now(tz=timezone.utc), db)
+        except Exception:
+            db.rollback()
+            logger.exception("Failed checkpointing the schedule")
+        finally:
+            db.close()
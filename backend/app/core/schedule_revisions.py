@@ -0,0 +1,73 @@
+"""Per-day schedule revisions, and responses cached and tagged by them.
+
+Every write that can change a day's schedule bumps the day's revision in
+the same transaction, so (day, revision) names one state of the day on
+every app machine. Read endpoints use it as their ETag and as the key of
+their serialized response: a poll with a matching If-None-Match costs one
+primary key lookup, and one without rebuilds the body only once per
+revision and machine.
+"""
+import json
+from datetime import date
+from typing import Any, Callable, Iterable
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app.models import ScheduleRevision
+from app.core.cache import schedule_cache
+from app.core.time_utils import to_local_date
+
+
+def bump_revisions(days: Iterable[Any], db: Session) -> None:
+    """Bump the revision of every day touched by `days` (dates or timestamps).
+
+    Locks the days' revision rows until the transaction ends, in day
+    order so concurrent writers can't deadlock.
+    """
+    days = sorted({date.fromisoformat(to_local_date(day)) for day in days if day is not None})
+    if not days:
+        return
+    q = pg_insert(ScheduleRevision).values([{"day": day, "revision": 1} for day in days])
+    q = q.on_conflict_do_update(
+        index_elements=[ScheduleRevision.day],
+        set_={"revision": ScheduleRevision.revision + 1, "updated_at": func.now()},
+    )
+    db.execute(q)
+
+
+def current_revision(day: date, db: Session) -> int:
+    return db.scalar(select(ScheduleRevision.revision).where(ScheduleRevision.day == day)) or 0
+
+
+def _etag(day: date, revision: int) -> str:
+    return f'"{day.isoformat()}.{revision}"'
+
+
+def _matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if header is None:
+        return False
+    tags = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return "*" in tags or etag in tags
+
+
+def revisioned_response(
+    request: Request, resource: str, day: date, db: Session, build: Callable[[], Any]
+) -> Response:
+    """`build()`'s result as JSON, or 304 when the client already has this revision"""
+    revision = current_revision(day, db)
+    etag = _etag(day, revision)
+    # Clients must revalidate, which is what lets them skip the body
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    body = schedule_cache.get_or_compute(
+        (resource, day, revision),
+        lambda: json.dumps(jsonable_encoder(build())).encode(),
+    )
+    return Response(content=body, media_type="application/json", headers=headers)
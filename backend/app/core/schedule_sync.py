@@ -0,0 +1,138 @@
+"""Delta syncs of today's schedule.
+
+Every appointment row, and every tombstone left by one deleted or moved,
+carries the id of the transaction that last wrote it. A sync hands out
+the oldest transaction id still running when it looked as its revision:
+everything written by older transactions had committed by then, so a
+client that sends the revision back only needs the rows written at or
+after it. A few of those may repeat what it already has.
+
+Purging old tombstones raises the sync floor above every revision they
+carried. A revision below the floor may need a purged tombstone, and is
+answered with all of today's appointments instead. Until the first purge
+every revision is good, so deltas work from the start.
+"""
+from datetime import date, datetime, timedelta, timezone
+from typing import List
+
+from sqlalchemy import delete, exists, func, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models import (
+    Appointment,
+    AppointmentTombstone,
+    Event,
+    ScheduleRevision,
+)
+from app.core.time_utils import get_day_boundaries, to_local_date
+
+# Transactions older than this had all finished when the statement started
+SNAPSHOT_XMIN = text("pg_snapshot_xmin(pg_current_snapshot())::text::bigint")
+
+
+def _today() -> date:
+    return date.fromisoformat(to_local_date(datetime.now(tz=timezone.utc)))
+
+
+def purge_tombstones(db: Session) -> int:
+    """Drop tombstones older than the retention window, raising the floor above them.
+
+    The floor is kept on today's revision row; it only ever goes up.
+    """
+    purged = (
+        delete(AppointmentTombstone)
+        .where(
+            AppointmentTombstone.deleted_at
+            < func.now() - timedelta(days=settings.tombstone_retention_days)
+        )
+        .returning(AppointmentTombstone.revision)
+        .cte("purged")
+    )
+    count, highest = db.execute(select(func.count(), func.max(purged.c.revision))).one()
+    if highest is not None:
+        q = pg_insert(ScheduleRevision).values(day=_today(), revision=0, sync_floor=highest + 1)
+        db.execute(q.on_conflict_do_update(
+            index_elements=[ScheduleRevision.day],
+            set_={"sync_floor": func.greatest(ScheduleRevision.sync_floor, q.excluded.sync_floor)},
+        ))
+    return count
+
+
+def sync_floor(db: Session) -> int:
+    """The smallest revision a delta can be built from.
+
+    1 before any purge: only 0, which asks for the whole day, is below it.
+    """
+    return db.scalar(select(func.coalesce(func.max(ScheduleRevision.sync_floor), 1)))
+
+
+def _full(day_start: datetime, day_end: datetime, db: Session) -> List[Appointment]:
+    return db.scalars(
+        select(Appointment)
+        .where(Appointment.start_time >= day_start, Appointment.start_time < day_end)
+        .order_by(Appointment.start_time)
+    ).all()
+
+
+def schedule_since(since: int, db: Session) -> dict:
+    """Today's appointments written at or after revision `since`, and the ones gone.
+
+    `appointments` are the changed ones, `removed` the ids of appointments
+    deleted from today or moved off it. `full` is set when `appointments`
+    is the whole day instead, because `since` is 0 or below the sync
+    floor, or too much changed.
+    """
+    day = _today()
+    day_start, day_end = get_day_boundaries(day.isoformat())
+    floor = sync_floor(db)
+    # Read before the rows, so nothing committed after it is missed
+    revision = db.scalar(select(SNAPSHOT_XMIN))
+
+    result = {"day": day.isoformat(), "revision": revision, "full": True, "removed": []}
+    if since < floor:
+        result["appointments"] = _full(day_start, day_end, db)
+        return result
+
+    changed = db.scalars(
+        select(Appointment)
+        .where(
+            Appointment.revision >= since,
+            Appointment.start_time >= day_start,
+            Appointment.start_time < day_end,
+        )
+        .order_by(Appointment.start_time)
+        .limit(settings.schedule_delta_max + 1)
+    ).all()
+    if len(changed) > settings.schedule_delta_max:
+        result["appointments"] = _full(day_start, day_end, db)
+        return result
+
+    # Moved off today by a webhook, which recorded the move as an Event...
+    moved = select(Appointment.id).where(
+        Appointment.revision >= since,
+        (Appointment.start_time < day_start) | (Appointment.start_time >= day_end),
+        exists().where(
+            Event.appointment_id == Appointment.id,
+            Event.old_time >= day_start,
+            Event.old_time < day_end,
+        ),
+    )
+    # ...or deleted, or moved by a snapshot or backfill, which left a tombstone
+    left = select(AppointmentTombstone.appointment_id).where(
+        AppointmentTombstone.revision >= since,
+        AppointmentTombstone.start_time >= day_start,
+        AppointmentTombstone.start_time < day_end,
+    )
+    still_today = {appt.id for appt in changed}
+    result.update(
+        full=False,
+        appointments=changed,
+        # a client that never had them just ignores them
+        removed=[
+            appt_id for appt_id in db.scalars(moved.union(left))
+            if appt_id not in still_today
+        ],
+    )
+    return result
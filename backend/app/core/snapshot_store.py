@@ -0,0 +1,217 @@
+"""Content-addressed storage of raw Acuity listings taken by snapshots.
+
+Each appointment record is stored once, as compressed JSON keyed by its
+sha256, however many snapshots contain it. A snapshot points at a
+manifest blob, which is either
+
+- full: the listing's `[acuity id, record hash]` entries in order, or
+- a delta against a full base snapshot: the entries added, the ids
+  removed and the entries changed, with the fields that changed.
+
+A delta never builds on another delta, so any snapshot is rebuilt from
+at most two manifests.
+"""
+import hashlib
+import json
+import uuid
+import zlib
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models import Snapshot, SnapshotBlob
+
+# Rows per INSERT, well under Postgres' 65535 bind parameter limit
+BLOB_CHUNK_SIZE = 1000
+
+Entry = Tuple[int, str]  # (acuity id, record hash)
+
+
+def _encode(value) -> Tuple[str, bytes]:
+    """Content hash and canonical JSON of a value"""
+    raw = json.dumps(value, sort_keys=True, separators=(",", ":")).encode()
+    return hashlib.sha256(raw).hexdigest(), raw
+
+
+def _blob(raw: bytes) -> dict:
+    return {"data": zlib.compress(raw), "size": len(raw)}
+
+
+def _unpack(blob: SnapshotBlob):
+    return json.loads(zlib.decompress(blob.data))
+
+
+def _store_blobs(blobs: Dict[str, dict], db: Session) -> None:
+    rows = [{"hash": digest, **blob} for digest, blob in blobs.items()]
+    for start in range(0, len(rows), BLOB_CHUNK_SIZE):
+        db.execute(
+            pg_insert(SnapshotBlob)
+            .values(rows[start:start + BLOB_CHUNK_SIZE])
+            .on_conflict_do_nothing(index_elements=[SnapshotBlob.hash])
+        )
+
+
+def _load_blobs(hashes: Iterable[str], db: Session) -> dict:
+    """Unpacked blobs by hash, in one query"""
+    hashes = set(hashes)
+    if not hashes:
+        return {}
+    return {
+        blob.hash: _unpack(blob)
+        for blob in db.scalars(select(SnapshotBlob).where(SnapshotBlob.hash.in_(hashes)))
+    }
+
+
+def changed_fields(before: dict, after: dict) -> List[str]:
+    return sorted(field for field in before.keys() | after.keys() if before.get(field) != after.get(field))
+
+
+def _apply_delta(entries: List[Entry], delta: dict) -> List[Entry]:
+    removed = set(delta["removed"])
+    changed = {acuity_id: digest for acuity_id, digest, _ in delta["changed"]}
+    kept = [
+        (acuity_id, changed.get(acuity_id, digest))
+        for acuity_id, digest in entries
+        if acuity_id not in removed
+    ]
+    return kept + [(acuity_id, digest) for acuity_id, digest in delta["added"]]
+
+
+def load_entries(snapshot: Snapshot, db: Session) -> List[Entry]:
+    """A snapshot's (acuity id, record hash) entries, without loading the records"""
+    if snapshot.base_id is None:
+        manifest = _load_blobs([snapshot.manifest], db)[snapshot.manifest]
+        return [(acuity_id, digest) for acuity_id, digest in manifest]
+    base = db.get(Snapshot, snapshot.base_id)
+    manifests = _load_blobs([base.manifest, snapshot.manifest], db)
+    base_entries = [(acuity_id, digest) for acuity_id, digest in manifests[base.manifest]]
+    return _apply_delta(base_entries, manifests[snapshot.manifest])
+
+
+def load_dump(snapshot: Snapshot, db: Session) -> List[dict]:
+    """The raw Acuity listing a snapshot was taken from.
+
+    Full snapshots come back in listing order; for a delta, appointments
+    added since the base come last.
+    """
+    entries = load_entries(snapshot, db)
+    records = _load_blobs((digest for _, digest in entries), db)
+    return [records[digest] for _, digest in entries]
+
+
+def _delta(
+    base_entries: List[Entry], entries: List[Entry], records: Dict[str, dict], db: Session
+) -> dict:
+    before, after = dict(base_entries), dict(entries)
+    changed_ids = [
+        acuity_id for acuity_id, digest in after.items()
+        if acuity_id in before and before[acuity_id] != digest
+    ]
+    old_records = _load_blobs((before[acuity_id] for acuity_id in changed_ids), db)
+    return {
+        "added": [[acuity_id, digest] for acuity_id, digest in after.items() if acuity_id not in before],
+        "removed": sorted(before.keys() - after.keys()),
+        "changed": [
+            [
+                acuity_id,
+                after[acuity_id],
+                changed_fields(old_records[before[acuity_id]], records[after[acuity_id]]),
+            ]
+            for acuity_id in changed_ids
+        ],
+    }
+
+
+def _delta_size(delta: dict) -> int:
+    return len(delta["added"]) + len(delta["removed"]) + len(delta["changed"])
+
+
+def record_snapshot(appointments: List[dict], db: Session) -> Tuple[Snapshot, bool]:
+    """Add a snapshot of `appointments`, or count a repeat of the latest one.
+
+    New snapshots are stored as a delta against the latest full base,
+    unless that base already has `snapshot_base_interval` deltas or the
+    delta would be too big, in which case they become the new base.
+    Returns the snapshot and whether it was unchanged since the last one.
+    """
+    records, encoded, entries = {}, {}, []
+    for appt_data in appointments:
+        digest, encoded[digest] = _encode(appt_data)
+        records[digest] = appt_data
+        entries.append((int(appt_data["id"]), digest))
+    content_hash, full_manifest = _encode(entries)
+
+    now = datetime.now(tz=timezone.utc)
+    latest = db.scalars(
+        select(Snapshot).order_by(Snapshot.last_taken_at.desc()).limit(1).with_for_update()
+    ).first()
+    if latest is not None and latest.content_hash == content_hash:
+        latest.repeat_count += 1
+        latest.last_taken_at = now
+        return latest, True
+
+    base_id, delta = None, None
+    if latest is not None:
+        base = latest if latest.base_id is None else db.get(Snapshot, latest.base_id)
+        deltas = db.scalar(select(func.count()).where(Snapshot.base_id == base.id))
+        if deltas < settings.snapshot_base_interval:
+            delta = _delta(load_entries(base, db), entries, records, db)
+            if _delta_size(delta) <= len(entries) * settings.snapshot_delta_max_ratio:
+                base_id = base.id
+            else:
+                delta = None
+
+    if delta is None:
+        new_digests = list(encoded)
+        manifest, manifest_raw = content_hash, full_manifest
+    else:
+        # The base already holds every record the delta doesn't name
+        new_digests = [digest for _, digest in delta["added"]]
+        new_digests += [digest for _, digest, _ in delta["changed"]]
+        manifest, manifest_raw = _encode(delta)
+
+    blobs = {digest: _blob(encoded[digest]) for digest in new_digests}
+    blobs[manifest] = _blob(manifest_raw)
+    _store_blobs(blobs, db)
+
+    snapshot = Snapshot(
+        id=uuid.uuid4(),
+        timestamp=now,
+        manifest=manifest,
+        content_hash=content_hash,
+        base_id=base_id,
+        count=len(appointments),
+        last_taken_at=now,
+    )
+    db.add(snapshot)
+    return snapshot, False
+
+
+def diff_snapshots(before: Snapshot, after: Snapshot, db: Session) -> dict:
+    """Appointments added, removed and changed between two snapshots.
+
+    Compares record hashes per appointment, so only the records of
+    changed appointments are loaded, to name their changed fields.
+    """
+    old, new = dict(load_entries(before, db)), dict(load_entries(after, db))
+    changed_ids = sorted(
+        acuity_id for acuity_id in old.keys() & new.keys() if old[acuity_id] != new[acuity_id]
+    )
+    records = _load_blobs(
+        [old[acuity_id] for acuity_id in changed_ids] + [new[acuity_id] for acuity_id in changed_ids],
+        db,
+    )
+    return {
+        "from": str(before.id),
+        "to": str(after.id),
+        "added": sorted(new.keys() - old.keys()),
+        "removed": sorted(old.keys() - new.keys()),
+        "changed": {
+            acuity_id: changed_fields(records[old[acuity_id]], records[new[acuity_id]])
+            for acuity_id in changed_ids
+        },
+    }
@@ -0,0 +1,149 @@
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+
+from sqlalchemy import delete, func, insert, literal_column, or_, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session, aliased
+
+from app.config import settings
+from app.models import CURRENT_XID, Appointment, AppointmentTombstone
+from app.types import AcuityAppointment
+from app.core.invalidation import evict, publish_invalidation
+from app.core.schedule_revisions import bump_revisions
+from app.core.schedule_sync import purge_tombstones
+from app.core.snapshot_store import record_snapshot
+from app.core.time_utils import get_day_boundaries, to_local_date
+from app.core.type_conversion import acuity_to_appointment_values
+
+
+# Rows per INSERT, well under Postgres' 65535 bind parameter limit
+UPSERT_CHUNK_SIZE = 1000
+
+
+def _upsert_appointments(rows: List[dict], db: Session) -> Tuple[int, int]:
+    """Insert new appointments and update changed ones; returns (inserted, updated).
+
+    Rows Acuity didn't change are left alone, so they keep their revision
+    and stay out of delta syncs. A row whose start time moves leaves a
+    tombstone at the old one, so a delta of the day it left drops it.
+    """
+    inserted = updated = 0
+    for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+        q = pg_insert(Appointment).values(rows[start:start + UPSERT_CHUNK_SIZE])
+        q = q.on_conflict_do_update(
+            index_elements=[Appointment.acuity_id],
+            set_={
+                "start_time": q.excluded.start_time,
+                "is_canceled": q.excluded.is_canceled,
+                "last_modified_here": func.now(),
+                "revision": CURRENT_XID,
+            },
+            where=or_(
+                Appointment.start_time.is_distinct_from(q.excluded.start_time),
+                Appointment.is_canceled.is_distinct_from(q.excluded.is_canceled),
+            ),
+        ).returning(
+            Appointment.id,
+            Appointment.start_time,
+            # xmax is 0 for a freshly inserted row version
+            literal_column("xmax = 0").label("inserted"),
+        )
+        upserted = q.cte("upserted")
+        # The statement's other parts still see the rows as they were before it
+        before = aliased(Appointment)
+        moved = insert(AppointmentTombstone).from_select(
+            ["appointment_id", "acuity_id", "start_time"],
+            select(before.id, before.acuity_id, before.start_time)
+            .join(upserted, upserted.c.id == before.id)
+            .where(~upserted.c.inserted, before.start_time != upserted.c.start_time),
+        ).cte("moved")
+        for was_inserted in db.scalars(select(upserted.c.inserted).add_cte(moved)):
+            if was_inserted:
+                inserted += 1
+            else:
+                updated += 1
+    return inserted, updated
+
+
+def snapshot_days(horizon_days: Optional[int] = None) -> Tuple[date, date]:
+    """First and last local day a snapshot covers: today and `horizon_days` after it"""
+    if horizon_days is None:
+        horizon_days = settings.snapshot_horizon_days
+    today = date.fromisoformat(to_local_date(datetime.now(tz=timezone.utc)))
+    return today, today + timedelta(days=horizon_days)
+
+
+def snapshot_listing(horizon_days: Optional[int] = None) -> dict:
+    """get_appointments arguments for the snapshot horizon"""
+    first, last = snapshot_days(horizon_days)
+    if first == last:
+        return {"today": True}
+    return {"today": False, "min_date": first.isoformat(), "max_date": last.isoformat()}
+
+
+def save_snapshot(
+    appointments: List[dict], db: Session, horizon_days: Optional[int] = None
+) -> dict:
+    """Store the horizon's appointments from Acuity and sync the appointments table to them.
+
+    Set-based: the whole response is validated up front, then written with
+    one upsert per chunk and one delete, whatever the number of appointments.
+    """
+    # Validate everything before writing anything; later duplicates win
+    validated = {}
+    for appt_data in appointments:
+        acuity_appt = AcuityAppointment(**appt_data)
+        validated[acuity_appt.id] = acuity_to_appointment_values(acuity_appt)
+
+    # Create snapshot record, unless nothing changed since the last one
+    snapshot, unchanged = record_snapshot(appointments, db)
+    snapshot_id = snapshot.id
+
+    # Find and delete appointments in the horizon that no longer exist in
+    # Acuity, leaving tombstones for delta syncs, in one statement
+    first, last = snapshot_days(horizon_days)
+    horizon_start, _ = get_day_boundaries(first.isoformat())
+    _, horizon_end = get_day_boundaries(last.isoformat())
+    gone = (
+        delete(Appointment)
+        .where(
+            Appointment.acuity_id.notin_(list(validated)),
+            Appointment.start_time >= horizon_start,
+            Appointment.start_time < horizon_end,
+        )
+        .returning(Appointment.id, Appointment.acuity_id, Appointment.start_time)
+        .cte("gone")
+    )
+    deleted_count = db.execute(
+        insert(AppointmentTombstone).from_select(
+            ["appointment_id", "acuity_id", "start_time"],
+            select(gone.c.id, gone.c.acuity_id, gone.c.start_time),
+        )
+    ).rowcount
+
+    rows = [{"id": uuid.uuid4(), **values} for values in validated.values()]
+    inserted, updated = _upsert_appointments(rows, db)
+    days = [first + timedelta(days=i) for i in range((last - first).days + 1)]
+    bump_revisions(days, db)
+    # Acuity's view of these days replaces ours in every app process
+    invalidation = publish_invalidation(
+        db, dates=[day.isoformat() for day in days], appointments=validated
+    )
+
+    purge_tombstones(db)
+
+    db.commit()
+    # Our own listener skips our notifications, so evict here too
+    evict(invalidation)
+    return {
+        "message": "Snapshot and appointments saved successfully",
+        "snapshot_id": str(snapshot_id),
+        "unchanged": unchanged,
+        "count": len(appointments),
+        "inserted": inserted,
+        "updated": updated,
+        "deleted_count": deleted_count,
+        "from": first.isoformat(),
+        "to": last.isoformat(),
+    }
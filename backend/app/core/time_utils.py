@@ -1,5 +1,5 @@
-from datetime import datetime, timedelta, timezone
-from typing import Tuple
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Optional, Tuple
 from zoneinfo import ZoneInfo
 from app.config import settings
 
@@ -19,6 +19,13 @@ def get_today_boundaries(in_utc = True) -> Tuple[datetime, datetime, int]:
     today_day_of_week = now.weekday()
     return today_start_utc, today_end_utc, today_day_of_week
 
+def get_day_boundaries(day: str) -> Tuple[datetime, datetime]:
+    '''UTC start and end of an America/Denver calendar date given as YYYY-MM-DD'''
+    local_tz = ZoneInfo('America/Denver')
+    day_start = datetime.combine(date.fromisoformat(day), datetime.min.time(), tzinfo=local_tz)
+    day_end = day_start + timedelta(days=1)
+    return day_start.astimezone(ZoneInfo('UTC')), day_end.astimezone(ZoneInfo('UTC'))
+
 def get_center_opening_hours(day_of_week = None, in_utc = True) -> Tuple[datetime, datetime]:
     local_tz = ZoneInfo('America/Denver')
     now = datetime.now(local_tz)
@@ -53,3 +60,16 @@ def isToday(timestamp_string: str, use_utc = False) -> bool:
     return (timestamp.year == today.year and
             timestamp.month == today.month and
             timestamp.day == today.day)
+
+def to_local_date(value: Any) -> Optional[str]:
+    '''The America/Denver calendar date of a timestamp, as YYYY-MM-DD.
+    Naive datetimes are treated as UTC, like the ones stored in the db.'''
+    if value is None:
+        return None
+    if isinstance(value, date) and not isinstance(value, datetime):
+        return value.isoformat()
+    if not isinstance(value, datetime):
+        value = datetime.fromisoformat(str(value))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=ZoneInfo('UTC'))
+    return value.astimezone(ZoneInfo('America/Denver')).date().isoformat()
@@ -2,17 +2,17 @@ from datetime import datetime, timezone
 from app.types import AcuityAppointment
 from app.models import Appointment
 
-def acuity_to_appointment(acuity_appt: AcuityAppointment) -> Appointment:
+def acuity_to_appointment_values(acuity_appt: AcuityAppointment) -> dict:
     """
-    Convert an AcuityAppointment to an Appointment model.
+    Column values for the Appointment row of an AcuityAppointment.
     
     Args:
         acuity_appt (AcuityAppointment): The Acuity appointment data
         
     Returns:
-        Appointment: A new Appointment instance with data from the Acuity appointment
+        dict: Appointment column names to values, e.g. for an INSERT
     """
-    return Appointment(
+    return dict(
         acuity_id=acuity_appt.id,
         first_name=acuity_appt.firstName,
         last_name=acuity_appt.lastName,
@@ -21,3 +21,15 @@ def acuity_to_appointment(acuity_appt: AcuityAppointment) -> Appointment:
         acuity_created_at=datetime.fromisoformat(acuity_appt.datetimeCreated),
         is_canceled=acuity_appt.canceled
     )
+
+def acuity_to_appointment(acuity_appt: AcuityAppointment) -> Appointment:
+    """
+    Convert an AcuityAppointment to an Appointment model.
+    
+    Args:
+        acuity_appt (AcuityAppointment): The Acuity appointment data
+        
+    Returns:
+        Appointment: A new Appointment instance with data from the Acuity appointment
+    """
+    return Appointment(**acuity_to_appointment_values(acuity_appt))
@@ -0,0 +1,322 @@
+import asyncio
+import json
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+import httpx
+from sqlalchemy import Connection, func, select
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models import Appointment
+from app.types import AcuityAppointment
+from app.core.apptActions import (
+    handle_reschedule_same_day,
+    handle_schedule,
+    handle_cancel,
+    handle_reschedule_incoming,
+    handle_reschedule_outgoing,
+)
+from app.core.cache import get_appointment_cached, invalidate_openings
+from app.core.invalidation import publish_invalidation
+from app.core.live_updates import changed_hours, publish_schedule_change
+from app.core.resilience import CircuitOpenError, acuity_circuit_breaker
+from app.core.schedule_diff import diff_entries
+from app.core.schedule_revisions import bump_revisions
+from app.core.time_utils import isToday, to_local_date
+
+logger = logging.getLogger(__name__)
+
+VALID_ACTIONS = {
+    "scheduled",
+    "rescheduled",
+    "canceled",
+    "changed",
+    "order.completed",
+}
+
+
+def appointment_key(acuity_id: str) -> str:
+    """Lane key shared by every notification about one appointment"""
+    return f"appointment:{acuity_id}"
+
+
+class KeyedLocks:
+    """One asyncio lock per key, created on demand and dropped when idle.
+
+    Notifications for the same appointment take turns; different
+    appointments run concurrently.
+    """
+
+    def __init__(self):
+        self._locks: Dict[Hashable, asyncio.Lock] = {}
+        self._waiters: Dict[Hashable, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+    @asynccontextmanager
+    async def hold(self, key: Hashable) -> AsyncIterator[None]:
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                del self._waiters[key]
+                del self._locks[key]
+
+
+# In-process lanes, so a fetch and apply for one appointment never
+# interleaves with another notification about the same appointment
+appointment_lanes = KeyedLocks()
+
+
+def is_duplicate(existing_appt: Optional[Appointment], appt_details: AcuityAppointment) -> bool:
+    """True when the stored appointment is already in this state.
+
+    Only start_time and is_canceled count: they are all that webhooks,
+    snapshots and backfills keep up to date, so a change to anything else
+    (a name, the duration) has nothing for us to write. Checked against the
+    row, which every one of those writers changes.
+    """
+    if existing_appt is None:
+        return False
+    return (
+        existing_appt.start_time == datetime.fromisoformat(appt_details["datetime"])
+        and bool(existing_appt.is_canceled) == bool(appt_details["canceled"])
+    )
+
+
+def lock_appointment(acuity_id: str, db: Session) -> None:
+    """Serialize with other processes changing this appointment.
+
+    Unlike a row lock it covers appointments we don't store yet. Held until
+    the transaction ends.
+    """
+    db.execute(select(func.pg_advisory_xact_lock(int(acuity_id))))
+
+
+def hold_appointments(acuity_ids: Iterable[str], db: Session) -> Connection:
+    """Take `lock_appointment`'s locks across several transactions.
+
+    For applying many appointments from one fetch: each apply commits, which
+    would drop a transaction lock, so these are session locks on a
+    connection of their own. Taken in id order, so two holders can't
+    deadlock. Pass the connection to `release_appointments` when done.
+    """
+    conn = db.get_bind().engine.connect()
+    try:
+        for acuity_id in sorted({int(acuity_id) for acuity_id in acuity_ids}):
+            conn.execute(select(func.pg_advisory_lock(acuity_id)))
+    except BaseException:
+        release_appointments(conn)
+        raise
+    return conn
+
+
+def release_appointments(conn: Connection) -> None:
+    try:
+        # session locks outlive a return to the pool
+        conn.execute(select(func.pg_advisory_unlock_all()))
+    finally:
+        conn.close()
+
+
+def apply_appointment_change(
+    acuity_id: str, appt_details: AcuityAppointment, db: Session
+) -> Tuple[dict, List[Any]]:
+    """Record what happened to one appointment, given its current state in Acuity.
+
+    The caller holds `lock_appointment`, taken before fetching that state.
+    Returns the result and the times whose openings changed; the caller
+    evicts those on the event loop, which owns the openings cache.
+    """
+    # Check if appointment exists; the row lock is held until the commit below
+    try:
+        q = select(Appointment).where(Appointment.acuity_id == acuity_id).with_for_update()
+        existing_appt = db.scalars(q).all()[0]
+    except:
+        existing_appt = None
+
+    # A redelivery, or a "changed" right after the "rescheduled" that already
+    # brought us to this state: nothing to write
+    if is_duplicate(existing_appt, appt_details):
+        logger.info("Appt %s already processed in this state", acuity_id)
+        # Releases the locks now rather than when the session closes
+        db.rollback()
+        return {
+            "status": "duplicate",
+            "message": f"Appt {acuity_id} already processed in this state",
+        }, []
+
+    # Whatever we do with it, the slots on both dates changed in Acuity;
+    # the other app processes hear about it once we commit
+    times = [appt_details["datetime"], existing_appt.start_time if existing_appt else None]
+    dates = [to_local_date(t) for t in times if t is not None]
+
+    event = None
+    if not existing_appt and not isToday(appt_details["datetime"]):
+            logger.info("Appt %s doesn't deal with today", acuity_id)
+            # Nothing to store, but the invalidation still goes out
+            publish_invalidation(db, dates=dates, appointments=[acuity_id])
+            db.commit()
+            return {
+                "status": "passed",
+                "message": f"Appt {acuity_id} doesn't deal with today",
+            }, times
+
+    if not existing_appt and isToday(appt_details["datetime"]):
+        event = handle_schedule(appt_details, db)
+    elif appt_details["canceled"]:
+        event = handle_cancel(existing_appt, db)
+    elif isToday(appt_details["datetime"]) and isToday(existing_appt.start_time):
+        event = handle_reschedule_same_day(existing_appt, appt_details, db)
+    elif isToday(appt_details["datetime"]) and not isToday(existing_appt.start_time):
+        # why this would happen, I'm not sure. But I'm handling it
+        event = handle_reschedule_incoming(existing_appt, appt_details, db)
+    elif not isToday(appt_details["datetime"]):
+        event = handle_reschedule_outgoing(existing_appt, appt_details, db)
+    else:
+        logger.error("Unexpected appointment state")
+        raise Exception("existing appt - Shouldn't end up here")
+    db.add(event)
+    # Serialize before committing, so the expired event isn't reloaded
+    db.flush()
+    event_data = event.to_dict()
+    data = json.dumps(event_data)
+    hours = changed_hours(diff_entries(event))
+    # The other processes pass the change on to their live clients
+    publish_invalidation(
+        db,
+        dates=dates,
+        appointments=[acuity_id],
+        schedule={"event": event_data, "hours": hours},
+    )
+    # Last, as it holds the day's revision row until the commit
+    bump_revisions([event.old_time, event.new_time], db)
+    # The appointment change, its Event and the new revision land together
+    db.commit()
+
+    try:
+        publish_schedule_change(event_data, hours, db)
+    except Exception:
+        # Live clients catch up on their next reconnect or refetch
+        logger.exception("Failed publishing the change of appt %s", acuity_id)
+
+    logger.info("Webhook processed successfully")
+    return {"status": "success", "data": data}, times
+
+
+async def process_notification(
+    action: str,
+    acuity_id: str,
+    db: Session,
+    client,
+    appt_details: Optional[AcuityAppointment] = None,
+    held: bool = False,
+) -> dict:
+    """Fetch the appointment behind a notification and apply it.
+
+    `appt_details` skips the fetch when the caller already has the
+    appointment's current state, e.g. from a day listing. `held` means the
+    caller took the appointment's lock with `hold_appointments` before
+    getting that state, so it isn't locked again.
+
+    Raises CircuitOpenError when Acuity is unreachable so the caller can
+    keep the notification for later; every other failure is rolled back
+    and reported in the returned status.
+
+    The database work runs in a thread, off the event loop.
+    """
+    try:
+        async with appointment_lanes.hold(appointment_key(acuity_id)):
+            # Lock before fetching: a fetch another process started earlier
+            # then applies before ours, never its older state after it
+            if not held:
+                await asyncio.to_thread(lock_appointment, acuity_id, db)
+
+            # Fetch appointment details from Acuity API
+            try:
+                if appt_details is None:
+                    appt_details = await get_appointment_cached(client, acuity_id, action)
+            except httpx.HTTPError as e:
+                logger.error("Failed to fetch appointment details: %s", str(e))
+                raise Exception(f"Failed to fetch appointment details: {str(e)}")
+
+            result, times = await asyncio.to_thread(
+                apply_appointment_change, acuity_id, appt_details, db
+            )
+            # The slots on both dates changed in Acuity
+            invalidate_openings(times)
+            return result
+
+    except CircuitOpenError:
+        await asyncio.to_thread(db.rollback)
+        raise
+    except Exception as e:
+        await asyncio.to_thread(db.rollback)
+        logger.error("Error processing webhook: %s", str(e), exc_info=True)
+        return {"status": "error", "message": str(e)}
+
+
+class DeferredNotifications:
+    """Notifications that arrived while the Acuity circuit was open.
+
+    They are replayed, oldest first, once the breaker lets calls through
+    again. Kept in memory, so bounded and lost on restart.
+    """
+
+    def __init__(self, max_size: int):
+        self._queue: "deque[Tuple[str, str]]" = deque(maxlen=max_size)
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def defer(self, action: str, acuity_id: str) -> None:
+        if len(self._queue) == self._queue.maxlen:
+            self.dropped += 1
+            logger.error("Deferred webhook queue full, dropping %s", self._queue[0])
+        self._queue.append((action, acuity_id))
+
+    async def replay(self, session_factory: Callable[[], Session], client) -> int:
+        """Process queued notifications until empty or the circuit opens again"""
+        replayed = 0
+        while self._queue and acuity_circuit_breaker.state != "open":
+            action, acuity_id = self._queue.popleft()
+            db = session_factory()
+            try:
+                await process_notification(action, acuity_id, db, client)
+                replayed += 1
+            except CircuitOpenError:
+                self._queue.appendleft((action, acuity_id))
+                break
+            finally:
+                db.close()
+        if replayed:
+            logger.info("Replayed %d deferred webhooks", replayed)
+        return replayed
+
+    async def run(self, session_factory: Callable[[], Session], client) -> None:
+        while True:
+            await asyncio.sleep(settings.webhook_replay_interval)
+            try:
+                await self.replay(session_factory, client)
+            except Exception:
+                logger.exception("Failed replaying deferred webhooks")
+
+    def clear(self) -> None:
+        self._queue.clear()
+        self.dropped = 0
+
+    def stats(self) -> dict:
+        return {"deferred": len(self._queue), "dropped": self.dropped}
+
+
+deferred_notifications = DeferredNotifications(max_size=settings.webhook_deferred_max)
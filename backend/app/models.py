@@ -1,27 +1,48 @@
 import uuid
 import enum
-from datetime import datetime, timezone
+from datetime import date, datetime, timezone
 import zoneinfo
 from typing import List
-from sqlalchemy import String, DateTime, Integer, Boolean, Uuid, func, Enum
+from sqlalchemy import JSON, String, Date, DateTime, Integer, BigInteger, Boolean, Uuid, func, Enum, Text, Index, LargeBinary, text
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship, validates
 from sqlalchemy.schema import  ForeignKey
-from sqlalchemy.dialects.sqlite import JSON
 from sqlalchemy_serializer import SerializerMixin
 
 class Base(DeclarativeBase, SerializerMixin):
     pass
 
+# Id of the writing transaction; transactions that start later get larger ones
+CURRENT_XID = text("pg_current_xact_id()::text::bigint")
+
+class SnapshotBlob(Base):
+    """Compressed JSON stored once under the sha256 of its content.
+
+    Holds each distinct appointment record seen in a snapshot, and each
+    snapshot's manifest: its records' hashes, or a delta against a base.
+    """
+    __tablename__ = 'snapshot_blobs'
+    hash: Mapped[str] = mapped_column(String(64), primary_key=True)
+    data: Mapped[bytes] = mapped_column(LargeBinary)  # zlib-compressed JSON
+    size: Mapped[int] = mapped_column(Integer)  # uncompressed bytes
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
 class Snapshot(Base):
     __tablename__ = 'snapshots'
     id: Mapped[uuid.UUID] = mapped_column(Uuid, primary_key=True, default=uuid.uuid4)
     timestamp: Mapped[datetime] = mapped_column(DateTime, default=datetime.now(tz=timezone.utc))
-    dump: Mapped[dict] = mapped_column(JSON)
+    manifest: Mapped[str] = mapped_column(ForeignKey('snapshot_blobs.hash'))
+    # full snapshot this one's manifest is a delta against, if any
+    base_id: Mapped[uuid.UUID] = mapped_column(ForeignKey('snapshots.id'), nullable=True, index=True)
+    content_hash: Mapped[str] = mapped_column(String(64))  # hash of the full listing
+    count: Mapped[int] = mapped_column(Integer)  # appointments in the dump
+    # identical snapshots taken in a row share one row
+    repeat_count: Mapped[int] = mapped_column(Integer, default=1)
+    last_taken_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
 
 class Appointment(Base):
     __tablename__ = "appointments"
     id: Mapped[uuid.UUID] = mapped_column(Uuid, primary_key=True, default=uuid.uuid4)
-    acuity_id: Mapped[int] = mapped_column(Integer) #fk to Acuity ID
+    acuity_id: Mapped[int] = mapped_column(Integer, unique=True) #fk to Acuity ID
     first_name: Mapped[str] = mapped_column(String(30))
     last_name: Mapped[str] = mapped_column(String(30))
 
@@ -36,6 +57,8 @@ class Appointment(Base):
     # server metadata
     created_at_here: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.now(tz=timezone.utc))
     last_modified_here: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.now(tz=timezone.utc), onupdate=datetime.now(tz=timezone.utc))
+    # transaction of the last write, for delta syncs of the schedule
+    revision: Mapped[int] = mapped_column(BigInteger, server_default=CURRENT_XID, onupdate=CURRENT_XID, index=True)
 
     events: Mapped[List["Event"]] = relationship(
         back_populates='appointment', 
@@ -70,7 +93,7 @@ class Event(Base):
     __tablename__ = "events"
     id: Mapped[uuid.UUID] = mapped_column(Uuid, primary_key=True, default=uuid.uuid4)
     action: Mapped[EventAction] = mapped_column(Enum(EventAction))
-    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now(tz=timezone.utc))
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=lambda: datetime.now(tz=timezone.utc))
 
     old_time: Mapped[datetime] = mapped_column(DateTime, nullable=True)
     new_time: Mapped[datetime] = mapped_column(DateTime, nullable=True)
@@ -86,4 +109,104 @@ class Event(Base):
     serialize_rules = ('-appointment',)
     
     def __repr__(self) -> str:
-        return f"Event #{self.id}: {self.action} {self.created_at} {self.old_time} {self.new_time}"
\ No newline at end of file
+        return f"Event #{self.id}: {self.action} {self.created_at} {self.old_time} {self.new_time}"
+
+class DiffChange(enum.Enum):
+    added = 0
+    deleted = 1
+
+class ScheduleDiffEntry(Base):
+    """One appointment added to or deleted from an hour of the schedule by an Event"""
+    __tablename__ = "schedule_diff_entries"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    day: Mapped[date] = mapped_column(Date)  # America/Denver date of the slot
+    hour: Mapped[str] = mapped_column(String(5))  # local "HH:MM"
+    change: Mapped[DiffChange] = mapped_column(Enum(DiffChange))
+    appointment_id: Mapped[uuid.UUID] = mapped_column(
+        Uuid, ForeignKey("appointments.id", ondelete="CASCADE")
+    )
+    event_id: Mapped[uuid.UUID] = mapped_column(Uuid, ForeignKey("events.id", ondelete="CASCADE"))
+    event_created_at: Mapped[datetime] = mapped_column(DateTime)  # like Event.created_at
+
+    # so a flush inserts the event first
+    event: Mapped["Event"] = relationship()
+
+    __table_args__ = (
+        Index("ix_schedule_diff_entries_day_event_created_at", "day", "event_created_at"),
+    )
+
+class ScheduleRevision(Base):
+    """How many times a day's schedule was written; names its current state"""
+    __tablename__ = "schedule_revisions"
+    day: Mapped[date] = mapped_column(Date, primary_key=True)  # America/Denver date
+    revision: Mapped[int] = mapped_column(BigInteger)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    # delta sync cursors below this may need tombstones purged that day
+    sync_floor: Mapped[int] = mapped_column(BigInteger, nullable=True)
+
+class AppointmentTombstone(Base):
+    """An appointment deleted, or moved off `start_time` by a snapshot or backfill, kept a while for delta syncs"""
+    __tablename__ = "appointment_tombstones"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    appointment_id: Mapped[uuid.UUID] = mapped_column(Uuid)
+    acuity_id: Mapped[int] = mapped_column(Integer)
+    start_time: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+    revision: Mapped[int] = mapped_column(BigInteger, server_default=CURRENT_XID, index=True)
+    deleted_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+class ScheduleCheckpoint(Base):
+    """A day's schedule as it stood at a moment, so replays start close by"""
+    __tablename__ = "schedule_checkpoints"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    day: Mapped[date] = mapped_column(Date)  # America/Denver date
+    as_of: Mapped[datetime] = mapped_column(DateTime)  # UTC, like Event.created_at
+    state: Mapped[dict] = mapped_column(JSON)  # acuity id -> appointment
+    events: Mapped[int] = mapped_column(Integer)  # replayed since the previous base
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_schedule_checkpoints_day_as_of", "day", "as_of"),
+    )
+
+class JobStatus(enum.Enum):
+    pending = 0
+    processing = 1
+    done = 2
+    dead = 3  # out of attempts, kept for inspection and manual retry
+
+class Job(Base):
+    """Durable background work, claimed by the job workers on any app machine"""
+    __tablename__ = "jobs"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    kind: Mapped[str] = mapped_column(String(30), index=True)  # "webhook", "snapshot"
+    payload: Mapped[dict] = mapped_column(JSON, default=dict)
+    # jobs sharing a key run one at a time, in the order they were enqueued
+    key: Mapped[str] = mapped_column(String(50), nullable=True, index=True)
+    # later notifications folded into this job while it waited to run
+    merged_count: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    status: Mapped[JobStatus] = mapped_column(Enum(JobStatus), default=JobStatus.pending, index=True)
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    last_error: Mapped[str] = mapped_column(Text, nullable=True)
+    result: Mapped[dict] = mapped_column(JSON, nullable=True)
+    locked_by: Mapped[str] = mapped_column(String(100), nullable=True)  # worker that holds the claim
+
+    received_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    available_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    claimed_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=True)
+    processed_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=True)
+
+    def __repr__(self) -> str:
+        return f"Job #{self.id}: {self.kind} {self.payload} {self.status} attempts: {self.attempts}"
+
+
+class BackfillCheckpoint(Base):
+    """Progress of a historical backfill, so an interrupted one can pick up where it stopped"""
+    __tablename__ = "backfill_checkpoints"
+    name: Mapped[str] = mapped_column(String(30), primary_key=True)  # "<start>:<end>"
+    start_date: Mapped[date] = mapped_column(Date)
+    end_date: Mapped[date] = mapped_column(Date)
+    next_day: Mapped[date] = mapped_column(Date)  # first day not loaded yet
+    rows: Mapped[int] = mapped_column(Integer, default=0)
+    started_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    finished_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=True)
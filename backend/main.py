@@ -1,13 +1,50 @@
+import asyncio
+from contextlib import asynccontextmanager, suppress
 from fastapi import FastAPI
 from app.api import api_router
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi import FastAPI, Depends
 from app.core.auth import get_api_key
+from app.core.acuityClient import acuity_client, async_acuity_client
+from app.core.invalidation import invalidation_listener
+from app.core.jobs import job_workers
+from app.core.schedule_history import run_checkpoints
+from app.core.webhook_processing import deferred_notifications
+from app.database import SessionLocal
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Open the pooled Acuity connections on startup and release them on shutdown
+    acuity_client.startup()
+    async_acuity_client.startup()
+    # Replay webhooks that were deferred while Acuity was unreachable
+    replay_task = asyncio.create_task(
+        deferred_notifications.run(SessionLocal, async_acuity_client)
+    )
+    # Materialize the schedule now and then for point-in-time queries
+    checkpoint_task = asyncio.create_task(run_checkpoints(SessionLocal))
+    # Work through queued webhook and snapshot jobs in the background
+    job_workers.start(SessionLocal, async_acuity_client)
+    # Evict what other app processes changed from our caches, and pass
+    # their schedule changes on to our live clients
+    invalidation_listener.start(asyncio.get_running_loop(), SessionLocal)
+    yield
+    invalidation_listener.stop()
+    await job_workers.stop()
+    for task in (replay_task, checkpoint_task):
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+    await async_acuity_client.shutdown()
+    acuity_client.shutdown()
+
 
 app = FastAPI(
     title="Your API",
     description="Your API description",
     version="0.1.0",
+    lifespan=lifespan,
 )
 
 # Add CORS middleware
@@ -17,6 +54,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Allow all methods or specify: ["GET", "POST", etc.]
     allow_headers=["*"],  # Allow all headers or specify needed ones
+    expose_headers=["ETag"],  # so polls can send it back in If-None-Match
 )
 
 # Include all API routes
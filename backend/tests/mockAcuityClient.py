@@ -10,7 +10,21 @@ class MockAcuityClient:
     def __init__(self):
         # In-memory database of appointments
         self.appointments: List[BaseAcuityAppointment] = []
-        
+        self.appt_types = {"dummy": 42677283}
+        # Datetimes that create_appointment should refuse, like a full slot
+        self.unavailable: set = set()
+        # Availability returned by get_openings, and how often it was asked for
+        self.openings: List[Dict[str, Any]] = []
+        self.openings_calls = 0
+        self.appointment_calls = 0
+        self.appointments_calls = 0
+
+    def startup(self) -> None:
+        """No connection pool to open for the in-memory mock"""
+
+    def shutdown(self) -> None:
+        """No connection pool to close for the in-memory mock"""
+
     def add_appointment(self, appointment_data: BaseAcuityAppointment) -> BaseAcuityAppointment:
         """Add a test appointment to the mock database"""
 
@@ -26,6 +40,7 @@ class MockAcuityClient:
     
     def get_appointment(self, appointment_id: str, mock: bool = False) -> Dict[str, Any]:
         """Get an appointment by ID"""
+        self.appointment_calls += 1
         # Convert to int if it's a string
         try:
             appointment_id = int(appointment_id)
@@ -40,11 +55,25 @@ class MockAcuityClient:
         # If not found, raise an error like the real API would
         raise Exception(f"Appointment {appointment_id} not found")
     
-    def get_appointments(self, today: bool = True, limit: int = 100) -> List[Dict[str, Any]]:
+    def get_appointments(
+        self,
+        today: bool = True,
+        limit: int = 100,
+        min_date: str = None,
+        max_date: str = None,
+        show_all: bool = False,
+    ) -> List[Dict[str, Any]]:
         """Get all appointments with optional filtering"""
+        self.appointments_calls += 1
         # In a real implementation, you might want to implement the date filtering
-        # But for a basic mock, we'll just return all appointments
+        # But for a basic mock, we'll just return all appointments unless an
+        # explicit date range is asked for
         result = deepcopy(self.appointments)
+        if min_date or max_date:
+            result = [
+                a for a in result
+                if (min_date or "") <= a["datetime"][:10] <= (max_date or "9999")
+            ]
         
         # Apply limit if specified
         if limit and limit < len(result):
@@ -52,10 +81,70 @@ class MockAcuityClient:
             
         return result
     
+    def get_openings(self, appt_type: int, date: str = None, today: bool = True) -> List[Dict[str, Any]]:
+        """Get the configured openings, counting each lookup"""
+        self.openings_calls += 1
+        return deepcopy(self.openings)
+
+    def create_appointment(
+        self,
+        datetime: str,
+        appt_type: int,
+        first_name: str,
+        last_name: str,
+        email: str = "",
+    ) -> Dict[str, Any]:
+        """Book an appointment, failing for any datetime listed in `unavailable`"""
+        if datetime in self.unavailable:
+            raise Exception(f"The time {datetime} is not available")
+        return self.add_appointment({
+            "datetime": datetime,
+            "appointmentTypeID": appt_type,
+            "firstName": first_name,
+            "lastName": last_name,
+            "email": email,
+        })
+
     def remove_appointment(self, appointment_id: str) -> None:
         """Remove an appointment by ID"""
         self.appointments = [a for a in self.appointments if a.get("id", '') != appointment_id]
 
     def clear_appointments(self):
         """Clear all test appointments"""
-        self.appointments = []
\ No newline at end of file
+        self.appointments = []
+
+class MockAsyncAcuityClient:
+    """Async facade over a MockAcuityClient, sharing its in-memory appointments"""
+
+    def __init__(self, mock: MockAcuityClient):
+        self.mock = mock
+
+    def startup(self) -> None:
+        """No connection pool to open for the in-memory mock"""
+
+    async def shutdown(self) -> None:
+        """No connection pool to close for the in-memory mock"""
+
+    @property
+    def appt_types(self):
+        return self.mock.appt_types
+
+    async def get_appointment(self, appointment_id: str) -> Dict[str, Any]:
+        return self.mock.get_appointment(appointment_id)
+
+    async def get_appointments(
+        self,
+        today: bool = True,
+        limit: int = 100,
+        priority=None,
+        min_date: str = None,
+        max_date: str = None,
+        show_all: bool = False,
+    ) -> List[Dict[str, Any]]:
+        return self.mock.get_appointments(today, limit, min_date, max_date, show_all)
+
+    async def create_appointment(self, datetime: str, appt_type: int, first_name: str, last_name: str, email: str = "") -> Dict[str, Any]:
+        return self.mock.create_appointment(datetime, appt_type, first_name, last_name, email)
+
+    async def get_openings(self, appt_type: int, date: str = None, today: bool = True) -> List[Dict[str, Any]]:
+        return self.mock.get_openings(appt_type, date, today)
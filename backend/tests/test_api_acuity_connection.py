@@ -1,3 +1,5 @@
+from app.config import settings
+
 
 def test_fetch_appointment(test_client, patched_acuity_client):
     # Add a test appointment to the mock
@@ -28,4 +30,175 @@ def test_fetch_appointment(test_client, patched_acuity_client):
     assert fetched_appointment["id"] == appointment_details["id"]
     assert fetched_appointment["firstName"] == "John"
     assert fetched_appointment["lastName"] == "Doe"
-    assert fetched_appointment["type"] == "Math Tutoring"
\ No newline at end of file
+    assert fetched_appointment["type"] == "Math Tutoring"
+
+def test_client_reuses_pooled_session():
+    from app.config import settings
+    from app.core.acuityClient import AcuityClient
+
+    client = AcuityClient()
+    client.startup()
+    session = client.session
+
+    # every call goes through the same keep-alive session
+    assert client.session is session
+    adapter = session.get_adapter(client.base_url)
+    assert adapter._pool_maxsize == settings.acuity_pool_size
+    assert client._timeout("get_openings") == (
+        settings.acuity_connect_timeout, settings.acuity_timeouts["get_openings"]
+    )
+
+    client.shutdown()
+    assert client._session is None
+
+
+def test_gather_limited_bounds_concurrency_and_keeps_order():
+    import asyncio
+    from app.core.acuityClient import gather_limited
+
+    in_flight, peak = 0, 0
+
+    async def call(i):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        if i == 3:
+            raise ValueError("boom")
+        return i
+
+    results = asyncio.run(gather_limited((call(i) for i in range(8)), limit=2))
+
+    assert peak == 2
+    assert results[:3] == [0, 1, 2]
+    assert isinstance(results[3], ValueError)
+    assert results[4:] == [4, 5, 6, 7]
+
+
+def test_get_appointments_pages_each_day_of_a_range():
+    import asyncio
+    import httpx
+    from app.core.acuityClient import AsyncAcuityClient
+
+    # 150 appointments on the 25th, one a day otherwise
+    requests = []
+
+    def listing(request):
+        day, page_size = request.url.params["minDate"], int(request.url.params["max"])
+        requests.append((day, page_size))
+        available = 150 if day == "2025-04-25" else 1
+        return httpx.Response(
+            200, json=[{"id": f"{day}-{i}"} for i in range(min(page_size, available))]
+        )
+
+    client = AsyncAcuityClient(transport=httpx.MockTransport(listing))
+
+    async def run():
+        try:
+            return await client.get_appointments(
+                today=False, min_date="2025-04-24", max_date="2025-04-26"
+            )
+        finally:
+            await client.shutdown()
+
+    appointments = asyncio.run(run())
+
+    assert len(appointments) == 152
+    assert [a["id"] for a in appointments][:2] == ["2025-04-24-0", "2025-04-25-0"]
+    # the full day was asked for again with room for all of it
+    assert sorted(requests) == [
+        ("2025-04-24", 100),
+        ("2025-04-25", 100),
+        ("2025-04-25", 200),
+        ("2025-04-26", 100),
+    ]
+
+
+def test_sync_get_appointments_pages_each_day_of_a_range():
+    from app.core.acuityClient import AcuityClient
+
+    client = AcuityClient()
+    requests = []
+
+    def listing(limit, priority, min_date, max_date, show_all):
+        requests.append((min_date, limit))
+        available = 150 if min_date == "2025-04-25" else 1
+        return [{"id": f"{min_date}-{i}"} for i in range(min(limit, available))]
+
+    client._list_appointments = listing
+
+    appointments = client.get_appointments(
+        today=False, min_date="2025-04-24", max_date="2025-04-26"
+    )
+
+    assert len(appointments) == 152
+    assert requests == [
+        ("2025-04-24", 100),
+        ("2025-04-25", 100),
+        ("2025-04-25", 200),
+        ("2025-04-26", 100),
+    ]
+
+
+def test_create_dummy_appointments(test_client, patched_acuity_client):
+    response = test_client.post(
+        "/acuity/openings/dummy",
+        params={"num_appointments": 3, "date_time": "2025-06-28T00:00:00.000Z"},
+    )
+    assert response.status_code == 200
+    created = response.json()
+    assert len(created) == 3
+    # 00:00 UTC is 18:00 the previous evening in Denver
+    assert all(appt["datetime"] == "2025-06-27T18:00:00-06:00" for appt in created)
+    assert len(patched_acuity_client.appointments) == 3
+
+
+def test_create_dummy_appointments_batch(test_client, patched_acuity_client):
+    patched_acuity_client.unavailable.add("2025-06-27T19:00:00-06:00")
+
+    response = test_client.post(
+        "/acuity/openings/dummy/batch",
+        json={
+            "slots": [
+                {"date_time": "2025-06-28T00:00:00.000Z", "count": 2},
+                {"date_time": "2025-06-28T01:00:00.000Z", "count": 1},
+            ],
+            "concurrency": 2,
+        },
+    )
+    assert response.status_code == 200
+    content = response.json()
+    assert content["created"] == 2
+    assert content["failed"] == 1
+
+    statuses = [(r["datetime"], r["status"]) for r in content["results"]]
+    assert statuses == [
+        ("2025-06-27T18:00:00-06:00", "created"),
+        ("2025-06-27T18:00:00-06:00", "created"),
+        ("2025-06-27T19:00:00-06:00", "failed"),
+    ]
+    assert "not available" in content["results"][2]["reason"]
+
+
+def test_create_zero_dummy_appointments(test_client, patched_acuity_client):
+    response = test_client.post(
+        "/acuity/openings/dummy",
+        params={"num_appointments": 0, "date_time": "2025-06-28T00:00:00.000Z"},
+    )
+    assert response.status_code == 200
+    assert response.json() == []
+    assert patched_acuity_client.appointments == []
+
+
+def test_dummy_batch_is_capped(test_client, patched_acuity_client):
+    too_many = settings.dummy_appointments_max // 2 + 1
+    response = test_client.post(
+        "/acuity/openings/dummy/batch",
+        json={"slots": [
+            {"date_time": "2025-06-28T00:00:00.000Z", "count": too_many},
+            {"date_time": "2025-06-28T01:00:00.000Z", "count": too_many},
+        ]},
+    )
+    assert response.status_code == 422
+    assert patched_acuity_client.appointments == []
@@ -0,0 +1,100 @@
+import asyncio
+import pytest
+from datetime import date
+from sqlalchemy import select
+
+from app.config import settings
+from app.api.routes import webhook
+from app.models import Appointment, AppointmentTombstone, BackfillCheckpoint, Job
+from app.core.backfill import run_backfill
+from .test_snapshot import create_appointment_details
+
+
+def appointment_on(day: str, num: int) -> dict:
+    appt = create_appointment_details(num)
+    appt["id"] = int(day.replace("-", "")) * 10 + num
+    appt["datetime"] = f"{day}T{10 + num}:00:00-0600"
+    return appt
+
+
+@pytest.fixture
+def three_days(patched_acuity_client):
+    for day in ("2025-03-01", "2025-03-02", "2025-03-03"):
+        for num in range(2):
+            patched_acuity_client.add_appointment(appointment_on(day, num))
+    return patched_acuity_client
+
+
+class TestBackfill:
+    def test_loads_every_day(self, db_session, three_days):
+        result = asyncio.run(
+            run_backfill(date(2025, 3, 1), date(2025, 3, 3), db_session, webhook.async_acuity_client)
+        )
+
+        assert result["days"] == 3
+        assert result["rows"] == 6
+        assert result["inserted"] == 6
+        # One listing per day
+        assert three_days.appointments_calls == 3
+        assert len(db_session.scalars(select(Appointment)).all()) == 6
+        checkpoint = db_session.get(BackfillCheckpoint, "2025-03-01:2025-03-03")
+        assert checkpoint.next_day == date(2025, 3, 4)
+        assert checkpoint.finished_at is not None
+
+    def test_rerun_resumes_after_completed_days(self, db_session, three_days, monkeypatch):
+        monkeypatch.setattr(settings, "backfill_batch_days", 2)
+        client = webhook.async_acuity_client
+        asyncio.run(run_backfill(date(2025, 3, 1), date(2025, 3, 3), db_session, client))
+        three_days.appointments_calls = 0
+
+        result = asyncio.run(run_backfill(date(2025, 3, 1), date(2025, 3, 3), db_session, client))
+
+        assert result["days"] == 0
+        assert result["resumed_from"] == "2025-03-04"
+        assert three_days.appointments_calls == 0
+
+    def test_overlapping_backfill_only_updates_what_changed(self, db_session, three_days):
+        client = webhook.async_acuity_client
+        asyncio.run(run_backfill(date(2025, 3, 1), date(2025, 3, 1), db_session, client))
+        moved = three_days.appointments[0]
+        moved["datetime"] = "2025-03-01T12:30:00-0600"
+
+        result = asyncio.run(run_backfill(date(2025, 3, 1), date(2025, 3, 2), db_session, client))
+
+        assert (result["inserted"], result["updated"]) == (2, 1)
+        tombstone = db_session.scalars(select(AppointmentTombstone)).one()
+        assert tombstone.acuity_id == moved["id"]
+        assert tombstone.start_time.isoformat() == "2025-03-01T16:00:00+00:00"
+
+    def test_failed_day_checkpoints_the_days_before_it(self, db_session, three_days, monkeypatch):
+        client = webhook.async_acuity_client
+        get_appointments = client.get_appointments
+
+        async def fail_on_second_day(**kwargs):
+            if kwargs["min_date"] == "2025-03-02":
+                raise Exception("Acuity unavailable")
+            return await get_appointments(**kwargs)
+
+        monkeypatch.setattr(client, "get_appointments", fail_on_second_day)
+        with pytest.raises(Exception, match="Acuity unavailable"):
+            asyncio.run(run_backfill(date(2025, 3, 1), date(2025, 3, 3), db_session, client))
+
+        checkpoint = db_session.get(BackfillCheckpoint, "2025-03-01:2025-03-03")
+        assert checkpoint.next_day == date(2025, 3, 2)
+        assert checkpoint.rows == 2
+
+        monkeypatch.setattr(client, "get_appointments", get_appointments)
+        result = asyncio.run(run_backfill(date(2025, 3, 1), date(2025, 3, 3), db_session, client))
+        assert result["resumed_from"] == "2025-03-02"
+        assert result["days"] == 2
+        assert len(db_session.scalars(select(Appointment)).all()) == 6
+
+    def test_endpoint_queues_a_backfill_job(self, db_session, test_client):
+        response = test_client.post(
+            '/acuity/backfill', params={"start": "2025-03-01", "end": "2025-03-03"}
+        )
+
+        assert response.status_code == 200
+        job = db_session.get(Job, response.json()["job_id"])
+        assert job.kind == "backfill"
+        assert job.key == "backfill:2025-03-01:2025-03-03"
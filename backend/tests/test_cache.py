@@ -0,0 +1,172 @@
+import asyncio
+import pytest
+from freezegun import freeze_time
+from app.config import settings
+from app.core.cache import TTLCache, schedule_cache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTTLCache:
+    def test_entries_expire_after_ttl(self):
+        clock = FakeClock()
+        cache = TTLCache(ttl=10, clock=clock)
+        cache.set("key", "value")
+
+        assert cache.get("key") == (True, "value")
+        clock.now = 10
+        assert cache.get("key") == (False, None)
+
+    def test_concurrent_loads_are_coalesced(self):
+        cache = TTLCache(ttl=10)
+        calls = 0
+
+        async def loader():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return calls
+
+        async def run():
+            return await asyncio.gather(*(cache.get_or_load("key", loader) for _ in range(5)))
+
+        assert asyncio.run(run()) == [1] * 5
+        assert calls == 1
+        assert cache.stats()["misses"] == 1
+        assert cache.stats()["coalesced"] == 4
+
+    def test_failed_load_is_not_cached(self):
+        cache = TTLCache(ttl=10)
+
+        async def failing():
+            raise ValueError("upstream down")
+
+        async def succeeding():
+            return "ok"
+
+        with pytest.raises(ValueError):
+            asyncio.run(cache.get_or_load("key", failing))
+        assert asyncio.run(cache.get_or_load("key", succeeding)) == "ok"
+
+    def test_invalidation_during_load_discards_result(self):
+        cache = TTLCache(ttl=10)
+
+        async def loader():
+            cache.invalidate("key")
+            return "stale"
+
+        assert asyncio.run(cache.get_or_load("key", loader)) == "stale"
+        assert cache.get("key") == (False, None)
+
+    def test_eviction_from_another_thread_waits_for_a_lookup(self):
+        import threading
+
+        cache = TTLCache(ttl=10)
+        cache.set("key", "value")
+        evictor = threading.Thread(target=cache.invalidate, args=("key",))
+
+        def expired_clock():
+            # the loop evicts while a threadpool lookup is between its
+            # expiry check and dropping the entry
+            evictor.start()
+            evictor.join(timeout=0.1)
+            return 1e9
+
+        cache._clock = expired_clock
+        assert cache.get("key") == (False, None)
+        evictor.join()
+
+
+class TestOpeningsCache:
+    def test_openings_served_from_cache(self, test_client, patched_acuity_client):
+        patched_acuity_client.openings = [{"time": "2025-06-27T18:00:00-0600", "slotsAvailable": 3}]
+
+        first = test_client.get("/acuity/openings/dummy", params={"date": "2025-06-27"})
+        second = test_client.get("/acuity/openings/dummy", params={"date": "2025-06-27"})
+
+        assert first.json() == second.json() == patched_acuity_client.openings
+        assert patched_acuity_client.openings_calls == 1
+
+        stats = test_client.get("/acuity/stats").json()["openings_cache"]
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+
+    def test_dummy_creation_invalidates_that_date(self, test_client, patched_acuity_client):
+        test_client.get("/acuity/openings/dummy", params={"date": "2025-06-27"})
+        test_client.get("/acuity/openings/dummy", params={"date": "2025-06-28"})
+        assert patched_acuity_client.openings_calls == 2
+
+        # 00:00 UTC on the 28th is the evening of the 27th in Denver
+        test_client.post(
+            "/acuity/openings/dummy",
+            params={"num_appointments": 1, "date_time": "2025-06-28T00:00:00.000Z"},
+        )
+
+        test_client.get("/acuity/openings/dummy", params={"date": "2025-06-27"})
+        test_client.get("/acuity/openings/dummy", params={"date": "2025-06-28"})
+        assert patched_acuity_client.openings_calls == 3
+
+
+class TestAppointmentCache:
+    def test_lru_evicts_least_recently_used(self):
+        cache = TTLCache(ttl=10, max_size=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        assert cache.get("a") == (True, 1)
+        assert cache.get("b") == (False, None)
+        assert cache.get("c") == (True, 3)
+
+    @freeze_time("2025-04-20")
+    def test_duplicate_notifications_reuse_fetch(self, db_session, test_client, patched_acuity_client):
+        patched_acuity_client.add_appointment({
+            "id": 12345,
+            "firstName": "John",
+            "lastName": "Doe",
+            "datetime": "2025-06-03T19:00:00-0600",
+            "duration": "60",
+        })
+
+        def notify(action):
+            response = test_client.post('/webhook/appt-changed', data={
+                'action': action,
+                'id': '12345',
+                'calendarID': settings.calendar_id,
+            })
+            assert response.status_code == 200
+
+        notify('scheduled')
+        notify('order.completed')
+        assert patched_acuity_client.appointment_calls == 1
+
+        # a change or reschedule means the cached copy is stale
+        notify('changed')
+        assert patched_acuity_client.appointment_calls == 2
+        notify('rescheduled')
+        assert patched_acuity_client.appointment_calls == 3
+
+
+class TestScheduleCache:
+    @freeze_time("2025-04-24T15:30:00-06:00")
+    def test_unchanged_schedule_is_not_modified(self, db_session, test_client, patched_acuity_client):
+        first = test_client.get('/schedule')
+        assert first.status_code == 200
+        assert first.json() == []
+        etag = first.headers['ETag']
+
+        again = test_client.get('/schedule', headers={'If-None-Match': etag})
+        assert again.status_code == 304
+        assert again.content == b''
+        assert again.headers['ETag'] == etag
+
+        # without the tag, the body comes from the cache
+        assert test_client.get('/schedule').json() == []
+        assert schedule_cache.stats()['hits'] == 1
@@ -1,7 +1,7 @@
 import pytest
 from datetime import datetime, timedelta, timezone
 from freezegun import freeze_time
-from app.models import Appointment, Event, EventAction
+from app.models import Appointment, DiffChange, Event, EventAction, ScheduleDiffEntry
 import uuid
 from app.config import settings
 
@@ -222,4 +222,52 @@ class TestScheduleDiff:
         assert seven_pm_diff["deleted"][0]["id"] == str(appt_id)
         assert seven_pm_diff["deleted"][0]["first_name"] == "Carol"
         assert seven_pm_diff["deleted"][0]["last_name"] == "Davis"
-        assert len(seven_pm_diff["added"]) == 0
\ No newline at end of file
+        assert len(seven_pm_diff["added"]) == 0
+
+class TestScheduleDiffEntries:
+    def add_appointment_and_event(self, db_session):
+        appt_id = uuid.uuid4()
+        db_session.add(Appointment(
+            id=appt_id,
+            acuity_id=12345,
+            first_name="Miranda",
+            last_name="Bailey",
+            start_time=datetime.fromisoformat("2025-04-24T17:00:00-06:00").astimezone(timezone.utc),
+            acuity_created_at=datetime.now(),
+            duration=60
+        ))
+        db_session.add(Event(
+            action=EventAction.reschedule_same_day,
+            appointment_id=appt_id,
+            old_time=datetime.fromisoformat("2025-04-24T16:00:00-06:00").astimezone(timezone.utc),
+            new_time=datetime.fromisoformat("2025-04-24T17:00:00-06:00").astimezone(timezone.utc),
+        ))
+        return appt_id
+
+    @freeze_time("2025-04-24T15:30:00-06:00")
+    def test_entries_are_written_with_the_event(self, db_session):
+        self.add_appointment_and_event(db_session)
+        db_session.flush()
+
+        entries = db_session.query(ScheduleDiffEntry).order_by(ScheduleDiffEntry.hour).all()
+        assert [(e.day.isoformat(), e.hour, e.change) for e in entries] == [
+            ("2025-04-24", "16:00", DiffChange.deleted),
+            ("2025-04-24", "17:00", DiffChange.added),
+        ]
+
+        db_session.rollback()
+        assert db_session.query(ScheduleDiffEntry).count() == 0
+
+    @freeze_time("2025-04-24T15:30:00-06:00")
+    def test_rebuild_repairs_the_entries(self, db_session, test_client):
+        appt_id = self.add_appointment_and_event(db_session)
+        db_session.commit()
+        db_session.query(ScheduleDiffEntry).delete()
+        db_session.commit()
+
+        response = test_client.post('/schedule/diff/rebuild', params={"day": "2025-04-24"})
+        assert response.json() == {"entries": 2}
+
+        diffs = {diff["hour"]: diff for diff in test_client.get('/schedule/diff').json()}
+        assert [e["id"] for e in diffs["16:00"]["deleted"]] == [str(appt_id)]
+        assert [e["id"] for e in diffs["17:00"]["added"]] == [str(appt_id)]
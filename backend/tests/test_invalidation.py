@@ -0,0 +1,125 @@
+import asyncio
+import json
+import time
+from datetime import date
+
+import psycopg2
+import pytest
+
+from app.core import invalidation
+from app.core.cache import appointment_cache, openings_cache, schedule_cache
+from app.core.invalidation import APPLICATION_NAME, CHANNEL, InvalidationListener, evict
+from app.core.live_updates import schedule_broker
+from .test_live_updates import drain
+
+
+def fill_caches():
+    openings_cache.set((1, "999", "2025-04-25"), ["slot"])
+    openings_cache.set((1, "999", "2025-04-26"), ["slot"])
+    appointment_cache.set("12345", {"id": 12345})
+    appointment_cache.set("67890", {"id": 67890})
+    schedule_cache.set(("schedule", date(2025, 4, 25), 3), b"[]")
+
+
+def notify(db_url, message):
+    conn = psycopg2.connect(db_url)
+    conn.autocommit = True
+    try:
+        conn.cursor().execute("SELECT pg_notify(%s, %s)", (CHANNEL, json.dumps(message)))
+    finally:
+        conn.close()
+
+
+async def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        await asyncio.sleep(0.02)
+
+
+class TestEvict:
+    def test_evicts_only_what_is_named(self):
+        fill_caches()
+
+        evicted = evict({"dates": ["2025-04-25"], "appointments": ["12345"]})
+
+        assert evicted == 3
+        assert not openings_cache.get((1, "999", "2025-04-25"))[0]
+        assert openings_cache.get((1, "999", "2025-04-26"))[0]
+        assert not appointment_cache.get("12345")[0]
+        assert appointment_cache.get("67890")[0]
+        assert not schedule_cache.get(("schedule", date(2025, 4, 25), 3))[0]
+
+
+class TestInvalidationListener:
+    @pytest.fixture
+    def listener(self, monkeypatch):
+        monkeypatch.setattr(invalidation.settings, "invalidation_reconnect_min", 0.05)
+        monkeypatch.setattr(invalidation.settings, "invalidation_keepalive", 0.2)
+        listener = InvalidationListener()
+        yield listener
+        listener.stop()
+
+    def test_other_processes_notifications_are_applied(self, db_url, listener):
+        async def run():
+            fill_caches()
+            listener.start(asyncio.get_running_loop())
+            await wait_for(lambda: listener.connected)
+
+            # our own notifications were already applied locally
+            notify(db_url, {"origin": invalidation.ORIGIN, "sent_at": time.time(), "all": True})
+            notify(db_url, {"origin": "other:1", "sent_at": time.time(), "appointments": ["12345"]})
+            await wait_for(lambda: listener.evicted)
+
+        asyncio.run(run())
+        assert listener.received == 1
+        assert not appointment_cache.get("12345")[0]
+        assert openings_cache.get((1, "999", "2025-04-25"))[0]
+        assert 0 <= listener.stats()["lag_last_seconds"] < 5
+
+    def test_schedule_changes_reach_local_live_clients(self, db_url, listener, db_session):
+        async def run():
+            subscription = schedule_broker.subscribe()
+            try:
+                listener.start(asyncio.get_running_loop(), lambda: db_session)
+                await wait_for(lambda: listener.connected)
+
+                notify(db_url, {
+                    "origin": "other:1",
+                    "sent_at": time.time(),
+                    "appointments": ["12345"],
+                    "schedule": {"event": {"id": "abc", "action": "schedule"}, "hours": []},
+                })
+                notify(db_url, {"origin": "other:1", "sent_at": time.time(), "all": True})
+                await wait_for(lambda: subscription.queue.qsize() == 2)
+                return drain(subscription)
+            finally:
+                schedule_broker.unsubscribe(subscription)
+
+        schedule, reset = asyncio.run(run())
+        assert schedule.name == "schedule"
+        data = json.loads(schedule.encoded.decode().split("data: ", 1)[1])
+        assert data == {"event": {"id": "abc", "action": "schedule"}, "diff": []}
+        # a notification naming everything may stand for missed changes
+        assert reset.name == "reset"
+
+    def test_reconnects_and_clears_caches(self, db_url, listener):
+        async def run():
+            listener.start(asyncio.get_running_loop())
+            await wait_for(lambda: listener.connected)
+            fill_caches()
+
+            conn = psycopg2.connect(db_url)
+            conn.autocommit = True
+            try:
+                conn.cursor().execute(
+                    "SELECT pg_terminate_backend(pid) FROM pg_stat_activity "
+                    "WHERE application_name = %s", (APPLICATION_NAME,)
+                )
+            finally:
+                conn.close()
+            await wait_for(lambda: listener.reconnects == 1)
+            await wait_for(lambda: not appointment_cache.get("67890")[0])
+
+        asyncio.run(run())
+        assert not openings_cache.get((1, "999", "2025-04-26"))[0]
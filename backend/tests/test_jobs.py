@@ -0,0 +1,433 @@
+import asyncio
+import pytest
+from datetime import datetime
+from freezegun import freeze_time
+from sqlalchemy import select, text, update
+
+from app.config import settings
+from app.api.routes import webhook
+from app.models import Appointment, Event, EventAction, Job, JobStatus, Snapshot
+from app.core.resilience import CircuitOpenError, acuity_circuit_breaker
+from app.core.jobs import JobWorkerPool, claim_next, enqueue_job
+from app.core.webhook_processing import KeyedLocks, process_notification
+from .test_snapshot import create_appointment_details
+
+
+@pytest.fixture
+def inbox_mode(monkeypatch):
+    monkeypatch.setattr(settings, "webhook_mode", "inbox")
+    monkeypatch.setattr(settings, "webhook_debounce_window", 0)
+
+
+@pytest.fixture
+def debounced(inbox_mode, monkeypatch):
+    monkeypatch.setattr(settings, "webhook_debounce_window", 2.0)
+
+
+@pytest.fixture
+def todays_appointment(db_session, patched_acuity_client):
+    """An appointment we know about, which Acuity now says moved to later today"""
+    appt = Appointment(
+        acuity_id=12345,
+        first_name="John",
+        last_name="Doe",
+        start_time=datetime.fromisoformat("2025-04-25T14:00:00-0600"),
+        acuity_created_at=datetime.fromisoformat("2025-04-24T14:00:00-0600"),
+        duration=60,
+        is_canceled=False,
+    )
+    db_session.add(appt)
+    db_session.commit()
+    patched_acuity_client.add_appointment({
+        "id": 12345,
+        "firstName": "John",
+        "lastName": "Doe",
+        "datetime": "2025-04-25T17:00:00-0600",
+        "duration": "60",
+        "canceled": False,
+    })
+    return appt
+
+
+def post_webhook(test_client, action="scheduled", id="12345"):
+    return test_client.post('/webhook/appt-changed',
+                            data={
+                                'action': action,
+                                'id': id,
+                                'calendarID': settings.calendar_id
+                            })
+
+
+class TestWebhookJobs:
+    def test_acknowledged_without_processing(self, db_session, test_client, patched_acuity_client, inbox_mode):
+        response = post_webhook(test_client)
+
+        assert response.status_code == 200
+        assert response.json()['status'] == 'queued'
+        assert patched_acuity_client.appointment_calls == 0
+
+        item = db_session.scalars(select(Job)).one()
+        assert item.kind == "webhook"
+        assert item.payload == {"action": "scheduled", "id": "12345"}
+        assert item.status == JobStatus.pending
+
+    def test_queued_off_the_event_loop(self, db_session, test_client, patched_acuity_client, inbox_mode, monkeypatch):
+        enqueue = webhook.enqueue_notification
+        loops = []
+
+        def recording_enqueue(action, acuity_id, db):
+            try:
+                loops.append(asyncio.get_running_loop())
+            except RuntimeError:
+                loops.append(None)
+            return enqueue(action, acuity_id, db)
+        monkeypatch.setattr(webhook, "enqueue_notification", recording_enqueue)
+
+        assert post_webhook(test_client).json()['status'] == 'queued'
+        assert loops == [None]
+
+    def test_invalid_calendar_is_not_stored(self, db_session, test_client, patched_acuity_client, inbox_mode):
+        response = test_client.post('/webhook/appt-changed',
+                                    data={'action': 'scheduled', 'id': '1', 'calendarID': 'other'})
+
+        assert response.json()['status'] == 'passed'
+        assert db_session.scalars(select(Job)).first() is None
+
+    @freeze_time("2025-04-25T16:00:00-0600")
+    def test_worker_processes_queued_notification(self, db_session, test_client, todays_appointment, inbox_mode):
+        post_webhook(test_client, action="rescheduled")
+        pool = JobWorkerPool(concurrency=1)
+
+        assert asyncio.run(pool.process_next(db_session, webhook.async_acuity_client))
+        assert not asyncio.run(pool.process_next(db_session, webhook.async_acuity_client))
+
+        item = db_session.scalars(select(Job)).one()
+        assert item.status == JobStatus.done
+        assert item.attempts == 1
+        event = db_session.scalars(select(Event)).one()
+        assert event.action == EventAction.reschedule_same_day
+        assert pool.stats()["processed"] == 1
+
+    def test_failures_are_retried_then_dead_lettered(self, db_session, patched_acuity_client, monkeypatch):
+        monkeypatch.setattr(settings, "job_max_attempts", 2)
+        enqueue_job("webhook", {"action": "scheduled", "id": "404"}, db_session)
+        pool = JobWorkerPool(concurrency=1)
+        client = webhook.async_acuity_client
+
+        asyncio.run(pool.process_next(db_session, client))
+        item = db_session.scalars(select(Job)).one()
+        assert item.status == JobStatus.pending
+        assert "not found" in item.last_error
+        # backed off, so not claimable until later
+        assert claim_next(db_session) is None
+
+        db_session.execute(update(Job).values(available_at=item.received_at))
+        asyncio.run(pool.process_next(db_session, client))
+        db_session.refresh(item)
+        assert item.status == JobStatus.dead
+        assert item.attempts == 2
+
+    def test_open_circuit_returns_item_to_inbox(self, db_session, patched_acuity_client):
+        enqueue_job("webhook", {"action": "scheduled", "id": "12345"}, db_session)
+        for _ in range(acuity_circuit_breaker.failure_threshold):
+            acuity_circuit_breaker.record_failure()
+
+        webhook.async_acuity_client.get_appointment = _raise_circuit_open
+        asyncio.run(JobWorkerPool(concurrency=1).process_next(db_session, webhook.async_acuity_client))
+
+        item = db_session.scalars(select(Job)).one()
+        assert item.status == JobStatus.pending
+        assert item.attempts == 0
+
+    def test_status_endpoint_reports_depth(self, db_session, test_client, patched_acuity_client, inbox_mode):
+        post_webhook(test_client, id="1")
+        post_webhook(test_client, id="2")
+
+        response = test_client.get('/webhook/inbox')
+
+        assert response.status_code == 200
+        content = response.json()
+        assert content['pending'] == 2
+        assert content['lag_seconds'] >= 0
+        assert content['workers']['running'] is False
+
+    def test_dead_job_can_be_retried(self, db_session, test_client):
+        job_id = enqueue_job("webhook", {"action": "scheduled", "id": "1"}, db_session).id
+
+        assert test_client.post(f'/jobs/{job_id}/retry').status_code == 409
+        db_session.execute(update(Job).values(status=JobStatus.dead, attempts=5))
+
+        response = test_client.post(f'/jobs/{job_id}/retry')
+        assert response.status_code == 200
+        job = db_session.get(Job, job_id)
+        assert (job.status, job.attempts) == (JobStatus.pending, 0)
+
+    def test_stop_drains_idle_workers(self, db_session):
+        async def run():
+            pool = JobWorkerPool(concurrency=2)
+            pool.start(lambda: db_session, client=None)
+            assert pool.running
+            await pool.stop(timeout=5)
+            return pool.running
+
+        assert asyncio.run(run()) is False
+
+
+class TestJobLanes:
+    def test_same_key_waits_for_earlier_job(self, db_session):
+        first = enqueue_job("webhook", {"action": "rescheduled", "id": "1"}, db_session, key="appointment:1")
+        second = enqueue_job("webhook", {"action": "canceled", "id": "1"}, db_session, key="appointment:1")
+        other = enqueue_job("webhook", {"action": "scheduled", "id": "2"}, db_session, key="appointment:2")
+        first_id, second_id, other_id = first.id, second.id, other.id
+
+        # the second job for appointment 1 is held back, appointment 2 is not
+        assert claim_next(db_session).id == first_id
+        assert claim_next(db_session).id == other_id
+        assert claim_next(db_session) is None
+
+        db_session.execute(update(Job).where(Job.id == first_id).values(status=JobStatus.done))
+        assert claim_next(db_session).id == second_id
+
+    def test_dead_job_does_not_block_its_lane(self, db_session):
+        first = enqueue_job("webhook", {"action": "scheduled", "id": "1"}, db_session, key="appointment:1")
+        db_session.execute(update(Job).where(Job.id == first.id).values(status=JobStatus.dead))
+        second_id = enqueue_job("webhook", {"action": "canceled", "id": "1"}, db_session, key="appointment:1").id
+
+        assert claim_next(db_session).id == second_id
+
+    def test_webhooks_are_queued_in_their_appointment_lane(self, db_session, test_client, patched_acuity_client, inbox_mode):
+        post_webhook(test_client, id="42")
+
+        assert db_session.scalars(select(Job)).one().key == "appointment:42"
+
+    def test_lanes_serialize_same_key_only(self):
+        lanes = KeyedLocks()
+        log = []
+
+        async def work(key, name):
+            async with lanes.hold(key):
+                log.append(f"{name} start")
+                await asyncio.sleep(0.01)
+                log.append(f"{name} end")
+
+        async def run():
+            await asyncio.gather(work("a", "a1"), work("a", "a2"), work("b", "b1"))
+
+        asyncio.run(run())
+        assert log.index("a1 end") < log.index("a2 start")
+        assert log.index("b1 start") < log.index("a1 end")
+        assert len(lanes) == 0
+
+    @freeze_time("2025-04-25T15:00:00-0600")
+    def test_appointment_is_locked_before_the_fetch(self, db_session, todays_appointment):
+        client = webhook.async_acuity_client
+        fetch = client.get_appointment
+        held = []
+
+        async def locked_fetch(appointment_id):
+            held.append(db_session.scalar(text(
+                "SELECT count(*) FROM pg_locks WHERE locktype = 'advisory'"
+                " AND pid = pg_backend_pid() AND objid = 12345"
+            )))
+            return await fetch(appointment_id)
+        client.get_appointment = locked_fetch
+
+        result = asyncio.run(process_notification("rescheduled", "12345", db_session, client))
+
+        assert result["status"] == "success"
+        assert held == [1]
+
+
+class TestWebhookDebounce:
+    def test_burst_is_merged_into_one_job(self, db_session, test_client, patched_acuity_client, debounced):
+        for action in ["scheduled", "rescheduled", "order.completed"]:
+            assert post_webhook(test_client, action=action).json()['status'] == 'queued'
+
+        job = db_session.scalars(select(Job)).one()
+        assert job.merged_count == 2
+        # a reschedule among the merged notifications still forces a refetch
+        assert job.payload == {"action": "rescheduled", "id": "12345"}
+        # held back for the window, so more notifications can join
+        assert claim_next(db_session) is None
+
+        stats = test_client.get('/webhook/inbox').json()
+        assert stats['pending'] == 1
+        assert stats['merged'] == 2
+
+    @freeze_time("2025-04-25T16:00:00-0600")
+    def test_merged_job_is_applied_once(self, db_session, test_client, todays_appointment, debounced):
+        post_webhook(test_client, action="rescheduled")
+        post_webhook(test_client, action="changed")
+        db_session.execute(update(Job).values(available_at=Job.received_at))
+
+        client = webhook.async_acuity_client
+        asyncio.run(JobWorkerPool(concurrency=1).process_next(db_session, client))
+
+        assert client.mock.appointment_calls == 1
+        assert len(db_session.scalars(select(Event)).all()) == 1
+
+    def test_claimed_job_is_not_merged_into(self, db_session, test_client, patched_acuity_client, debounced):
+        post_webhook(test_client)
+        db_session.execute(update(Job).values(available_at=Job.received_at))
+        claim_next(db_session)
+
+        post_webhook(test_client)
+
+        assert [job.merged_count for job in db_session.scalars(select(Job))] == [0, 0]
+
+    def test_delay_is_capped(self, db_session, test_client, patched_acuity_client, debounced, monkeypatch):
+        monkeypatch.setattr(settings, "webhook_debounce_max", 0)
+        post_webhook(test_client)
+        post_webhook(test_client)
+
+        # the second notification would push it back, but not past the cap
+        assert claim_next(db_session) is not None
+
+
+@pytest.fixture
+def block_of_appointments(db_session, patched_acuity_client):
+    """Three of today's appointments; Acuity moved two later today and one to tomorrow"""
+    moves = {
+        101: ("2025-04-25T14:00:00-0600", "2025-04-25T17:00:00-0600"),
+        102: ("2025-04-25T15:00:00-0600", "2025-04-25T18:00:00-0600"),
+        103: ("2025-04-25T16:00:00-0600", "2025-04-26T16:00:00-0600"),
+    }
+    for acuity_id, (old, new) in moves.items():
+        db_session.add(Appointment(
+            acuity_id=acuity_id,
+            first_name="John",
+            last_name=f"Doe{acuity_id}",
+            start_time=datetime.fromisoformat(old),
+            acuity_created_at=datetime.fromisoformat("2025-04-24T14:00:00-0600"),
+            duration=60,
+            is_canceled=False,
+        ))
+        patched_acuity_client.add_appointment({
+            "id": acuity_id,
+            "firstName": "John",
+            "lastName": f"Doe{acuity_id}",
+            "datetime": new,
+            "duration": "60",
+            "canceled": False,
+        })
+    db_session.commit()
+    return list(moves)
+
+
+class TestWebhookStorms:
+    @freeze_time("2025-04-25T16:30:00-0600")
+    def test_storm_is_served_from_one_day_listing(self, db_session, test_client, block_of_appointments, inbox_mode, monkeypatch):
+        monkeypatch.setattr(settings, "webhook_bulk_threshold", 3)
+        for acuity_id in block_of_appointments:
+            post_webhook(test_client, action="rescheduled", id=str(acuity_id))
+        client = webhook.async_acuity_client
+        pool = JobWorkerPool(concurrency=1)
+
+        assert asyncio.run(pool.process_next(db_session, client))
+
+        assert client.mock.appointments_calls == 1
+        # only the appointment that left the day needed its own fetch
+        assert client.mock.appointment_calls == 1
+        assert [job.status for job in db_session.scalars(select(Job))] == [JobStatus.done] * 3
+        actions = sorted(event.action.name for event in db_session.scalars(select(Event)))
+        assert actions == ["reschedule_outgoing", "reschedule_same_day", "reschedule_same_day"]
+        assert pool.stats()["bulk_jobs"] == 3
+
+    @freeze_time("2025-04-25T16:30:00-0600")
+    def test_appointments_are_locked_before_the_listing(self, db_session, test_client, block_of_appointments, inbox_mode, monkeypatch):
+        monkeypatch.setattr(settings, "webhook_bulk_threshold", 3)
+        for acuity_id in block_of_appointments:
+            post_webhook(test_client, action="rescheduled", id=str(acuity_id))
+        client = webhook.async_acuity_client
+        listing = client.get_appointments
+        held = []
+
+        def advisory_locks():
+            return set(db_session.scalars(text(
+                "SELECT objid FROM pg_locks WHERE locktype = 'advisory' AND granted"
+            )))
+
+        async def locked_listing(**kwargs):
+            held.append(advisory_locks())
+            return await listing(**kwargs)
+        monkeypatch.setattr(client, "get_appointments", locked_listing)
+
+        asyncio.run(JobWorkerPool(concurrency=1).process_next(db_session, client))
+
+        assert held == [set(block_of_appointments)]
+        assert advisory_locks() == set()
+        assert [job.status for job in db_session.scalars(select(Job))] == [JobStatus.done] * 3
+
+    @freeze_time("2025-04-25T16:30:00-0600")
+    def test_below_threshold_fetches_individually(self, db_session, test_client, block_of_appointments, inbox_mode, monkeypatch):
+        monkeypatch.setattr(settings, "webhook_bulk_threshold", 4)
+        for acuity_id in block_of_appointments:
+            post_webhook(test_client, action="rescheduled", id=str(acuity_id))
+        client = webhook.async_acuity_client
+
+        asyncio.run(JobWorkerPool(concurrency=1).process_next(db_session, client))
+
+        assert client.mock.appointments_calls == 0
+        assert client.mock.appointment_calls == 1
+        assert len(db_session.scalars(select(Job).where(Job.status == JobStatus.pending)).all()) == 2
+
+
+class TestSnapshotJobs:
+    @freeze_time("2025-04-26")
+    def test_background_snapshot(self, db_session, test_client, patched_acuity_client):
+        for i in range(2):
+            patched_acuity_client.add_appointment(create_appointment_details(i))
+
+        response = test_client.post('/acuity/snapshot', params={'background': True})
+        assert response.status_code == 200
+        job_id = response.json()['job_id']
+        assert db_session.query(Snapshot).count() == 0
+
+        assert asyncio.run(JobWorkerPool(concurrency=1).process_next(db_session, webhook.async_acuity_client))
+
+        job = test_client.get(f'/jobs/{job_id}').json()
+        assert job['kind'] == 'snapshot'
+        assert job['result']['count'] == 2
+        assert db_session.query(Snapshot).count() == 1
+        assert db_session.query(Appointment).count() == 2
+
+    def test_database_work_runs_off_the_event_loop(self, db_session, patched_acuity_client, monkeypatch):
+        from app.core import jobs
+        on_loop = []
+
+        def recording(name, func):
+            def wrapper(*args, **kwargs):
+                try:
+                    asyncio.get_running_loop()
+                    on_loop.append(name)
+                except RuntimeError:
+                    pass
+                return func(*args, **kwargs)
+            return wrapper
+        for name in ("claim_next", "claim_same_day_webhooks", "save_snapshot", "_finish"):
+            monkeypatch.setattr(jobs, name, recording(name, getattr(jobs, name)))
+        enqueue_job("snapshot", {}, db_session)
+
+        assert asyncio.run(JobWorkerPool(concurrency=1).process_next(db_session, webhook.async_acuity_client))
+
+        assert on_loop == []
+        assert db_session.scalars(select(Job)).one().status == JobStatus.done
+
+    def test_claims_are_not_shared(self, db_session):
+        first = enqueue_job("snapshot", {}, db_session)
+        second = enqueue_job("snapshot", {}, db_session)
+
+        claimed = [claim_next(db_session), claim_next(db_session), claim_next(db_session)]
+
+        assert [job.id if job else None for job in claimed] == [first.id, second.id, None]
+
+    def test_unknown_kind_is_rejected(self, db_session):
+        with pytest.raises(ValueError):
+            enqueue_job("nope", {}, db_session)
+
+    def test_missing_job(self, test_client):
+        assert test_client.get('/jobs/999').status_code == 404
+
+
+async def _raise_circuit_open(appointment_id):
+    raise CircuitOpenError("Acuity circuit is open")
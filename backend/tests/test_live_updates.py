@@ -0,0 +1,96 @@
+import asyncio
+import json
+from freezegun import freeze_time
+
+from app.config import settings
+from app.models import EventAction
+from app.core.live_updates import ScheduleBroker, schedule_broker
+from .test_snapshot import create_appointment_details
+
+
+def drain(subscription) -> list:
+    messages = []
+    while not subscription.queue.empty():
+        messages.append(subscription.queue.get_nowait())
+    return messages
+
+
+class TestScheduleBroker:
+    def test_resume_replays_missed_messages(self):
+        broker = ScheduleBroker(buffer_size=10, queue_size=10)
+
+        async def run():
+            first = broker.publish("schedule", {"n": 1})
+            broker.publish("schedule", {"n": 2})
+            broker.publish("schedule", {"n": 3})
+            return drain(broker.subscribe(first.id))
+
+        assert [m.encoded.endswith(b'{"n": 2}\n\n') for m in asyncio.run(run())] == [True, False]
+
+    def test_resume_past_the_buffer_asks_for_a_reset(self):
+        broker = ScheduleBroker(buffer_size=2, queue_size=10)
+
+        async def run():
+            first = broker.publish("schedule", {"n": 1})
+            for n in range(2, 5):
+                broker.publish("schedule", {"n": n})
+            return (
+                [m.name for m in drain(broker.subscribe(first.id))],
+                [m.name for m in drain(broker.subscribe("1-1"))],
+            )
+
+        assert asyncio.run(run()) == (["reset"], ["reset"])
+
+    def test_slow_client_is_disconnected_after_its_queue(self):
+        broker = ScheduleBroker(buffer_size=10, queue_size=2)
+
+        async def run():
+            subscription = broker.subscribe()
+            for n in range(3):
+                broker.publish("schedule", {"n": n})
+            await asyncio.sleep(0)  # let the offers run
+            return [chunk async for chunk in broker.stream(subscription)]
+
+        chunks = asyncio.run(run())
+        # retry hint, then the two queued messages; the third was dropped
+        assert len(chunks) == 3
+        assert broker.stats()["disconnected"] == 1
+        assert broker.stats()["subscribers"] == 0
+
+
+def post_scheduled(test_client, patched_acuity_client):
+    appt = create_appointment_details(0)
+    appt["datetime"] = "2025-04-25T17:00:00-0600"
+    patched_acuity_client.add_appointment(appt)
+    return test_client.post('/webhook/appt-changed', data={
+        'action': 'scheduled',
+        'id': str(appt["id"]),
+        'calendarID': settings.calendar_id,
+    })
+
+
+class TestSchedulePush:
+    @freeze_time("2025-04-25T15:30:00-06:00")
+    def test_applied_webhook_is_published_with_its_diff_row(self, db_session, test_client, patched_acuity_client):
+        async def run():
+            subscription = schedule_broker.subscribe()
+            try:
+                response = await asyncio.to_thread(post_scheduled, test_client, patched_acuity_client)
+                await asyncio.sleep(0)
+                return response, drain(subscription)
+            finally:
+                schedule_broker.unsubscribe(subscription)
+
+        response, [message] = asyncio.run(run())
+
+        assert response.json()['status'] == 'success'
+        data = json.loads(message.encoded.decode().split("data: ", 1)[1])
+        assert data["event"]["action"] == EventAction.schedule.value
+        assert [row["hour"] for row in data["diff"]] == ["17:00"]
+        assert [a["first_name"] for a in data["diff"][0]["added"]] == ["Meredith0"]
+
+    @freeze_time("2025-04-25T15:30:00-06:00")
+    def test_nothing_is_built_without_subscribers(self, db_session, test_client, patched_acuity_client):
+        assert post_scheduled(test_client, patched_acuity_client).json()['status'] == 'success'
+
+        assert schedule_broker.stats()["published"] == 0
@@ -0,0 +1,151 @@
+import asyncio
+import httpx
+import pytest
+from app.core.acuityClient import AsyncAcuityClient
+from app.core.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    LatencyTracker,
+    Priority,
+    RateLimiter,
+    RetryPolicy,
+    acuity_retry_policy,
+    hedged,
+    parse_retry_after,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestRateLimiter:
+    def test_low_priority_leaves_reserve_for_high(self):
+        limiter = RateLimiter(rate=10, burst=4, reserve=2, clock=FakeClock())
+
+        assert limiter.try_acquire(Priority.low) == 0
+        assert limiter.try_acquire(Priority.low) == 0
+        # only the reserved tokens are left
+        assert limiter.try_acquire(Priority.low) > 0
+        assert limiter.try_acquire(Priority.high) == 0
+        assert limiter.try_acquire(Priority.high) == 0
+        assert limiter.try_acquire(Priority.high) > 0
+
+    def test_tokens_refill_at_rate(self):
+        clock = FakeClock()
+        limiter = RateLimiter(rate=10, burst=1, clock=clock)
+
+        assert limiter.try_acquire() == 0
+        assert limiter.try_acquire() == pytest.approx(0.1)
+        clock.now = 0.1
+        assert limiter.try_acquire() == 0
+
+
+class TestRetryPolicy:
+    def test_retry_after_seconds_and_date(self):
+        assert parse_retry_after("3") == 3
+        assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0
+        assert parse_retry_after(None) is None
+        assert parse_retry_after("soon") is None
+
+    def test_post_only_retries_429(self):
+        policy = RetryPolicy(max_retries=3, backoff_base=0.5, backoff_max=8)
+        assert policy.should_retry(0, 429, idempotent=False)
+        assert not policy.should_retry(0, 503, idempotent=False)
+        assert not policy.should_retry(0, None, idempotent=False)
+        assert policy.should_retry(0, 503)
+        assert not policy.should_retry(3, 503)
+        assert not policy.should_retry(0, 404)
+
+    def test_backoff_is_capped(self):
+        policy = RetryPolicy(max_retries=10, backoff_base=0.5, backoff_max=8)
+        assert all(0 <= policy.delay(attempt) <= 8 for attempt in range(10))
+        assert policy.delay(0, retry_after="30") == 8
+
+
+def test_async_client_retries_rate_limited_request():
+    responses = iter([
+        httpx.Response(429, headers={"Retry-After": "0"}),
+        httpx.Response(503, headers={"Retry-After": "0"}),
+        httpx.Response(200, json={"id": 12345}),
+    ])
+    client = AsyncAcuityClient(transport=httpx.MockTransport(lambda request: next(responses)))
+    retries_before = sum(acuity_retry_policy.retries.values())
+
+    async def run():
+        try:
+            return await client.get_appointment("12345")
+        finally:
+            await client.shutdown()
+
+    assert asyncio.run(run()) == {"id": 12345}
+    assert sum(acuity_retry_policy.retries.values()) == retries_before + 2
+
+
+class TestCircuitBreaker:
+    def test_opens_after_threshold_and_half_opens_after_reset(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=clock)
+
+        breaker.record_failure()
+        assert breaker.state == "closed"
+        breaker.record_failure()
+        assert breaker.state == "open"
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()
+
+        clock.now = 30
+        assert breaker.state == "half_open"
+        breaker.before_call()  # the single trial call
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()
+
+        breaker.record_success()
+        assert breaker.state == "closed"
+
+    def test_failed_trial_reopens(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=clock)
+        breaker.record_failure()
+
+        clock.now = 30
+        breaker.before_call()
+        breaker.record_failure()
+        assert breaker.state == "open"
+
+
+class TestHedging:
+    def test_latency_percentile(self):
+        tracker = LatencyTracker()
+        for ms in range(1, 101):
+            tracker.record(ms / 1000)
+        assert tracker.percentile(95) == pytest.approx(0.095, abs=0.001)
+
+    def test_slow_first_request_is_hedged(self):
+        delays = iter([1.0, 0.01])
+        calls = 0
+
+        async def call():
+            nonlocal calls
+            calls += 1
+            delay = next(delays)
+            await asyncio.sleep(delay)
+            return delay
+
+        assert asyncio.run(hedged(call, delay=0.02)) == 0.01
+        assert calls == 2
+
+    def test_fast_request_is_not_hedged(self):
+        calls = 0
+
+        async def call():
+            nonlocal calls
+            calls += 1
+            return "ok"
+
+        assert asyncio.run(hedged(call, delay=0.05)) == "ok"
+        assert calls == 1
@@ -0,0 +1,99 @@
+import pytest
+from datetime import datetime, timezone
+from freezegun import freeze_time
+from sqlalchemy import select
+
+from app.models import Appointment, Event, EventAction, ScheduleCheckpoint
+from app.core.schedule_history import materialize_checkpoint, schedule_as_of
+from app.core.snapshots import save_snapshot
+from .test_snapshot import create_appointment_details
+
+
+def mountain(value: str) -> datetime:
+    return datetime.fromisoformat(f"2025-04-25T{value}-06:00")
+
+
+def add_event(db_session, acuity_id, action, at, old_time=None, new_time=None):
+    appt = db_session.scalars(select(Appointment).where(Appointment.acuity_id == acuity_id)).one()
+    db_session.add(Event(
+        action=action,
+        appointment_id=appt.id,
+        old_time=old_time.astimezone(timezone.utc) if old_time else None,
+        new_time=new_time.astimezone(timezone.utc) if new_time else None,
+        created_at=mountain(at).astimezone(timezone.utc).replace(tzinfo=None),
+    ))
+    db_session.commit()
+
+
+@pytest.fixture
+def morning(db_session, patched_acuity_client):
+    """Two appointments in the 8am snapshot, then a reschedule, a cancel and a booking"""
+    first, second = create_appointment_details(0), create_appointment_details(1)
+    first["datetime"] = "2025-04-25T16:00:00-0600"
+    second["datetime"] = "2025-04-25T17:00:00-0600"
+    with freeze_time(mountain("08:00:00")):
+        save_snapshot([first, second], db_session)
+
+    add_event(db_session, 12345, EventAction.reschedule_same_day, "09:00:00",
+              old_time=mountain("16:00:00"), new_time=mountain("18:00:00"))
+    add_event(db_session, 12346, EventAction.cancel, "10:00:00", old_time=mountain("17:00:00"))
+    db_session.add(Appointment(
+        acuity_id=12347,
+        first_name="Cristina",
+        last_name="Yang",
+        start_time=mountain("19:00:00"),
+        acuity_created_at=mountain("11:00:00"),
+        duration=60,
+    ))
+    db_session.commit()
+    add_event(db_session, 12347, EventAction.schedule, "11:00:00", new_time=mountain("19:00:00"))
+
+
+def starts(schedule):
+    return [(a["acuity_id"], a["start_time"][11:16], a["is_canceled"]) for a in schedule]
+
+
+class TestScheduleAsOf:
+    def test_replays_events_since_the_snapshot(self, db_session, morning):
+        assert starts(schedule_as_of(mountain("08:30:00"), db_session)) == [
+            (12345, "22:00", False),
+            (12346, "23:00", False),
+        ]
+        assert starts(schedule_as_of(mountain("09:30:00"), db_session)) == [
+            (12346, "23:00", False),
+            (12345, "00:00", False),
+        ]
+        assert starts(schedule_as_of(mountain("12:00:00"), db_session)) == [
+            (12346, "23:00", True),
+            (12345, "00:00", False),
+            (12347, "01:00", False),
+        ]
+
+    def test_checkpoint_shortens_the_replay(self, db_session, morning):
+        checkpoint = materialize_checkpoint(mountain("10:30:00"), db_session)
+        assert checkpoint.events == 2
+
+        # only the booking is left to replay after the checkpoint
+        assert materialize_checkpoint(mountain("12:00:00"), db_session).events == 1
+        assert materialize_checkpoint(mountain("12:30:00"), db_session) is None
+        assert db_session.query(ScheduleCheckpoint).count() == 2
+        assert starts(schedule_as_of(mountain("12:45:00"), db_session)) == [
+            (12346, "23:00", True),
+            (12345, "00:00", False),
+            (12347, "01:00", False),
+        ]
+
+    @freeze_time("2025-04-25T20:00:00-0600")
+    def test_endpoint_returns_mountain_time(self, db_session, test_client, morning):
+        response = test_client.get('/schedule', params={"as_of": "2025-04-25T09:30:00-06:00"})
+
+        assert response.status_code == 200
+        assert [a["start_time"] for a in response.json()] == [
+            "2025-04-25T17:00:00-06:00",
+            "2025-04-25T18:00:00-06:00",
+        ]
+
+    @freeze_time("2025-04-25T20:00:00-0600")
+    def test_future_as_of_is_rejected(self, test_client):
+        response = test_client.get('/schedule', params={"as_of": "2025-04-26T09:30:00-06:00"})
+        assert response.status_code == 422
@@ -0,0 +1,128 @@
+from datetime import timedelta
+
+from freezegun import freeze_time
+from sqlalchemy import select, update
+
+from app.config import settings
+from app.models import Appointment, AppointmentTombstone, ScheduleRevision
+from app.types import AcuityAppointment
+from app.core.type_conversion import acuity_to_appointment
+from app.core.schedule_sync import purge_tombstones, sync_floor
+from app.core.snapshots import save_snapshot
+from .test_snapshot import create_appointment_details
+
+
+def appointment_ids(db_session):
+    return {
+        acuity_id: str(id)
+        for id, acuity_id in db_session.execute(select(Appointment.id, Appointment.acuity_id))
+    }
+
+
+def age_everything(db_session):
+    """Make every row look written by a transaction long finished"""
+    db_session.execute(update(Appointment).values(revision=Appointment.revision - 1000))
+    db_session.commit()
+
+
+@freeze_time("2025-04-25T15:30:00-06:00")
+class TestScheduleSync:
+    def test_first_sync_is_full_then_only_changes(self, db_session, test_client):
+        appointments = [create_appointment_details(n) for n in range(3)]
+        save_snapshot(appointments, db_session)
+        ids = appointment_ids(db_session)
+
+        first = test_client.get('/schedule', params={"since": 0}).json()
+        assert first["full"] is True
+        assert [a["acuity_id"] for a in first["appointments"]] == [12345, 12346, 12347]
+
+        age_everything(db_session)
+        appointments[0]["canceled"] = True
+        appointments[2]["datetime"] = "2025-04-26T19:00:00-0600"
+        save_snapshot(appointments, db_session)
+
+        delta = test_client.get('/schedule', params={"since": first["revision"]}).json()
+        assert delta["full"] is False
+        assert delta["revision"] >= first["revision"]
+        # the unchanged appointment isn't sent again
+        assert [(a["acuity_id"], a["is_canceled"]) for a in delta["appointments"]] == [(12345, True)]
+        assert delta["removed"] == [ids[12347]]
+
+    def test_other_days_stay_out_of_the_delta(self, db_session, test_client):
+        tomorrow = create_appointment_details(0)
+        tomorrow["datetime"] = "2025-04-26T10:00:00-0600"
+        save_snapshot([tomorrow, create_appointment_details(1)], db_session, horizon_days=1)
+        first = test_client.get('/schedule', params={"since": 0}).json()
+        age_everything(db_session)
+
+        tomorrow["datetime"] = "2025-04-26T11:00:00-0600"
+        save_snapshot([tomorrow, create_appointment_details(1)], db_session, horizon_days=1)
+
+        delta = test_client.get('/schedule', params={"since": first["revision"]}).json()
+        assert delta["full"] is False
+        assert delta["appointments"] == []
+        assert delta["removed"] == []
+
+    def test_appointment_moved_off_today_by_a_webhook_is_removed(self, db_session, test_client, patched_acuity_client):
+        appt = create_appointment_details(0)
+        save_snapshot([appt], db_session)
+        ids = appointment_ids(db_session)
+        first = test_client.get('/schedule', params={"since": 0}).json()
+        age_everything(db_session)
+
+        appt["datetime"] = "2025-04-26T19:00:00-0600"
+        patched_acuity_client.add_appointment(appt)
+        test_client.post('/webhook/appt-changed', data={
+            'action': 'rescheduled', 'id': '12345', 'calendarID': settings.calendar_id,
+        })
+
+        delta = test_client.get('/schedule', params={"since": first["revision"]}).json()
+        assert delta["full"] is False
+        assert delta["removed"] == [ids[12345]]
+
+    def test_deltas_work_before_any_purge_and_write_nothing(self, db_session, test_client):
+        db_session.add(acuity_to_appointment(AcuityAppointment(**create_appointment_details(0))))
+        db_session.commit()
+        first = test_client.get('/schedule', params={"since": 0}).json()
+        assert first["full"] is True
+        assert [a["acuity_id"] for a in first["appointments"]] == [12345]
+        age_everything(db_session)
+
+        db_session.add(acuity_to_appointment(AcuityAppointment(**create_appointment_details(1))))
+        db_session.commit()
+
+        delta = test_client.get('/schedule', params={"since": first["revision"]}).json()
+        assert delta["full"] is False
+        assert [a["acuity_id"] for a in delta["appointments"]] == [12346]
+        assert db_session.scalars(select(ScheduleRevision)).all() == []
+
+    def test_deleted_appointments_are_removed(self, db_session, test_client):
+        save_snapshot([create_appointment_details(n) for n in range(2)], db_session)
+        ids = appointment_ids(db_session)
+        first = test_client.get('/schedule', params={"since": 0}).json()
+        age_everything(db_session)
+
+        save_snapshot([create_appointment_details(0)], db_session)
+
+        delta = test_client.get('/schedule', params={"since": first["revision"]}).json()
+        assert delta["full"] is False
+        assert delta["removed"] == [ids[12346]]
+
+    def test_revision_below_a_purged_tombstone_is_full(self, db_session, test_client):
+        save_snapshot([create_appointment_details(n) for n in range(2)], db_session)
+        save_snapshot([create_appointment_details(0)], db_session)
+        # the tombstone of 12346, written long ago, outlives its retention
+        db_session.execute(update(AppointmentTombstone).values(
+            deleted_at=AppointmentTombstone.deleted_at - timedelta(days=30),
+            revision=AppointmentTombstone.revision - 1000,
+        ))
+        assert purge_tombstones(db_session) == 1
+        db_session.commit()
+        floor = sync_floor(db_session)
+
+        stale = test_client.get('/schedule', params={"since": floor - 1}).json()
+        assert stale["full"] is True
+        assert [a["acuity_id"] for a in stale["appointments"]] == [12345]
+
+        fresh = test_client.get('/schedule', params={"since": floor}).json()
+        assert fresh["full"] is False
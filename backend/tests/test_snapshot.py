@@ -1,11 +1,14 @@
 import pytest
+import uuid
 from datetime import datetime, timezone
-from app.models import Appointment, Snapshot
-from sqlalchemy import select
+from app.models import Appointment, Snapshot, SnapshotBlob
+from sqlalchemy import event, select
 from freezegun import freeze_time
 from app.config import settings
 from app.core.type_conversion import acuity_to_appointment
 from app.types import AcuityAppointment
+from app.core.snapshot_store import load_dump
+from app.core.snapshots import save_snapshot
 
 
 def create_appointment_details(num) -> AcuityAppointment:
@@ -78,7 +81,7 @@ class TestSnapshot:
         # Verify snapshot was created
         snapshots = db_session.query(Snapshot).all()
         assert len(snapshots) == 1
-        assert len(snapshots[0].dump) == 3
+        assert len(load_dump(snapshots[0], db_session)) == 3
 
         # Verify appointments were created
         appointments = db_session.query(Appointment).all()
@@ -117,7 +120,7 @@ class TestSnapshot:
         # Verify first snapshot
         snapshots = db_session.query(Snapshot).all()
         assert len(snapshots) == 1
-        assert len(snapshots[0].dump) == 2
+        assert len(load_dump(snapshots[0], db_session)) == 2
 
         # Add new appointments
         new_appointments = [
@@ -138,7 +141,7 @@ class TestSnapshot:
         # Verify snapshots
         snapshots = db_session.query(Snapshot).all()
         assert len(snapshots) == 2  # Should now have 2 snapshots
-        assert len(snapshots[1].dump) == 5  # Latest snapshot should have all appointments
+        assert len(load_dump(snapshots[1], db_session)) == 5  # Latest snapshot should have all appointments
         
         # Verify all appointments exist in database
         appointments = db_session.query(Appointment).all()
@@ -284,10 +287,10 @@ class TestSnapshot:
         # Verify first snapshot
         snapshots = db_session.query(Snapshot).all()
         assert len(snapshots) == 1
-        assert len(snapshots[0].dump) == 2
+        assert len(load_dump(snapshots[0], db_session)) == 2
         
         # Verify first snapshot contains original appointment data
-        snapshot_appointments = snapshots[0].dump
+        snapshot_appointments = load_dump(snapshots[0], db_session)
         assert any(appt["id"] == 12345 and appt["datetime"] == "2025-04-25T19:00:00-0600" 
                   for appt in snapshot_appointments)
 
@@ -313,10 +316,10 @@ class TestSnapshot:
         # Verify snapshots
         snapshots = db_session.query(Snapshot).all()
         assert len(snapshots) == 2
-        assert len(snapshots[1].dump) == 3
+        assert len(load_dump(snapshots[1], db_session)) == 3
         
         # Verify second snapshot contains updated appointment data
-        snapshot_appointments = snapshots[1].dump
+        snapshot_appointments = load_dump(snapshots[1], db_session)
         print([(appt['id'], appt['datetime']) for appt in snapshot_appointments])
         assert any(
             appt["id"] == 12345 and \
@@ -343,4 +346,225 @@ class TestSnapshot:
             assert appointment.last_name == appt_data["lastName"]
             assert appointment.start_time == datetime.fromisoformat(appt_data["datetime"]).astimezone(timezone.utc)
             assert appointment.duration == int(appt_data["duration"])
-            assert appointment.is_canceled == appt_data["canceled"]
\ No newline at end of file
+            assert appointment.is_canceled == appt_data["canceled"]
+
+    @freeze_time("2025-04-25T15:30:00-0600")
+    def test_snapshot_covers_the_horizon(self, db_session, test_client, patched_acuity_client):
+        in_three_days = create_appointment_details(0)
+        in_three_days["datetime"] = "2025-04-28T10:00:00-0600"
+        next_month = create_appointment_details(1)
+        next_month["datetime"] = "2025-05-25T10:00:00-0600"
+        canceled_in_acuity = create_appointment_details(2)
+        canceled_in_acuity["datetime"] = "2025-04-30T10:00:00-0600"
+        for appt in (in_three_days, next_month, canceled_in_acuity):
+            db_session.add(acuity_to_appointment(AcuityAppointment(**appt)))
+        db_session.commit()
+        patched_acuity_client.add_appointment(in_three_days)
+        patched_acuity_client.add_appointment(next_month)
+
+        response = test_client.post('/acuity/snapshot', params={"horizon_days": 7})
+
+        assert response.status_code == 200
+        content = response.json()
+        assert (content["from"], content["to"]) == ("2025-04-25", "2025-05-02")
+        assert content["count"] == 1
+        assert content["deleted_count"] == 1
+        remaining = db_session.query(Appointment).order_by(Appointment.acuity_id).all()
+        assert [a.acuity_id for a in remaining] == [12345, 12346]
+
+    def test_writes_run_off_the_event_loop(self, test_client, patched_acuity_client, monkeypatch):
+        import asyncio
+        from app.api.routes import acuity as acuity_routes
+        loops = []
+
+        def recording_save(appointments, db, horizon_days):
+            try:
+                loops.append(asyncio.get_running_loop())
+            except RuntimeError:
+                loops.append(None)
+            return {"count": 0}
+        monkeypatch.setattr(acuity_routes, "save_snapshot", recording_save)
+
+        response = test_client.post('/acuity/snapshot')
+
+        assert response.status_code == 200
+        assert loops == [None]
+
+    @freeze_time("2025-04-25T15:30:00-0600")
+    def test_own_caches_are_evicted(self, db_session):
+        from app.core.cache import appointment_cache, openings_cache
+        openings_cache.set((42677283, settings.calendar_id, "2025-04-25"), ["stale"])
+        openings_cache.set((42677283, settings.calendar_id, "2025-05-25"), ["kept"])
+        appointment_cache.set("12345", {"stale": True})
+
+        save_snapshot([create_appointment_details(0)], db_session)
+
+        # our listener skips our own notification, so the snapshot evicts
+        assert openings_cache.get((42677283, settings.calendar_id, "2025-04-25")) == (False, None)
+        assert openings_cache.get((42677283, settings.calendar_id, "2025-05-25")) == (True, ["kept"])
+        assert appointment_cache.get("12345") == (False, None)
+
+
+class TestBulkSnapshot:
+    @freeze_time("2025-04-25T15:30:00-0600")
+    def test_reports_inserted_updated_and_removed(self, db_session, test_client, patched_acuity_client):
+        db_session.add(acuity_to_appointment(AcuityAppointment(**create_appointment_details(0))))
+        db_session.add(acuity_to_appointment(AcuityAppointment(**create_appointment_details(1))))
+        db_session.commit()
+
+        moved = create_appointment_details(0)
+        moved["datetime"] = "2025-04-25T16:00:00-0600"
+        moved["canceled"] = True
+        patched_acuity_client.add_appointment(moved)
+        patched_acuity_client.add_appointment(create_appointment_details(2))
+
+        content = test_client.post('/acuity/snapshot').json()
+
+        assert (content["inserted"], content["updated"], content["deleted_count"]) == (1, 1, 1)
+        appointments = db_session.query(Appointment).order_by(Appointment.acuity_id).all()
+        assert [a.acuity_id for a in appointments] == [12345, 12347]
+        assert appointments[0].start_time == datetime.fromisoformat(moved["datetime"]).astimezone(timezone.utc)
+        assert appointments[0].is_canceled
+
+    @freeze_time("2025-04-26")
+    def test_statement_count_does_not_grow_with_appointments(self, db_session, patched_acuity_client):
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            if not statement.startswith(("SAVEPOINT", "RELEASE SAVEPOINT")):
+                statements.append(statement)
+
+        appointments = []
+        for i in range(200):
+            appt = create_appointment_details(0)
+            appt["id"] = 20000 + i
+            appointments.append(appt)
+
+        event.listen(db_session.bind, "before_cursor_execute", record)
+        try:
+            content = save_snapshot(appointments, db_session)
+        finally:
+            event.remove(db_session.bind, "before_cursor_execute", record)
+
+        assert content["inserted"] == 200
+        # blobs insert, latest snapshot, snapshot insert, delete, one upsert,
+        # revision bump, invalidation NOTIFY, sync floor and tombstone purge
+        assert len(statements) <= 9, statements
+
+    @freeze_time("2025-04-26")
+    def test_duplicate_ids_in_response(self, db_session, patched_acuity_client):
+        first = create_appointment_details(0)
+        again = create_appointment_details(0)
+        again["canceled"] = True
+
+        content = save_snapshot([first, again], db_session)
+
+        assert content["inserted"] == 1
+        assert db_session.query(Appointment).one().is_canceled
+
+    def test_invalid_appointment_writes_nothing(self, db_session, patched_acuity_client):
+        broken = create_appointment_details(1)
+        del broken["firstName"]
+
+        with pytest.raises(ValueError):
+            save_snapshot([create_appointment_details(0), broken], db_session)
+
+        assert db_session.query(Snapshot).count() == 0
+        assert db_session.query(Appointment).count() == 0
+
+
+class TestSnapshotStorage:
+    @freeze_time("2025-04-26")
+    def test_unchanged_snapshot_is_counted_not_stored(self, db_session, patched_acuity_client):
+        appointments = [create_appointment_details(0), create_appointment_details(1)]
+
+        first = save_snapshot(appointments, db_session)
+        again = save_snapshot(appointments, db_session)
+
+        assert not first["unchanged"]
+        assert again["unchanged"]
+        assert again["snapshot_id"] == first["snapshot_id"]
+        snapshots = db_session.query(Snapshot).all()
+        assert len(snapshots) == 1
+        assert snapshots[0].repeat_count == 2
+
+    @freeze_time("2025-04-26")
+    def test_records_are_shared_across_snapshots(self, db_session, patched_acuity_client):
+        save_snapshot([create_appointment_details(0), create_appointment_details(1)], db_session)
+        save_snapshot([create_appointment_details(0), create_appointment_details(2)], db_session)
+
+        # three distinct records plus two manifests
+        assert db_session.query(SnapshotBlob).count() == 5
+        assert db_session.query(Snapshot).count() == 2
+
+    @freeze_time("2025-04-26")
+    def test_dump_is_reconstructed_exactly(self, db_session, patched_acuity_client):
+        moved = create_appointment_details(0)
+        moved["datetime"] = "2025-04-25T21:00:00-0600"
+        dump = [create_appointment_details(1), create_appointment_details(0), moved]
+
+        snapshot_id = save_snapshot(dump, db_session)["snapshot_id"]
+
+        snapshot = db_session.get(Snapshot, uuid.UUID(snapshot_id))
+        assert load_dump(snapshot, db_session) == dump
+        assert snapshot.count == 3
+
+
+def listing(ids):
+    appointments = []
+    for i in ids:
+        appt = create_appointment_details(0)
+        appt["id"] = 30000 + i
+        appointments.append(appt)
+    return appointments
+
+
+class TestSnapshotDeltas:
+    def test_small_change_is_stored_as_a_delta(self, db_session, patched_acuity_client):
+        with freeze_time("2025-04-26T12:00:00") as frozen:
+            base_id = save_snapshot(listing(range(10)), db_session)["snapshot_id"]
+            frozen.tick()
+            appointments = listing(range(1, 11))
+            appointments[0]["datetime"] = "2025-04-25T21:00:00-0600"
+            delta_id = save_snapshot(appointments, db_session)["snapshot_id"]
+
+        snapshot = db_session.get(Snapshot, uuid.UUID(delta_id))
+        assert str(snapshot.base_id) == base_id
+        # ten records and a manifest, then two new records and a delta
+        assert db_session.query(SnapshotBlob).count() == 14
+        assert sorted(load_dump(snapshot, db_session), key=lambda a: a["id"]) == appointments
+
+    def test_new_base_after_interval(self, db_session, patched_acuity_client, monkeypatch):
+        monkeypatch.setattr(settings, "snapshot_base_interval", 1)
+        with freeze_time("2025-04-26T12:00:00") as frozen:
+            ids = []
+            for last in (10, 11, 12):
+                ids.append(save_snapshot(listing(range(last)), db_session)["snapshot_id"])
+                frozen.tick()
+
+        snapshots = [db_session.get(Snapshot, uuid.UUID(i)) for i in ids]
+        assert [s.base_id is None for s in snapshots] == [True, False, True]
+        assert len(load_dump(snapshots[2], db_session)) == 12
+
+    def test_diff_between_snapshots(self, db_session, test_client, patched_acuity_client):
+        with freeze_time("2025-04-26T12:00:00") as frozen:
+            first = save_snapshot(listing(range(10)), db_session)["snapshot_id"]
+            frozen.tick()
+            appointments = listing(range(1, 11))
+            appointments[0]["datetime"] = "2025-04-25T21:00:00-0600"
+            appointments[0]["canceled"] = True
+            second = save_snapshot(appointments, db_session)["snapshot_id"]
+
+        response = test_client.get('/snapshots/diff', params={"from": first, "to": second})
+
+        assert response.status_code == 200
+        diff = response.json()
+        assert diff["added"] == [30010]
+        assert diff["removed"] == [30000]
+        assert diff["changed"] == {"30001": ["canceled", "datetime"]}
+
+    def test_diff_of_unknown_snapshot(self, test_client):
+        response = test_client.get(
+            '/snapshots/diff', params={"from": str(uuid.uuid4()), "to": str(uuid.uuid4())}
+        )
+        assert response.status_code == 404
@@ -5,8 +5,12 @@ from app.config import settings
 from app.models import Event, EventAction, Appointment
 from app.core.time_utils import isToday
 import json
-from sqlalchemy import select
+from sqlalchemy import delete, event as sa_event, select, update
+from sqlalchemy.exc import NoResultFound
 import uuid
+from app.core.apptActions import handle_cancel
+from app.core.resilience import acuity_circuit_breaker
+from app.core.webhook_processing import deferred_notifications
 
 class TestIsToday:
     @freeze_time("2025-04-25T23:00:00-0600")
@@ -377,4 +381,210 @@ class TestWebhooks:
         assert datetime.strptime(event_data['old_time'], '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc) == datetime.fromisoformat("2025-04-25T14:00:00-0600").astimezone(timezone.utc)
         assert datetime.strptime(event_data['new_time'], '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc) == datetime.fromisoformat("2025-04-26T16:00:00-0600").astimezone(timezone.utc)
 
-       
\ No newline at end of file
+       
+    def test_deferred_while_acuity_circuit_open(self, db_session, test_client, patched_acuity_client):
+        for _ in range(acuity_circuit_breaker.failure_threshold):
+            acuity_circuit_breaker.record_failure()
+
+        response = test_client.post('/webhook/appt-changed',
+                         data={
+                             'action': 'rescheduled',
+                             'id': '12345',
+                             'calendarID': settings.calendar_id
+                         })
+
+        content = response.json()
+        assert response.status_code == 200
+        assert content['status'] == 'deferred'
+        assert len(deferred_notifications) == 1
+        assert patched_acuity_client.appointment_calls == 0
+
+        health = test_client.get('/healthcheck').json()
+        assert health['acuity_circuit']['state'] == 'open'
+        assert health['webhooks']['deferred'] == 1
+
+
+class TestWebhookDedup:
+    @pytest.fixture
+    def existing_appt(self, db_session, patched_acuity_client):
+        appt = Appointment(
+            acuity_id=12345,
+            first_name="John",
+            last_name="Doe",
+            start_time=datetime.fromisoformat("2025-04-25T14:00:00-0600").astimezone(timezone.utc),
+            acuity_created_at=datetime.fromisoformat("2025-04-24T14:00:00-0600"),
+            duration=60,
+            is_canceled=False
+        )
+        db_session.add(appt)
+        db_session.commit()
+        patched_acuity_client.add_appointment({
+            "id": 12345,
+            "firstName": "John",
+            "lastName": "Doe",
+            "datetime": "2025-04-25T17:00:00-0600",
+            "duration": "60",
+            "canceled": False
+        })
+        return appt
+
+    def post(self, test_client, action):
+        return test_client.post('/webhook/appt-changed',
+                                data={
+                                    'action': action,
+                                    'id': '12345',
+                                    'calendarID': settings.calendar_id
+                                }).json()
+
+    @freeze_time("2025-04-25T16:00:00-0600")
+    def test_redelivery_is_skipped(self, db_session, test_client, existing_appt):
+        assert self.post(test_client, 'rescheduled')['status'] == 'success'
+        assert self.post(test_client, 'rescheduled')['status'] == 'duplicate'
+
+        assert len(db_session.scalars(select(Event)).all()) == 1
+
+    @freeze_time("2025-04-25T16:00:00-0600")
+    def test_changed_after_rescheduled_is_skipped(self, db_session, test_client, existing_appt):
+        assert self.post(test_client, 'rescheduled')['status'] == 'success'
+        assert self.post(test_client, 'changed')['status'] == 'duplicate'
+
+        assert len(db_session.scalars(select(Event)).all()) == 1
+
+    @freeze_time("2025-04-25T16:00:00-0600")
+    def test_real_change_after_duplicate_is_applied(self, db_session, test_client, existing_appt, patched_acuity_client):
+        self.post(test_client, 'rescheduled')
+        patched_acuity_client.appointments[0]["canceled"] = True
+
+        assert self.post(test_client, 'canceled')['status'] == 'success'
+        actions = [event.action for event in db_session.scalars(select(Event).order_by(Event.action))]
+        assert actions == [EventAction.reschedule_same_day, EventAction.cancel]
+
+    @freeze_time("2025-04-25T16:00:00-0600")
+    def test_change_back_after_snapshot_is_applied(self, db_session, test_client, existing_appt):
+        self.post(test_client, 'rescheduled')
+        # a snapshot catches up on a change whose webhook we missed...
+        db_session.execute(
+            update(Appointment)
+            .where(Appointment.acuity_id == 12345)
+            .values(start_time=datetime.fromisoformat("2025-04-25T15:00:00-0600"))
+        )
+        db_session.commit()
+
+        # ...then the appointment moves back to where the last webhook left it
+        assert self.post(test_client, 'rescheduled')['status'] == 'success'
+        assert len(db_session.scalars(select(Event)).all()) == 2
+
+    @freeze_time("2025-04-25T16:00:00-0600")
+    def test_duplicate_releases_its_locks(self, db_session, test_client, existing_appt, monkeypatch):
+        self.post(test_client, 'rescheduled')
+        rollback = db_session.rollback
+        rollbacks = []
+        monkeypatch.setattr(db_session, "rollback", lambda: rollbacks.append(1) or rollback())
+
+        assert self.post(test_client, 'rescheduled')['status'] == 'duplicate'
+        # the locks go with the transaction, not whenever the session closes
+        assert rollbacks == [1]
+
+    @freeze_time("2025-04-25T16:00:00-0600")
+    def test_change_to_unstored_fields_writes_nothing(self, db_session, test_client, existing_appt, patched_acuity_client):
+        self.post(test_client, 'rescheduled')
+        patched_acuity_client.appointments[0]["lastName"] = "Smith"
+        patched_acuity_client.appointments[0]["duration"] = "90"
+
+        for _ in range(3):
+            assert self.post(test_client, 'changed')['status'] == 'duplicate'
+        assert len(db_session.scalars(select(Event)).all()) == 1
+
+
+@pytest.fixture
+def statements(db_session):
+    """SQL statements the code under test sends, minus the test's own savepoints"""
+    sent = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if not statement.startswith(("SAVEPOINT", "RELEASE SAVEPOINT", "ROLLBACK TO SAVEPOINT")):
+            sent.append(statement)
+
+    sa_event.listen(db_session.bind, "before_cursor_execute", record)
+    yield sent
+    sa_event.remove(db_session.bind, "before_cursor_execute", record)
+
+
+class TestWebhookRoundTrips:
+    @freeze_time("2025-04-25T16:00:00-0600")
+    def test_reschedule_round_trip_budget(self, db_session, test_client, patched_acuity_client, statements):
+        appt_id = uuid.uuid4()
+        db_session.add(Appointment(
+            id=appt_id,
+            acuity_id=12345,
+            first_name="John",
+            last_name="Doe",
+            start_time=datetime.fromisoformat("2025-04-25T14:00:00-0600"),
+            acuity_created_at=datetime.fromisoformat("2025-04-24T14:00:00-0600"),
+            duration=60,
+            is_canceled=False
+        ))
+        db_session.commit()
+        patched_acuity_client.add_appointment({
+            "id": 12345,
+            "firstName": "John",
+            "lastName": "Doe",
+            "datetime": "2025-04-25T17:00:00-0600",
+            "duration": "60",
+            "canceled": False
+        })
+        statements.clear()
+
+        response = test_client.post('/webhook/appt-changed',
+                         data={
+                             'action': 'rescheduled',
+                             'id': '12345',
+                             'calendarID': settings.calendar_id
+                         })
+
+        assert response.json()['status'] == 'success'
+        # lock, row lock, UPDATE ... RETURNING, event and hourly diff
+        # INSERTs, invalidation NOTIFY, revision bump; no refresh SELECTs,
+        # and no diff rows without live clients
+        assert len(statements) <= 7, statements
+        assert not any(s.lstrip().startswith("SELECT appointments.") and "FOR UPDATE" not in s for s in statements)
+
+    def test_change_to_a_vanished_appointment_writes_no_event(self, db_session):
+        appt = Appointment(
+            acuity_id=12345,
+            first_name="John",
+            last_name="Doe",
+            start_time=datetime.fromisoformat("2025-04-25T14:00:00-0600"),
+            acuity_created_at=datetime.fromisoformat("2025-04-24T14:00:00-0600"),
+            duration=60,
+        )
+        db_session.add(appt)
+        db_session.commit()
+        db_session.execute(delete(Appointment).where(Appointment.id == appt.id))
+
+        with pytest.raises(NoResultFound):
+            handle_cancel(appt, db_session)
+
+
+class TestScheduleRevisions:
+    @freeze_time("2025-04-25T15:30:00-06:00")
+    def test_webhook_moves_the_schedule_to_a_new_revision(self, db_session, test_client, patched_acuity_client, appointment_details):
+        patched_acuity_client.add_appointment(appointment_details)
+        schedule_etag = test_client.get('/schedule').headers['ETag']
+        diff_etag = test_client.get('/schedule/diff').headers['ETag']
+
+        response = test_client.post('/webhook/appt-changed', data={
+            'action': 'scheduled',
+            'id': '12345',
+            'calendarID': settings.calendar_id,
+        })
+        assert response.json()['status'] == 'success'
+
+        schedule = test_client.get('/schedule', headers={'If-None-Match': schedule_etag})
+        assert schedule.status_code == 200
+        assert schedule.headers['ETag'] != schedule_etag
+        assert [appt['acuity_id'] for appt in schedule.json()] == [12345]
+
+        diff = test_client.get('/schedule/diff', headers={'If-None-Match': diff_etag})
+        assert diff.status_code == 200
+        assert diff.headers['ETag'] != diff_etag